@@ -12,8 +12,16 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from app.routes import api_keys, papers, scripts, slides, media, images, auth, reels, podcasts, posters, chatbot, audio, summaries, mindmaps
+from app.routes import api_keys, papers, scripts, slides, media, images, auth, reels, podcasts, posters, chatbot, audio, summaries, mindmaps, artifacts, library
 from app.auth.google_auth import get_current_user, get_current_user_optional
+from app.services.metrics import metrics
+from app.services.llm_cache import llm_cache, llm_cache_bypass, BYPASS_HEADER, BYPASS_VALUE
+from app.services import structured_output
+from app.services.conversation_store import conversation_store, start_conversation_sweeps
+from app.services.context_builder import context_cache
+from app.services.paper_retrieval import paper_index_cache
+from app.services.prompt_prefix import prompt_prefixes
+from app.services.library_index import library_index, start_library_sync
 
 # Create temp directories
 temp_dirs = [
@@ -61,6 +69,16 @@ async def log_requests(request: Request, call_next):
     logger.info(f"Response: {response.status_code}")
     return response
 
+# Let a request skip cached LLM responses with "X-LLM-Cache: bypass"
+@app.middleware("http")
+async def llm_cache_bypass_flag(request: Request, call_next):
+    bypass = request.headers.get(BYPASS_HEADER, "").lower() == BYPASS_VALUE
+    token = llm_cache_bypass.set(bypass)
+    try:
+        return await call_next(request)
+    finally:
+        llm_cache_bypass.reset(token)
+
 # Custom exception handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
@@ -105,6 +123,18 @@ app.include_router(chatbot.router, prefix="/api/chatbot", tags=["AI Chatbot"])
 app.include_router(audio.router, prefix="/api/audio", tags=["Audio Summary"])
 app.include_router(summaries.router, prefix="/api/summaries", tags=["Text Summaries"])
 app.include_router(mindmaps.router, prefix="/api/mindmaps", tags=["Mind Maps"])
+app.include_router(artifacts.router, prefix="/api/artifacts", tags=["Artifacts"])
+app.include_router(library.router, prefix="/api/library", tags=["Library"])
+
+@app.on_event("startup")
+async def sync_library_index():
+    """Index stored papers for library search in the background"""
+    start_library_sync()
+
+@app.on_event("startup")
+async def sweep_conversations():
+    """Delete expired chat histories at startup and periodically"""
+    start_conversation_sweeps()
 
 # Public endpoints
 @app.get("/")
@@ -122,6 +152,20 @@ async def health_check():
     """Public health check endpoint"""
     return {"status": "healthy", "api_version": "1.0.0"}
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Public performance metrics endpoint (counters, timings, cache hit rates, JSON failure rates and memory bounds)"""
+    return {
+        **metrics.snapshot(),
+        "llm_cache": llm_cache.stats(),
+        "llm_json": structured_output.stats(),
+        "paper_context_cache": context_cache.stats(),
+        "paper_index_cache": paper_index_cache.stats(),
+        "conversations": conversation_store.stats(),
+        "prompt_prefixes": prompt_prefixes.stats(),
+        "library_index": library_index.stats(),
+    }
+
 # Protected endpoints example
 @app.get("/api/user/profile")
 async def get_user_profile(current_user: dict = Depends(get_current_user)):
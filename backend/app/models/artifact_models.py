@@ -0,0 +1,50 @@
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+
+# Schemas for the JSON artifacts generated by Gemini; responses are
+# validated against these before they are used
+
+class ReelSlide(BaseModel):
+    title: str
+    points: List[str] = Field(min_length=1)
+    duration: float = Field(gt=0)
+
+class ReelSummary(BaseModel):
+    slides: List[ReelSlide] = Field(min_length=1)
+    narration: str = Field(min_length=1)
+
+class MindMapNode(BaseModel):
+    id: str
+    label: str
+    children: List["MindMapNode"] = []
+
+class MindMap(BaseModel):
+    nodes: List[MindMapNode] = Field(min_length=1)
+
+class PosterContent(BaseModel):
+    title: str
+    subtitle: str = ""
+    key_findings: List[str] = Field(min_length=1)
+    main_text: str
+    methodology: str
+    conclusion: str
+
+class PodcastTurn(BaseModel):
+    speaker: int = Field(ge=1, le=2)
+    text: str = Field(min_length=1)
+
+class PodcastScript(BaseModel):
+    title: str
+    description: str = ""
+    duration_minutes: Optional[int] = None
+    dialogue: List[PodcastTurn] = Field(min_length=2)
+
+class QuizItem(BaseModel):
+    question: str = Field(min_length=1)
+    options: List[str] = Field(min_length=4, max_length=4)
+    correct_answer: Literal["A", "B", "C", "D"]
+    explanation: str = ""
+
+class StudyAids(BaseModel):
+    quiz: List[QuizItem] = Field(min_length=1)
+    suggested_questions: List[str] = Field(min_length=1)
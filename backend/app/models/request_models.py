@@ -9,6 +9,9 @@ class APIKeysRequest(BaseModel):
 class ArxivRequest(BaseModel):
     arxiv_url: str
 
+class BulkArxivRequest(BaseModel):
+    arxiv_ids: List[str]  # arXiv IDs or abs/pdf URLs
+
 class PaperMetadata(BaseModel):
     title: str
     authors: str
@@ -54,6 +57,7 @@ class PaperResponse(BaseModel):
     image_files: List[str]
     tex_file_path: str
     status: str
+    images_status: Optional[str] = None
 
 class ScriptResponse(BaseModel):
     sections_scripts: Dict[str, str]
@@ -3,6 +3,8 @@ from dotenv import load_dotenv
 import os
 from app.auth.dependencies import get_current_user
 from app.models.request_models import APIKeysRequest
+from app.services.llm_service import agenerate_text
+from app.services.gemini_key_pool import gemini_key_pool, discover_env_keys, ensure_pool_keys
 
 router = APIRouter()
 
@@ -21,10 +23,9 @@ async def setup_api_keys(request: APIKeysRequest):
     gemini_key = (request.gemini_key or "").strip() or os.getenv("GEMINI_API_KEY")
     if gemini_key:
         try:
-            import google.generativeai as genai
-            genai.configure(api_key=gemini_key)
-            model = genai.GenerativeModel('gemini-2.0-flash')
-            model.generate_content("Hello")
+            await agenerate_text(
+                "Hello", gemini_key, 'gemini-2.0-flash', call_site="api_keys.validate", use_cache=False, timeout=30
+            )
             api_keys_storage["gemini_key"] = gemini_key
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid Gemini API key: {str(e)}")
@@ -45,6 +46,12 @@ async def setup_api_keys(request: APIKeysRequest):
 
     return {"message": "API keys configured successfully"}
 
+@router.get("/usage")
+async def get_api_key_usage():
+    """Per-key request, error and rate-limit counters for the server Gemini keys."""
+    ensure_pool_keys()
+    return gemini_key_pool.usage()
+
 @router.get("/status")
 async def get_api_keys_status():
     """Get status of configured API keys."""
@@ -64,26 +71,16 @@ def get_api_keys():
 
     # If Gemini key already in storage, use it
     if "gemini_key" in api_keys_storage and api_keys_storage["gemini_key"]:
+        ensure_pool_keys()
         return api_keys_storage
 
     # Handle multiple Gemini keys: GEMINI_API_KEY_1, GEMINI_API_KEY_2, ...
-    gemini_keys = []
-    i = 1
-    while True:
-        key = os.getenv(f"GEMINI_API_KEY_{i}")
-        if key:
-            gemini_keys.append(key)
-            i += 1
-        else:
-            break
-    # Fallback to GEMINI_API_KEY if no numbered keys found
-    if not gemini_keys:
-        key = os.getenv("GEMINI_API_KEY")
-        if key:
-            gemini_keys.append(key)
-
-    # If we have any Gemini keys, use the first one without validation
+    gemini_keys = discover_env_keys()
+
+    # Server keys are pooled: any of them stands for the whole pool, and
+    # each call is sent with whichever key is least loaded
     if gemini_keys:
+        gemini_key_pool.set_keys(gemini_keys)
         api_keys_storage["gemini_key"] = gemini_keys[0]
         return api_keys_storage
 
@@ -0,0 +1,199 @@
+"""
+Artifact Generation Routes
+Generates several artifacts for a paper in one request, concurrently,
+streaming each result as it completes
+"""
+
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+import os
+import time
+import asyncio
+import logging
+
+from app.routes.api_keys import get_api_keys
+from app.routes.papers import papers_storage
+from app.routes.summaries import _generate_summary_with_gemini, save_summary
+from app.routes.mindmaps import _generate_mindmap_with_gemini, save_mindmap
+from app.routes.posters import build_poster
+from app.services.poster_generator import generate_poster_content
+from app.services.podcast_generator import generate_podcast_script
+from app.services.study_aids import get_study_aids
+from app.services.chatbot_service import STUDY_AIDS_QUIZ_QUESTIONS
+from app.services.storage_manager import storage_manager
+from app.services.paper_text import get_paper_text
+from app.services.context_builder import build_paper_context
+from app.services.streaming import sse_event, SSE_MEDIA_TYPE, SSE_HEADERS
+from app.services.metrics import metrics
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Generators running at once per request (each makes one LLM call; the key
+# pool spreads them over the configured keys)
+GENERATE_ALL_CONCURRENCY = int(os.getenv("GENERATE_ALL_CONCURRENCY", 4))
+
+ARTIFACT_TYPES = ["summary", "mindmap", "poster", "podcast_script", "quiz"]
+
+
+class GenerateAllRequest(BaseModel):
+    artifacts: Optional[List[str]] = None  # Default: all of ARTIFACT_TYPES
+    summary_type: str = "comprehensive"
+    poster_language: str = "en"
+    podcast_language: str = "en-IN"
+    podcast_duration_minutes: int = 5
+    num_questions: int = Field(5, ge=1, le=STUDY_AIDS_QUIZ_QUESTIONS)
+
+
+async def _summary(paper_id: str, paper_info: Dict, gemini_key: str,
+                   request: GenerateAllRequest) -> Dict:
+    paper_text = await run_in_threadpool(build_paper_context, paper_info, "summary")
+    summary = await _generate_summary_with_gemini(paper_text, gemini_key, request.summary_type)
+    save_summary(paper_id, summary, request.summary_type)
+    return {"summary": summary, "summary_type": request.summary_type, "word_count": len(summary.split())}
+
+
+async def _mindmap(paper_id: str, paper_info: Dict, gemini_key: str,
+                   request: GenerateAllRequest) -> Dict:
+    paper_text = await run_in_threadpool(build_paper_context, paper_info, "mindmap")
+    mindmap_data = await _generate_mindmap_with_gemini(paper_text, gemini_key)
+    save_mindmap(paper_id, mindmap_data)
+    return {"mindmap_data": mindmap_data}
+
+
+async def _poster(paper_id: str, paper_info: Dict, gemini_key: str,
+                  request: GenerateAllRequest) -> Dict:
+    paper_text = await run_in_threadpool(build_paper_context, paper_info, "poster")
+    content = await generate_poster_content(paper_text, gemini_key, request.poster_language)
+    images = await build_poster(paper_id, paper_info, content, request.poster_language)
+    return {
+        "title": content.get("title", "Research Poster"),
+        "num_images": len(images),
+        "language": request.poster_language,
+        "poster_url": f"/api/posters/{paper_id}/view",
+        "download_url": f"/api/posters/{paper_id}/download"
+    }
+
+
+async def _podcast_script(paper_id: str, paper_info: Dict, gemini_key: str,
+                          request: GenerateAllRequest) -> Dict:
+    paper_text = await run_in_threadpool(build_paper_context, paper_info, "podcast")
+    # Script only; /api/podcasts/{id}/generate voices it (and reuses the
+    # cached LLM response for the same settings)
+    return await generate_podcast_script(
+        paper_text,
+        gemini_key,
+        request.podcast_duration_minutes,
+        request.podcast_language
+    )
+
+
+async def _quiz(paper_id: str, paper_info: Dict, gemini_key: str,
+                request: GenerateAllRequest) -> Dict:
+    study_aids = await get_study_aids(paper_id, paper_info)
+    return {"questions": study_aids["quiz"][:request.num_questions]}
+
+
+GENERATORS = {
+    "summary": _summary,
+    "mindmap": _mindmap,
+    "poster": _poster,
+    "podcast_script": _podcast_script,
+    "quiz": _quiz,
+}
+
+
+@router.post("/{paper_id}/generate-all")
+async def generate_all_artifacts(
+    paper_id: str,
+    request: GenerateAllRequest = GenerateAllRequest(),
+    api_keys: dict = Depends(get_api_keys)
+):
+    """
+    Generate several artifacts for a paper concurrently.
+
+    The paper text is loaded once; each generator then takes the excerpt
+    that fits its own token budget (see context_builder). The response is
+    a server-sent event stream: one "artifact" event per artifact as soon
+    as it finishes (or fails), then a "complete" event with per-artifact
+    timings.
+
+    Args:
+        paper_id: The paper ID
+        request: Artifacts to generate and their options
+        api_keys: API keys from dependency
+
+    Returns:
+        StreamingResponse of server-sent events
+    """
+    paper_info = storage_manager.get_paper(paper_id)
+    if not paper_info:
+        if paper_id not in papers_storage:
+            raise HTTPException(status_code=404, detail="Paper not found")
+        paper_info = papers_storage[paper_id]
+
+    if not api_keys.get("gemini_key"):
+        raise HTTPException(status_code=400, detail="Gemini API key required")
+
+    artifacts = list(dict.fromkeys(request.artifacts or ARTIFACT_TYPES))
+    unknown = [name for name in artifacts if name not in GENERATORS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown artifacts: {', '.join(unknown)}. Choose from: {', '.join(ARTIFACT_TYPES)}"
+        )
+
+    try:
+        await run_in_threadpool(get_paper_text, paper_info)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Paper text file not found")
+
+    gemini_key = api_keys["gemini_key"]
+    semaphore = asyncio.Semaphore(GENERATE_ALL_CONCURRENCY)
+
+    async def run_generator(name: str) -> Dict:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await GENERATORS[name](paper_id, paper_info, gemini_key, request)
+                status = "done"
+                error = None
+            except Exception as e:
+                logger.error(f"Error generating {name} for paper {paper_id}: {str(e)}")
+                result = None
+                status = "failed"
+                error = str(e)
+            seconds = round(time.perf_counter() - start, 3)
+            metrics.observe(f"generate_all.{name}.seconds", seconds)
+            return {"artifact": name, "status": status, "seconds": seconds, "result": result, "error": error}
+
+    async def event_stream():
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(run_generator(name)) for name in artifacts]
+        timings = {}
+        failed = []
+        try:
+            yield sse_event("started", {"paper_id": paper_id, "artifacts": artifacts})
+            for next_done in asyncio.as_completed(tasks):
+                event = await next_done
+                timings[event["artifact"]] = event["seconds"]
+                if event["status"] == "failed":
+                    failed.append(event["artifact"])
+                yield sse_event("artifact", event)
+            total = round(time.perf_counter() - start, 3)
+            metrics.observe("generate_all.total_seconds", total)
+            yield sse_event("complete", {
+                "paper_id": paper_id,
+                "timings": timings,
+                "failed": failed,
+                "total_seconds": total
+            })
+        finally:
+            # Client went away: stop the generators that have not finished
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(event_stream(), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
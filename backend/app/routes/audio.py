@@ -4,6 +4,7 @@ Audio Summary Generation Routes
 
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
 import os
 import logging
@@ -15,28 +16,25 @@ from app.services.tts_service import generate_audio_sarvam
 from app.routes.api_keys import get_api_keys
 from app.routes.papers import papers_storage
 from app.services.storage_manager import storage_manager
-from app.services.script_generator import extract_text_from_file
-import google.generativeai as genai
+from app.services.context_builder import build_paper_context
+from app.services.llm_service import agenerate_text
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
-def generate_summary_from_paper(paper_text: str, gemini_key: str) -> str:
+async def generate_summary_from_paper(paper_text: str, gemini_key: str) -> str:
     """
     Generate a concise summary from paper text using Gemini.
     
     Args:
-        paper_text: Full paper text
+        paper_text: Paper text, already fitted to the task budget (see context_builder)
         gemini_key: Gemini API key
         
     Returns:
         Summary text
     """
     try:
-        genai.configure(api_key=gemini_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
         prompt = f"""You are a research paper summarizer. Generate a clear, concise summary of this research paper.
 
 The summary should be:
@@ -47,12 +45,11 @@ The summary should be:
 - Avoid technical jargon where possible
 
 Paper text:
-{paper_text[:15000]}
+{paper_text}
 
 Generate a well-structured summary that can be easily understood when heard as audio."""
 
-        response = model.generate_content(prompt)
-        summary = response.text.strip()
+        summary = (await agenerate_text(prompt, gemini_key, 'gemini-2.5-flash', call_site="audio.summary")).strip()
         
         logger.info(f"Generated summary: {len(summary)} characters")
         return summary
@@ -95,22 +92,14 @@ async def generate_audio_summary(
         
         # Extract paper text
         logger.info(f"Extracting text from paper {paper_id}")
-        source_type = paper_info.get("source_type", "pdf")
-        if source_type == "pdf":
-            pdf_path = paper_info.get("pdf_path")
-            if not pdf_path or not os.path.exists(pdf_path):
-                raise HTTPException(status_code=404, detail="PDF file not found")
-            paper_text = extract_text_from_file(pdf_path)
-        else:
-            tex_path = paper_info.get("tex_file_path")
-            if not tex_path or not os.path.exists(tex_path):
-                raise HTTPException(status_code=404, detail="Paper text file not found")
-            with open(tex_path, 'r', encoding='utf-8') as f:
-                paper_text = f.read()
+        try:
+            paper_text = await run_in_threadpool(build_paper_context, paper_info, "audio_summary")
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Paper text file not found")
         
         # Generate summary using Gemini
         logger.info(f"Generating summary for paper {paper_id}")
-        summary = generate_summary_from_paper(paper_text, api_keys["gemini_key"])
+        summary = await generate_summary_from_paper(paper_text, api_keys["gemini_key"])
         
         # Create output directory
         output_dir = Path(f"temp/audio/{paper_id}")
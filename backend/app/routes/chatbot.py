@@ -1,8 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Cookie, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Tuple
+import asyncio
 import logging
-from app.services.chatbot_service import chatbot_service
+import time
+import uuid
+from contextlib import aclosing
+from app.services.chatbot_service import chatbot_service, STUDY_AIDS_QUIZ_QUESTIONS
+from app.services import study_aids
+from app.services.conversation_store import get_conversation_owner, CONVERSATION_RETENTION_SECONDS
+from app.services.session_manager import session_manager
+from app.auth.dependencies import get_current_user_optional
+from app.services.streaming import sse_event, SSE_MEDIA_TYPE, SSE_HEADERS
+from app.services.metrics import metrics
 from app.routes.papers import papers_storage
 from app.services.storage_manager import storage_manager
 
@@ -10,6 +21,44 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Running chat streams by stream id: (owner, event); setting the event
+# stops the stream
+active_chat_streams: Dict[str, Tuple[str, asyncio.Event]] = {}
+
+
+# Where a client gets (and sends back) its chat session id
+SESSION_HEADER = "X-Session-Id"
+SESSION_COOKIE = "session_id"
+
+
+def _issue_session(response: Response, session_id: str) -> None:
+    """Send a new session id to the client in the header and a cookie."""
+    response.headers[SESSION_HEADER] = session_id
+    response.set_cookie(SESSION_COOKIE, session_id, max_age=CONVERSATION_RETENTION_SECONDS,
+                        httponly=True, samesite="lax")
+
+
+async def get_chat_owner(
+    response: Response,
+    current_user: Optional[dict] = Depends(get_current_user_optional),
+    x_session_id: Optional[str] = Header(None),
+    session_id: Optional[str] = Cookie(None)
+) -> str:
+    """
+    Owner of the conversation: the signed-in user, else the client session.
+    
+    A client with neither gets a new session id in the X-Session-Id header
+    and the session_id cookie, and keeps its history by sending it back.
+    """
+    if current_user and current_user.get("id"):
+        return get_conversation_owner(current_user)
+    client_session = x_session_id or session_id
+    if not client_session:
+        client_session = session_manager.create_session()
+        _issue_session(response, client_session)
+        metrics.increment("chatbot.sessions_issued")
+    return get_conversation_owner(None, client_session)
+
 
 class ChatMessage(BaseModel):
     """Model for chat messages."""
@@ -20,11 +69,14 @@ class ChatResponse(BaseModel):
     """Model for chat responses."""
     response: str
     paper_id: str
+    citations: List[Dict] = []
 
 
 class QuizRequest(BaseModel):
     """Model for quiz generation request."""
-    num_questions: Optional[int] = 5
+    # Served from the stored quiz, which has STUDY_AIDS_QUIZ_QUESTIONS questions
+    num_questions: Optional[int] = Field(5, ge=1, le=STUDY_AIDS_QUIZ_QUESTIONS)
+    regenerate: Optional[bool] = False
 
 
 class QuizQuestion(BaseModel):
@@ -41,13 +93,14 @@ class SuggestedQuestions(BaseModel):
 
 
 @router.post("/{paper_id}/chat", response_model=ChatResponse)
-async def chat_with_paper(paper_id: str, message: ChatMessage):
+async def chat_with_paper(paper_id: str, message: ChatMessage, owner: str = Depends(get_chat_owner)):
     """
     Chat with the AI about a specific paper.
     
     Args:
         paper_id: Unique identifier for the paper
         message: User's message/question
+        owner: Conversation owner (user or session) from dependency
         
     Returns:
         AI's response
@@ -62,13 +115,17 @@ async def chat_with_paper(paper_id: str, message: ChatMessage):
             paper_info = papers_storage[paper_id]
         
         # Get chatbot response
-        response = chatbot_service.chat(
+        response = await chatbot_service.chat(
             paper_id=paper_id,
             user_message=message.message,
-            paper_info=paper_info
+            paper_info=paper_info,
+            owner=owner
         )
         
-        return ChatResponse(response=response, paper_id=paper_id)
+        # Passages the answer cites, as [c4] in the response text
+        citations = chatbot_service.get_citations(paper_info, response)
+        
+        return ChatResponse(response=response, paper_id=paper_id, citations=citations)
         
     except HTTPException:
         raise
@@ -77,14 +134,139 @@ async def chat_with_paper(paper_id: str, message: ChatMessage):
         raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
 
 
+@router.post("/{paper_id}/chat/stream")
+async def chat_with_paper_stream(paper_id: str, message: ChatMessage, response: Response,
+                                 owner: str = Depends(get_chat_owner)):
+    """
+    Chat with the AI about a specific paper, streaming the answer.
+    
+    Server-sent events: "started" (with the stream_id used to cancel),
+    "token" for each chunk of the answer as Gemini produces it, then
+    "complete" with the full response and its citations, "cancelled" with
+    the partial response, or "error". The exchange is added to the
+    conversation history only on "complete"; a client that disconnects
+    stops the Gemini call.
+    
+    Args:
+        paper_id: Unique identifier for the paper
+        message: User's message/question
+        response: Response headers set by dependencies (a new session id)
+        owner: Conversation owner (user or session) from dependency
+        
+    Returns:
+        StreamingResponse of server-sent events
+    """
+    # Get paper info from storage
+    paper_info = storage_manager.get_paper(paper_id)
+    if not paper_info:
+        # Fall back to in-memory storage
+        if paper_id not in papers_storage:
+            raise HTTPException(status_code=404, detail="Paper not found")
+        paper_info = papers_storage[paper_id]
+    
+    stream_id = uuid.uuid4().hex
+    cancelled = asyncio.Event()
+    active_chat_streams[stream_id] = (owner, cancelled)
+    
+    async def event_stream():
+        start = time.perf_counter()
+        parts: List[str] = []
+        stopped = False
+        try:
+            yield sse_event("started", {"paper_id": paper_id, "stream_id": stream_id})
+            cancel_wait = asyncio.ensure_future(cancelled.wait())
+            next_chunk = None
+            try:
+                async with aclosing(chatbot_service.stream_chat(paper_id, message.message, paper_info, owner)) as chunks:
+                    try:
+                        while True:
+                            # A cancel request does not wait for the next chunk
+                            next_chunk = asyncio.ensure_future(chunks.__anext__())
+                            await asyncio.wait({next_chunk, cancel_wait}, return_when=asyncio.FIRST_COMPLETED)
+                            if not next_chunk.done():
+                                stopped = True
+                                break
+                            try:
+                                chunk = next_chunk.result()
+                            except StopAsyncIteration:
+                                break
+                            if not parts:
+                                metrics.observe("chatbot.stream_first_token_seconds", time.perf_counter() - start)
+                            parts.append(chunk)
+                            yield sse_event("token", {"text": chunk})
+                    finally:
+                        # Stop the pending read before the stream is closed
+                        if next_chunk is not None and not next_chunk.done():
+                            next_chunk.cancel()
+                            await asyncio.gather(next_chunk, return_exceptions=True)
+            finally:
+                cancel_wait.cancel()
+            
+            response = "".join(parts)
+            if stopped:
+                metrics.increment("chatbot.streams_cancelled")
+                yield sse_event("cancelled", {"paper_id": paper_id, "response": response})
+                return
+            
+            metrics.observe("chatbot.stream_total_seconds", time.perf_counter() - start)
+            yield sse_event("complete", {
+                "paper_id": paper_id,
+                "response": response,
+                "citations": chatbot_service.get_citations(paper_info, response)
+            })
+        except asyncio.CancelledError:
+            # Client disconnected; aclosing has already stopped the Gemini call
+            metrics.increment("chatbot.streams_disconnected")
+            raise
+        except Exception as e:
+            logger.error(f"Error in chat stream: {str(e)}")
+            yield sse_event("error", {"detail": f"Error processing chat: {str(e)}"})
+        finally:
+            active_chat_streams.pop(stream_id, None)
+    
+    streaming_response = StreamingResponse(event_stream(), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+    # A returned response does not get the dependency's headers; copy the issued session
+    issued_session = response.headers.get(SESSION_HEADER)
+    if issued_session:
+        _issue_session(streaming_response, issued_session)
+    return streaming_response
+
+
+@router.post("/{paper_id}/chat/stream/{stream_id}/cancel")
+async def cancel_chat_stream(paper_id: str, stream_id: str, owner: str = Depends(get_chat_owner)):
+    """
+    Stop a running chat stream.
+    
+    The stream ends with a "cancelled" event without waiting for the next
+    chunk, and the exchange is not added to the conversation history.
+    
+    Args:
+        paper_id: Unique identifier for the paper
+        stream_id: Stream id from the stream's "started" event
+        owner: Conversation owner (user or session) from dependency
+        
+    Returns:
+        Success message
+    """
+    stream = active_chat_streams.get(stream_id)
+    # Only the stream's own user or session may stop it
+    if stream is None or stream[0] != owner:
+        raise HTTPException(status_code=404, detail="Chat stream not found or already finished")
+    stream[1].set()
+    return {"message": "Chat stream cancelled", "paper_id": paper_id, "stream_id": stream_id}
+
+
 @router.post("/{paper_id}/generate-quiz")
 async def generate_quiz(paper_id: str, request: QuizRequest):
     """
-    Generate quiz questions to test understanding of the paper.
+    Get quiz questions to test understanding of the paper.
+    
+    Questions are generated once after ingest and served from storage;
+    set regenerate to get new ones.
     
     Args:
         paper_id: Unique identifier for the paper
-        request: Quiz generation parameters
+        request: Quiz parameters
         
     Returns:
         List of quiz questions with answers
@@ -98,12 +280,9 @@ async def generate_quiz(paper_id: str, request: QuizRequest):
                 raise HTTPException(status_code=404, detail="Paper not found")
             paper_info = papers_storage[paper_id]
         
-        # Generate quiz questions
-        questions = chatbot_service.generate_quiz_questions(
-            paper_id=paper_id,
-            paper_info=paper_info,
-            num_questions=request.num_questions
-        )
+        # Stored quiz questions (generated now if missing or outdated)
+        aids = await study_aids.get_study_aids(paper_id, paper_info, regenerate=bool(request.regenerate))
+        questions = aids["quiz"][:request.num_questions]
         
         return {"questions": questions, "paper_id": paper_id}
         
@@ -115,12 +294,15 @@ async def generate_quiz(paper_id: str, request: QuizRequest):
 
 
 @router.get("/{paper_id}/suggested-questions", response_model=SuggestedQuestions)
-async def get_suggested_questions(paper_id: str):
+async def get_suggested_questions(paper_id: str, regenerate: bool = False):
     """
     Get suggested questions for a paper.
     
+    Served from storage like the quiz; set regenerate to get new ones.
+    
     Args:
         paper_id: Unique identifier for the paper
+        regenerate: Generate new study aids instead of the stored ones
         
     Returns:
         List of suggested questions
@@ -135,10 +317,7 @@ async def get_suggested_questions(paper_id: str):
             paper_info = papers_storage[paper_id]
         
         # Get suggested questions
-        questions = chatbot_service.suggest_questions(
-            paper_id=paper_id,
-            paper_info=paper_info
-        )
+        questions = await study_aids.get_suggested_questions(paper_id, paper_info, regenerate)
         
         return SuggestedQuestions(questions=questions)
         
@@ -150,18 +329,19 @@ async def get_suggested_questions(paper_id: str):
 
 
 @router.get("/{paper_id}/conversation-history")
-async def get_conversation_history(paper_id: str):
+async def get_conversation_history(paper_id: str, owner: str = Depends(get_chat_owner)):
     """
     Get the conversation history for a paper.
     
     Args:
         paper_id: Unique identifier for the paper
+        owner: Conversation owner (user or session) from dependency
         
     Returns:
         List of conversation messages
     """
     try:
-        history = chatbot_service.get_conversation_history(paper_id)
+        history = chatbot_service.get_conversation_history(paper_id, owner)
         return {"history": history, "paper_id": paper_id}
         
     except Exception as e:
@@ -170,18 +350,19 @@ async def get_conversation_history(paper_id: str):
 
 
 @router.delete("/{paper_id}/conversation")
-async def clear_conversation(paper_id: str):
+async def clear_conversation(paper_id: str, owner: str = Depends(get_chat_owner)):
     """
     Clear the conversation history for a paper.
     
     Args:
         paper_id: Unique identifier for the paper
+        owner: Conversation owner (user or session) from dependency
         
     Returns:
         Success message
     """
     try:
-        chatbot_service.clear_conversation(paper_id)
+        chatbot_service.clear_conversation(paper_id, owner)
         return {"message": "Conversation cleared successfully", "paper_id": paper_id}
         
     except Exception as e:
@@ -190,12 +371,13 @@ async def clear_conversation(paper_id: str):
 
 
 @router.post("/{paper_id}/initialize")
-async def initialize_chatbot(paper_id: str):
+async def initialize_chatbot(paper_id: str, owner: str = Depends(get_chat_owner)):
     """
     Initialize the chatbot for a paper (loads paper context).
     
     Args:
         paper_id: Unique identifier for the paper
+        owner: Conversation owner (user or session) from dependency
         
     Returns:
         Success message with suggested questions
@@ -210,10 +392,10 @@ async def initialize_chatbot(paper_id: str):
             paper_info = papers_storage[paper_id]
         
         # Initialize conversation
-        chatbot_service.initialize_conversation(paper_id, paper_info)
+        await chatbot_service.initialize_conversation(paper_id, paper_info, owner)
         
         # Get suggested questions
-        questions = chatbot_service.suggest_questions(paper_id, paper_info)
+        questions = await study_aids.get_suggested_questions(paper_id, paper_info)
         
         return {
             "message": "Chatbot initialized successfully",
@@ -6,6 +6,7 @@ from typing import List
 from app.auth.dependencies import get_current_user
 from app.routes.papers import papers_storage
 from app.routes.slides import slides_storage
+from app.services.image_extraction import ensure_images_ready
 
 router = APIRouter()
 
@@ -17,7 +18,7 @@ async def get_available_images(paper_id: str) -> List[str]:
         raise HTTPException(status_code=404, detail="Paper not found")
     
     paper_info = papers_storage[paper_id]
-    image_files = paper_info.get("image_files", [])
+    image_files = await ensure_images_ready(paper_id, paper_info)
     
     # Return just the filenames for the frontend
     return [os.path.basename(img) for img in image_files if os.path.exists(img)]
@@ -30,7 +31,7 @@ async def get_image_file(paper_id: str, image_name: str):
         raise HTTPException(status_code=404, detail="Paper not found")
     
     paper_info = papers_storage[paper_id]
-    image_files = paper_info.get("image_files", [])
+    image_files = await ensure_images_ready(paper_id, paper_info)
     
     # Find the requested image
     image_path = None
@@ -0,0 +1,87 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+import logging
+from app.services.library_index import (
+    SNIPPET_CHARS,
+    library_index,
+    answer_library_question,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+class LibraryChatRequest(BaseModel):
+    """Model for a question across the library."""
+    question: str
+    paper_ids: Optional[List[str]] = None
+
+
+class LibraryChatResponse(BaseModel):
+    """Model for a library answer with its sources."""
+    answer: str
+    sources: List[Dict]
+
+
+@router.get("/search")
+async def search_library(
+    q: str,
+    top_k: int = Query(10, ge=1, le=50),
+    paper_ids: Optional[List[str]] = Query(None)
+):
+    """
+    Search passages across every paper in the library.
+    
+    Args:
+        q: Search text
+        top_k: Maximum number of passages
+        paper_ids: Restrict the search to these papers (repeat the parameter)
+        
+    Returns:
+        Passages, best first, each with its paper ID, title and section
+    """
+    try:
+        results = await run_in_threadpool(library_index.search, q, top_k, paper_ids)
+        for result in results:
+            result["snippet"] = result.pop("text")[:SNIPPET_CHARS]
+        return {"query": q, "results": results}
+        
+    except Exception as e:
+        logger.error(f"Error searching library: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error searching library: {str(e)}")
+
+
+@router.post("/chat", response_model=LibraryChatResponse)
+async def chat_with_library(request: LibraryChatRequest):
+    """
+    Ask a question across the library or a reading list.
+    
+    Args:
+        request: Question and optional paper IDs of the reading list
+        
+    Returns:
+        Answer citing sources as [S1], and the sources with their papers
+    """
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question must not be empty")
+    try:
+        result = await answer_library_question(request.question, request.paper_ids)
+        return LibraryChatResponse(**result)
+        
+    except Exception as e:
+        logger.error(f"Error in library chat: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing library chat: {str(e)}")
+
+
+@router.get("/status")
+async def get_library_status():
+    """
+    Size of the library index.
+    
+    Returns:
+        Indexed paper, chunk and term counts
+    """
+    return library_index.stats()
@@ -4,17 +4,19 @@ Mind Map Generation Routes
 
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional, List, Dict
 import os
 import logging
 import json
 from pathlib import Path
-import google.generativeai as genai
 
 from app.routes.api_keys import get_api_keys
 from app.routes.papers import papers_storage
 from app.services.storage_manager import storage_manager
-from app.services.script_generator import extract_text_from_file
+from app.services.context_builder import build_paper_context
+from app.services.structured_output import agenerate_json, StructuredOutputError
+from app.models.artifact_models import MindMap
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -49,44 +51,19 @@ async def generate_mindmap(
         
         # Extract paper text
         logger.info(f"Extracting text from paper {paper_id}")
-        source_type = paper_info.get("source_type", "pdf")
-        if source_type == "pdf":
-            pdf_path = paper_info.get("pdf_path")
-            if not pdf_path or not os.path.exists(pdf_path):
-                raise HTTPException(status_code=404, detail="PDF file not found")
-            paper_text = extract_text_from_file(pdf_path)
-        else:
-            tex_path = paper_info.get("tex_file_path")
-            if not tex_path or not os.path.exists(tex_path):
-                raise HTTPException(status_code=404, detail="Paper text file not found")
-            with open(tex_path, 'r', encoding='utf-8') as f:
-                paper_text = f.read()
+        try:
+            paper_text = await run_in_threadpool(build_paper_context, paper_info, "mindmap")
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Paper text file not found")
         
         # Generate mind map
         logger.info(f"Generating mind map for paper {paper_id}")
-        mindmap_data = _generate_mindmap_with_gemini(
+        mindmap_data = await _generate_mindmap_with_gemini(
             paper_text=paper_text,
             gemini_key=api_keys["gemini_key"]
         )
         
-        # Save mind map to file
-        output_dir = Path(f"temp/mindmaps/{paper_id}")
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        mindmap_path = output_dir / "mindmap.json"
-        with open(mindmap_path, 'w', encoding='utf-8') as f:
-            json.dump(mindmap_data, f, indent=2)
-        
-        # Save metadata
-        metadata = {
-            "paper_id": paper_id,
-            "mindmap_data": mindmap_data,
-            "mindmap_path": str(mindmap_path)
-        }
-        
-        metadata_path = output_dir / "metadata.json"
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2)
+        save_mindmap(paper_id, mindmap_data)
         
         return {
             "message": "Mind map generated successfully",
@@ -100,24 +77,53 @@ async def generate_mindmap(
         raise HTTPException(status_code=500, detail=f"Failed to generate mind map: {str(e)}")
 
 
-def _generate_mindmap_with_gemini(paper_text: str, gemini_key: str) -> Dict:
+def save_mindmap(paper_id: str, mindmap_data: Dict) -> str:
+    """
+    Save a generated mind map and its metadata.
+    
+    Args:
+        paper_id: The paper ID
+        mindmap_data: Mind map data structure
+    
+    Returns:
+        Path to the saved mind map
+    """
+    output_dir = Path(f"temp/mindmaps/{paper_id}")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    mindmap_path = output_dir / "mindmap.json"
+    with open(mindmap_path, 'w', encoding='utf-8') as f:
+        json.dump(mindmap_data, f, indent=2)
+    
+    # Save metadata
+    metadata = {
+        "paper_id": paper_id,
+        "mindmap_data": mindmap_data,
+        "mindmap_path": str(mindmap_path)
+    }
+    
+    metadata_path = output_dir / "metadata.json"
+    with open(metadata_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+    
+    return str(mindmap_path)
+
+
+async def _generate_mindmap_with_gemini(paper_text: str, gemini_key: str) -> Dict:
     """
     Generate mind map structure using Gemini AI.
     
     Args:
-        paper_text: Full text of the research paper
+        paper_text: Paper text, already fitted to the task budget (see context_builder)
         gemini_key: Gemini API key
     
     Returns:
         Mind map data structure
     """
-    genai.configure(api_key=gemini_key)
-    model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    
     prompt = f"""Analyze the following research paper and create a hierarchical mind map structure.
 
 Paper text:
-{paper_text[:15000]}
+{paper_text}
 
 Generate a mind map as a JSON structure with the following format:
 {{
@@ -207,24 +213,15 @@ IMPORTANT RULES:
 Generate the mind map now:"""
 
     try:
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # Remove markdown code blocks if present
-        if response_text.startswith('```'):
-            response_text = response_text.split('```')[1]
-            if response_text.startswith('json'):
-                response_text = response_text[4:]
-            response_text = response_text.strip()
-        
-        mindmap_data = json.loads(response_text)
+        mindmap_data = (await agenerate_json(
+            prompt, gemini_key, MindMap, 'gemini-2.0-flash-exp', call_site="mindmaps.mindmap"
+        )).model_dump()
         logger.info(f"Generated mind map with {len(mindmap_data.get('nodes', []))} root nodes")
         
         return mindmap_data
     
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse JSON: {str(e)}")
-        logger.error(f"Response text: {response_text[:500]}")
+    except StructuredOutputError as e:
+        logger.error(f"Failed to generate a valid mind map: {str(e)}")
         
         # Fallback structure
         return {
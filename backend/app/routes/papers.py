@@ -5,13 +5,28 @@ import zipfile
 import tempfile
 import shutil
 import uuid
+import time
 import logging
 from pathlib import Path
-from app.models.request_models import ArxivRequest, PaperResponse, PaperMetadata
+from typing import Dict, Tuple
+from fastapi.concurrency import run_in_threadpool
+from app.models.request_models import ArxivRequest, BulkArxivRequest, PaperResponse, PaperMetadata
 from app.services.arxiv_scraper import ArxivScraper
 from app.services.script_generator import extract_paper_metadata
-from app.services.latex_processor import find_tex_file, find_image_references, find_image_files
+from app.services.latex_processor import find_tex_file, flatten_latex_document, find_image_references, find_image_files
 from app.services.pdf_processor import process_pdf_file
+from app.services.latex_text import write_latex_text
+from app.services.archive_extractor import extract_zip_source, ArchiveLimitError
+from app.services.image_extraction import start_image_extraction
+from app.services.study_aids import schedule_study_aids
+from app.services.library_index import schedule_library_indexing
+from app.services.bulk_import import (
+    MAX_BULK_IMPORT_ITEMS,
+    create_bulk_import,
+    start_bulk_import,
+    get_bulk_import,
+)
+from app.services.metrics import metrics
 from app.services.storage_manager import storage_manager
 from app.auth.dependencies import get_current_user
 # Configure logging
@@ -27,6 +42,45 @@ def save_paper_info(paper_id: str, info: dict):
     papers_storage[paper_id] = info
     storage_manager.save_paper(paper_id, info)
 
+def after_ingest(paper_id: str, paper_info: dict):
+    """Background work for a newly stored paper: library index, quiz and suggestions."""
+    schedule_library_indexing(paper_id, paper_info)
+    schedule_study_aids(paper_id)
+
+def _process_zip_upload(zip_path: str, extract_dir: str) -> Dict:
+    """Extract a source ZIP and ingest its LaTeX (runs in a worker thread)."""
+    # Extract ZIP file (selective, streamed, size-limited)
+    extract_zip_source(zip_path, extract_dir)
+    
+    # Find main .tex file and flatten \input/\include into one document
+    root_tex_path = find_tex_file(extract_dir)
+    flattened = flatten_latex_document(extract_dir, root_tex_path)
+    tex_file_path = flattened["flattened_path"]
+    
+    # Convert to plain text once, with the section index
+    latex_text = write_latex_text(tex_file_path)
+    
+    # Extract metadata
+    metadata = extract_paper_metadata(tex_file_path)
+    
+    # Find images
+    image_refs = find_image_references(tex_file_path)
+    image_files = find_image_files(extract_dir, image_refs)
+    
+    return {
+        "metadata": metadata,
+        "tex_file_path": tex_file_path,
+        "text_file_path": latex_text["text_file_path"],
+        "section_index_path": latex_text["section_index_path"],
+        "root_tex_file_path": root_tex_path,
+        "source_map_path": flattened["source_map_path"],
+        "source_dir": extract_dir,
+        "image_files": image_files,
+        "zip_file_path": zip_path,  # Store original ZIP path
+        "status": "processed",
+        "source_type": "latex"
+    }
+
 @router.post("/upload-zip", response_model=PaperResponse)
 async def upload_zip_file(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
     """Upload and extract a ZIP file containing LaTeX source."""
@@ -39,96 +93,96 @@ async def upload_zip_file(file: UploadFile = File(...), current_user: dict = Dep
     
     try:
         # Save uploaded ZIP file
-        zip_path = os.path.join(temp_dir, file.filename)
+        zip_path = os.path.join(temp_dir, os.path.basename(file.filename))
         with open(zip_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            await run_in_threadpool(shutil.copyfileobj, file.file, buffer)
         
-        # Extract ZIP file
+        # Extraction and LaTeX processing are blocking; keep the event loop free
         extract_dir = os.path.join(temp_dir, "source")
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
-        
-        # Find main .tex file
-        tex_file_path = find_tex_file(extract_dir)
-        
-        # Extract metadata
-        metadata = extract_paper_metadata(tex_file_path)
-        
-        # Find images
-        image_refs = find_image_references(tex_file_path)
-        image_files = find_image_files(extract_dir, image_refs)
-        
-        # Store paper info
-        paper_info = {
-            "metadata": metadata,
-            "tex_file_path": tex_file_path,
-            "source_dir": extract_dir,
-            "image_files": image_files,
-            "zip_file_path": zip_path,  # Store original ZIP path
-            "status": "processed",
-            "source_type": "latex"
-        }
+        paper_info = await run_in_threadpool(_process_zip_upload, zip_path, extract_dir)
         save_paper_info(paper_id, paper_info)
         
+        # Library index, quiz and suggested questions in the background
+        after_ingest(paper_id, paper_info)
+        
         logger.info(f"Processed ZIP file for paper {paper_id}")
         
         return PaperResponse(
             paper_id=paper_id,
-            metadata=PaperMetadata(**metadata),
-            image_files=[os.path.basename(f) for f in image_files],
-            tex_file_path=tex_file_path,
+            metadata=PaperMetadata(**paper_info["metadata"]),
+            image_files=[os.path.basename(f) for f in paper_info["image_files"]],
+            tex_file_path=paper_info["tex_file_path"],
             status="processed"
         )
         
+    except (ArchiveLimitError, zipfile.BadZipFile) as e:
+        logger.error(f"Rejected ZIP file: {str(e)}")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=f"Invalid ZIP file: {str(e)}")
     except Exception as e:
         logger.error(f"Error processing ZIP file: {str(e)}")
         shutil.rmtree(temp_dir, ignore_errors=True)
         raise HTTPException(status_code=500, detail=f"Error processing ZIP file: {str(e)}")
 
-@router.post("/scrape-arxiv", response_model=PaperResponse)
-async def scrape_arxiv(request: ArxivRequest):
-    """Scrape LaTeX source from arXiv URL."""
+def _ingest_arxiv_paper(arxiv_url: str) -> Tuple[str, Dict]:
+    """Download, process and store one arXiv paper (runs in a worker thread)."""
     scraper = ArxivScraper()
     paper_id = str(uuid.uuid4())
     
+    # Download and extract source
+    extracted_dir = scraper.download_source(arxiv_url)
+    
+    # Get metadata from arXiv page
+    arxiv_metadata = scraper.get_paper_metadata(arxiv_url)
+    
+    # Find main .tex file and flatten \input/\include into one document
+    root_tex_path = find_tex_file(extracted_dir)
+    flattened = flatten_latex_document(extracted_dir, root_tex_path)
+    tex_file_path = flattened["flattened_path"]
+    
+    # Convert to plain text once, with the section index
+    latex_text = write_latex_text(tex_file_path)
+    
+    # Extract metadata from LaTeX file and merge with arXiv metadata
+    latex_metadata = extract_paper_metadata(tex_file_path)
+    metadata = {**latex_metadata, **arxiv_metadata}
+    metadata["arxiv_id"] = scraper.extract_arxiv_id(arxiv_url)
+    
+    # Find images
+    image_refs = find_image_references(tex_file_path)
+    image_files = find_image_files(extracted_dir, image_refs)
+    
+    # Store paper info
+    paper_info = {
+        "metadata": metadata,
+        "tex_file_path": tex_file_path,
+        "text_file_path": latex_text["text_file_path"],
+        "section_index_path": latex_text["section_index_path"],
+        "root_tex_file_path": root_tex_path,
+        "source_map_path": flattened["source_map_path"],
+        "source_dir": extracted_dir,
+        "image_files": image_files,
+        "arxiv_url": arxiv_url,  # Store arXiv URL
+        "status": "processed",
+        "source_type": "arxiv"
+    }
+    save_paper_info(paper_id, paper_info)
+    
+    logger.info(f"Processed arXiv paper {paper_id}")
+    return paper_id, paper_info
+
+@router.post("/scrape-arxiv", response_model=PaperResponse)
+async def scrape_arxiv(request: ArxivRequest):
+    """Scrape LaTeX source from arXiv URL."""
     try:
-        # Download and extract source
-        extracted_dir = scraper.download_source(request.arxiv_url)
-        
-        # Get metadata from arXiv page
-        arxiv_metadata = scraper.get_paper_metadata(request.arxiv_url)
-        
-        # Find main .tex file
-        tex_file_path = find_tex_file(extracted_dir)
-        
-        # Extract metadata from LaTeX file and merge with arXiv metadata
-        latex_metadata = extract_paper_metadata(tex_file_path)
-        metadata = {**latex_metadata, **arxiv_metadata}
-        metadata["arxiv_id"] = scraper.extract_arxiv_id(request.arxiv_url)
-        
-        # Find images
-        image_refs = find_image_references(tex_file_path)
-        image_files = find_image_files(extracted_dir, image_refs)
-        
-        # Store paper info
-        paper_info = {
-            "metadata": metadata,
-            "tex_file_path": tex_file_path,
-            "source_dir": extracted_dir,
-            "image_files": image_files,
-            "arxiv_url": request.arxiv_url,  # Store arXiv URL
-            "status": "processed",
-            "source_type": "arxiv"
-        }
-        save_paper_info(paper_id, paper_info)
-        
-        logger.info(f"Processed arXiv paper {paper_id}")
+        paper_id, paper_info = await run_in_threadpool(_ingest_arxiv_paper, request.arxiv_url)
+        after_ingest(paper_id, paper_info)
         
         return PaperResponse(
             paper_id=paper_id,
-            metadata=PaperMetadata(**metadata),
-            image_files=[os.path.basename(f) for f in image_files],
-            tex_file_path=tex_file_path,
+            metadata=PaperMetadata(**paper_info["metadata"]),
+            image_files=[os.path.basename(f) for f in paper_info["image_files"]],
+            tex_file_path=paper_info["tex_file_path"],
             status="processed"
         )
         
@@ -136,6 +190,30 @@ async def scrape_arxiv(request: ArxivRequest):
         logger.error(f"Error scraping arXiv: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error scraping arXiv: {str(e)}")
 
+@router.post("/bulk-arxiv")
+async def bulk_import_arxiv(request: BulkArxivRequest):
+    """Import a list of arXiv papers concurrently; poll the returned job for progress."""
+    if not request.arxiv_ids:
+        raise HTTPException(status_code=400, detail="No arXiv IDs provided")
+    if len(request.arxiv_ids) > MAX_BULK_IMPORT_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BULK_IMPORT_ITEMS} papers can be imported at once"
+        )
+    
+    job = create_bulk_import(request.arxiv_ids, ArxivScraper())
+    start_bulk_import(job, _ingest_arxiv_paper, on_imported=after_ingest)
+    logger.info(f"Started bulk import {job['job_id']} with {job['total']} papers")
+    return job
+
+@router.get("/bulk-arxiv/{job_id}")
+async def get_bulk_import_progress(job_id: str):
+    """Progress of a bulk arXiv import, with the status of every paper."""
+    job = get_bulk_import(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
 @router.get("/{paper_id}/download-source")
 async def download_paper_source(paper_id: str):
     """Download the original paper source (ZIP or raw files)."""
@@ -257,10 +335,16 @@ async def update_metadata(paper_id: str, metadata: PaperMetadata):
 
 @router.post("/upload-pdf", response_model=PaperResponse)
 async def upload_pdf_file(file: UploadFile = File(...)):
-    """Upload and process a PDF file of a research paper."""
+    """
+    Upload and process a PDF file of a research paper.
+    
+    Returns as soon as metadata and text are extracted; images are extracted
+    in the background and awaited by the routes that need them.
+    """
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
+    start_time = time.perf_counter()
     paper_id = str(uuid.uuid4())
     temp_dir = f"temp/papers/{paper_id}"
     os.makedirs(temp_dir, exist_ok=True)
@@ -271,22 +355,31 @@ async def upload_pdf_file(file: UploadFile = File(...)):
         with open(pdf_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
-        # Process the PDF file
-        result = process_pdf_file(pdf_path, paper_id)
+        # Process the PDF file (metadata and text only; images are deferred)
+        result = await run_in_threadpool(process_pdf_file, pdf_path, paper_id, False)
         
         # Store paper info - result now contains tex_file_path for compatibility
         result["source_type"] = "pdf"  # Add source type
+        time_to_first_response = time.perf_counter() - start_time
+        result["timings"] = {"time_to_first_response": round(time_to_first_response, 3)}
         save_paper_info(paper_id, result)
         
+        # Extract images, index the paper and build its quiz in the background
+        start_image_extraction(paper_id)
+        after_ingest(paper_id, result)
+        
         # Log the storage info for debugging
         logger.info(f"Paper {paper_id} processed and stored with keys: {list(result.keys())}")
+        logger.info(f"Paper {paper_id} time to first response: {time_to_first_response:.3f}s")
+        metrics.observe("upload_pdf.time_to_first_response_seconds", time_to_first_response)
         
         return PaperResponse(
             paper_id=paper_id,
             metadata=PaperMetadata(**result["metadata"]),
             image_files=[os.path.basename(f) for f in result["image_files"]],
             tex_file_path=result["tex_file_path"],  # This should now be available
-            status="processed"
+            status="processed",
+            images_status=result["images_status"]
         )
         
     except Exception as e:
@@ -307,6 +400,7 @@ async def debug_paper_storage():
             "source_type": paper_info.get("source_type", "unknown"),
             "status": paper_info.get("status", "unknown"),
             "image_count": len(paper_info.get("image_files", [])),
+            "images_status": paper_info.get("images_status", "ready"),
         }
     
     return debug_storage
@@ -4,6 +4,7 @@ Podcast Generation Routes
 
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional
 import os
@@ -19,7 +20,8 @@ from app.services.podcast_generator import (
 from app.routes.api_keys import get_api_keys
 from app.routes.papers import papers_storage
 from app.services.storage_manager import storage_manager
-from app.services.script_generator import extract_text_from_file
+from app.services.context_builder import build_paper_context
+from app.services.single_flight import generation_flights, FlightConflictError
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -62,67 +64,86 @@ async def generate_podcast(
         if not api_keys.get("sarvam_key"):
             raise HTTPException(status_code=400, detail="Sarvam API key required")
         
-        # Extract paper text
-        logger.info(f"Extracting text from paper {paper_id}")
-        source_type = paper_info.get("source_type", "pdf")
-        if source_type == "pdf":
-            pdf_path = paper_info.get("pdf_path")
-            if not pdf_path or not os.path.exists(pdf_path):
-                raise HTTPException(status_code=404, detail="PDF file not found")
-            paper_text = extract_text_from_file(pdf_path)
-        else:
-            tex_path = paper_info.get("tex_file_path")
-            if not tex_path or not os.path.exists(tex_path):
-                raise HTTPException(status_code=404, detail="Paper text file not found")
-            with open(tex_path, 'r', encoding='utf-8') as f:
-                paper_text = f.read()
-        
-        # Generate podcast script
-        logger.info(f"Generating podcast script for paper {paper_id} in language: {request.language}")
-        podcast_data = generate_podcast_script(
-            paper_text=paper_text,
-            gemini_key=api_keys["gemini_key"],
-            duration_minutes=request.duration_minutes,
-            language=request.language
-        )
-        
-        # Generate podcast audio from dialogue
-        logger.info("Generating 2-speaker podcast audio")
-        audio_path = generate_podcast_audio(
-            paper_id=paper_id,
-            dialogue=podcast_data["dialogue"],
-            sarvam_api_key=api_keys["sarvam_key"],
-            language=request.language
+        # All podcasts of a paper are written to temp/podcasts/{paper_id}, so
+        # one generation runs per paper: identical requests share it and
+        # requests with other options are refused until it finishes
+        return await generation_flights.run(
+            "podcast",
+            paper_id,
+            lambda: _generate_podcast(paper_id, paper_info, request, api_keys),
+            params=(request.duration_minutes, request.language)
         )
-        
-        # Save metadata
-        metadata = {
-            **podcast_data,
-            "audio_path": audio_path,
-            "language": request.language,
-            "paper_id": paper_id
-        }
-        save_podcast_metadata(paper_id, metadata)
-        
-        return {
-            "message": "2-speaker podcast generated successfully",
-            "title": podcast_data.get("title", "Research Podcast"),
-            "description": podcast_data.get("description", ""),
-            "duration_minutes": request.duration_minutes,
-            "language": request.language,
-            "dialogue_turns": len(podcast_data.get("dialogue", [])),
-            "speakers": 2,
-            "audio_url": f"/api/podcasts/{paper_id}/stream",
-            "download_url": f"/api/podcasts/{paper_id}/download"
-        }
     
     except HTTPException:
         raise
+    except FlightConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Error generating podcast: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate podcast: {str(e)}")
 
 
+async def _generate_podcast(paper_id: str, paper_info: dict, request: PodcastRequest, api_keys: dict) -> dict:
+    """
+    Generate the podcast script and audio and save their metadata.
+    
+    Args:
+        paper_id: The paper ID
+        paper_info: Paper information
+        request: Podcast options
+        api_keys: API keys (Gemini and Sarvam)
+    
+    Returns:
+        Response body for the generate endpoint
+    """
+    # Extract paper text
+    logger.info(f"Extracting text from paper {paper_id}")
+    try:
+        paper_text = await run_in_threadpool(build_paper_context, paper_info, "podcast")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Paper text file not found")
+    
+    # Generate podcast script
+    logger.info(f"Generating podcast script for paper {paper_id} in language: {request.language}")
+    podcast_data = await generate_podcast_script(
+        paper_text=paper_text,
+        gemini_key=api_keys["gemini_key"],
+        duration_minutes=request.duration_minutes,
+        language=request.language
+    )
+    
+    # Generate podcast audio from dialogue (blocking TTS calls, off the event loop)
+    logger.info("Generating 2-speaker podcast audio")
+    audio_path = await run_in_threadpool(
+        generate_podcast_audio,
+        paper_id=paper_id,
+        dialogue=podcast_data["dialogue"],
+        sarvam_api_key=api_keys["sarvam_key"],
+        language=request.language
+    )
+    
+    # Save metadata
+    metadata = {
+        **podcast_data,
+        "audio_path": audio_path,
+        "language": request.language,
+        "paper_id": paper_id
+    }
+    save_podcast_metadata(paper_id, metadata)
+    
+    return {
+        "message": "2-speaker podcast generated successfully",
+        "title": podcast_data.get("title", "Research Podcast"),
+        "description": podcast_data.get("description", ""),
+        "duration_minutes": request.duration_minutes,
+        "language": request.language,
+        "dialogue_turns": len(podcast_data.get("dialogue", [])),
+        "speakers": 2,
+        "audio_url": f"/api/podcasts/{paper_id}/stream",
+        "download_url": f"/api/podcasts/{paper_id}/download"
+    }
+
+
 @router.get("/{paper_id}/stream")
 async def stream_podcast(paper_id: str):
     """Stream the generated podcast audio."""
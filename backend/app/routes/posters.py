@@ -4,6 +4,7 @@ AI Poster Generation Routes
 
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
 import os
 import logging
@@ -18,7 +19,8 @@ from app.services.poster_generator import (
 from app.routes.api_keys import get_api_keys
 from app.routes.papers import papers_storage
 from app.services.storage_manager import storage_manager
-from app.services.script_generator import extract_text_from_file
+from app.services.context_builder import build_paper_context
+from app.services.image_extraction import ensure_images_ready
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -60,59 +62,20 @@ async def generate_poster(
         
         # Extract paper text
         logger.info(f"Extracting text from paper {paper_id}")
-        source_type = paper_info.get("source_type", "pdf")
-        if source_type == "pdf":
-            pdf_path = paper_info.get("pdf_path")
-            if not pdf_path or not os.path.exists(pdf_path):
-                raise HTTPException(status_code=404, detail="PDF file not found")
-            paper_text = extract_text_from_file(pdf_path)
-        else:
-            tex_path = paper_info.get("tex_file_path")
-            if not tex_path or not os.path.exists(tex_path):
-                raise HTTPException(status_code=404, detail="Paper text file not found")
-            with open(tex_path, 'r', encoding='utf-8') as f:
-                paper_text = f.read()
+        try:
+            paper_text = await run_in_threadpool(build_paper_context, paper_info, "poster")
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Paper text file not found")
         
         # Generate poster content
         logger.info(f"Generating poster content for paper {paper_id} in language: {request.language}")
-        content = generate_poster_content(
+        content = await generate_poster_content(
             paper_text=paper_text,
             gemini_key=api_keys["gemini_key"],
             language=request.language
         )
         
-        # Check if images need to be extracted
-        logger.info("Checking for paper images")
-        images = extract_paper_images(paper_id)
-        
-        # If no images found, try to get from paper_info
-        if not images and paper_info.get("image_files"):
-            logger.info("Using images from paper_info")
-            images = [img for img in paper_info["image_files"] if os.path.exists(img)]
-        
-        logger.info(f"Found {len(images)} images for poster")
-        
-        # Create poster
-        logger.info("Creating poster layout")
-        poster_dir = Path(f"temp/posters/{paper_id}")
-        poster_dir.mkdir(parents=True, exist_ok=True)
-        poster_path = poster_dir / "poster.png"
-        
-        create_poster_layout(
-            content=content,
-            images=images,
-            output_path=str(poster_path)
-        )
-        
-        # Save metadata
-        metadata = {
-            **content,
-            "poster_path": str(poster_path),
-            "num_images": len(images),
-            "paper_id": paper_id,
-            "language": request.language
-        }
-        save_poster_metadata(paper_id, metadata)
+        images = await build_poster(paper_id, paper_info, content, request.language)
         
         return {
             "message": "Poster generated successfully",
@@ -130,6 +93,57 @@ async def generate_poster(
         raise HTTPException(status_code=500, detail=f"Failed to generate poster: {str(e)}")
 
 
+async def build_poster(paper_id: str, paper_info: dict, content: dict, language: str) -> list:
+    """
+    Lay out the poster for generated content and save its metadata.
+    
+    Args:
+        paper_id: The paper ID
+        paper_info: Paper information
+        content: Poster content from generate_poster_content
+        language: Language code of the content
+    
+    Returns:
+        List of image paths used on the poster
+    """
+    # Check if images need to be extracted
+    logger.info("Checking for paper images")
+    images = extract_paper_images(paper_id)
+    
+    # If no images found, try to get from paper_info
+    if not images:
+        paper_images = await ensure_images_ready(paper_id, paper_info)
+        if paper_images:
+            logger.info("Using images from paper_info")
+            images = [img for img in paper_images if os.path.exists(img)]
+    
+    logger.info(f"Found {len(images)} images for poster")
+    
+    # Create poster
+    logger.info("Creating poster layout")
+    poster_dir = Path(f"temp/posters/{paper_id}")
+    poster_dir.mkdir(parents=True, exist_ok=True)
+    poster_path = poster_dir / "poster.png"
+    
+    await run_in_threadpool(
+        create_poster_layout,
+        content=content,
+        images=images,
+        output_path=str(poster_path)
+    )
+    
+    # Save metadata
+    metadata = {
+        **content,
+        "poster_path": str(poster_path),
+        "num_images": len(images),
+        "paper_id": paper_id,
+        "language": language
+    }
+    save_poster_metadata(paper_id, metadata)
+    return images
+
+
 @router.get("/{paper_id}/view")
 async def view_poster(paper_id: str):
     """View the generated poster."""
@@ -4,6 +4,7 @@ AI Reel Generation Routes
 
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
 import os
 import logging
@@ -14,7 +15,7 @@ from app.services.tts_service import generate_audio_sarvam
 from app.routes.api_keys import get_api_keys
 from app.routes.papers import papers_storage
 from app.services.storage_manager import storage_manager
-from app.services.script_generator import extract_text_from_file
+from app.services.context_builder import build_paper_context
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -64,22 +65,14 @@ async def generate_reel(
         logger.info(f"Using hardcoded background video: {bg_video_path}")
         
         # Extract paper text
-        source_type = paper_info.get("source_type", "pdf")
-        if source_type == "pdf":
-            pdf_path = paper_info.get("pdf_path")
-            if not pdf_path or not os.path.exists(pdf_path):
-                raise HTTPException(status_code=404, detail="PDF file not found")
-            paper_text = extract_text_from_file(pdf_path)
-        else:
-            tex_path = paper_info.get("tex_file_path")
-            if not tex_path or not os.path.exists(tex_path):
-                raise HTTPException(status_code=404, detail="Paper text file not found")
-            with open(tex_path, 'r', encoding='utf-8') as f:
-                paper_text = f.read()
+        try:
+            paper_text = await run_in_threadpool(build_paper_context, paper_info, "reel")
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Paper text file not found")
         
         # Generate reel summary (3 slides + narration)
         logger.info(f"Generating reel summary for paper {paper_id}")
-        reel_data = generate_reel_summary(
+        reel_data = await generate_reel_summary(
             paper_text=paper_text,
             gemini_key=api_keys["gemini_key"],
             duration=duration
@@ -1,7 +1,12 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import Dict, List
+from pathlib import Path
 import os
 import json
+import time
+import asyncio
 import traceback
 import logging
 from app.models.request_models import ScriptUpdateRequest, ScriptResponse, SectionScript
@@ -14,11 +19,19 @@ from app.services.script_generator import (
     clean_text,
     generate_bullet_points_with_gemini,
     generate_all_bullet_points_with_gemini,
-    extract_paper_metadata
+    extract_paper_metadata,
+    stream_full_script_with_gemini,
+    ScriptSectionSplitter,
+    SCRIPT_SECTIONS
 )
 from app.routes.papers import papers_storage
 from app.routes.api_keys import get_api_keys
 from app.services.storage_manager import storage_manager
+from app.services.paper_text import get_paper_text
+from app.services.tts_service import generate_audio_sarvam
+from app.services.streaming import sse_event, SSE_MEDIA_TYPE, SSE_HEADERS
+from app.services.metrics import metrics
+from app.services.single_flight import generation_flights
 from app.auth.dependencies import get_current_user
 
 router = APIRouter()
@@ -98,90 +111,251 @@ async def generate_script(paper_id: str, api_keys: dict = Depends(get_api_keys))
         raise HTTPException(status_code=400, detail="Gemini API key required")
 
     try:
-        # Check if this is a PDF-sourced file or LaTeX file
-        source_type = paper_info.get("source_type", "latex")
-        logger.info(f"Processing paper {paper_id_str} of source type {source_type}")
-        
-        # Get the path to the file (could be tex_file_path for LaTeX or text_file_path for PDF)
-        if "tex_file_path" in paper_info:
-            file_path = paper_info["tex_file_path"]
-            logger.info(f"Using tex_file_path: {file_path}")
-        elif "text_file_path" in paper_info:
-            file_path = paper_info["text_file_path"]
-            logger.info(f"Using text_file_path: {file_path}")
-        else:
-            available_keys = list(paper_info.keys())
-            logger.error(f"No text or tex file path found. Available keys: {available_keys}")
-            raise ValueError(f"No text or tex file path found in paper info. Available keys: {available_keys}")
-        
-        # Use the same metadata that's stored in paper_info for consistency
-        # This ensures that the title intro script uses the same metadata as the slides
-        metadata = paper_info["metadata"]
-        title_intro = generate_title_introduction(
-            metadata.get("title", "Research Paper"),
-            metadata.get("authors", "Author"),
-            metadata.get("date", "2024")
-        )
-        print(f"Generated title introduction: {title_intro}")
-        input_text = extract_text_from_file(file_path)
-        input_text = clean_text(input_text)
-        
-        # Generate full script using Gemini with improved prompts
-        full_script = generate_full_script_with_gemini(api_keys["gemini_key"], input_text)
-        
-        # Split into sections
-        sections_scripts = split_script_into_sections(full_script)
-        
-        # Clean each section for TTS
-        cleaned_sections = {}
-        for section_name, script_text in sections_scripts.items():
-            cleaned_sections[section_name] = clean_script_for_tts_and_video(script_text)
-        
-        # Generate bullet points for all sections with a single prompt
-        logger.info(f"Generating bullet points for all sections using single prompt")
-        all_bullet_points = generate_all_bullet_points_with_gemini(
-            api_keys["gemini_key"],
-            cleaned_sections
-        )
-        logger.info(f"Generated bullet points for {len(all_bullet_points)} sections")
-        
-        # Combine cleaned scripts with bullet points
-        sections_with_bullets = {}
-        for section_name in cleaned_sections.keys():
-            sections_with_bullets[section_name] = {
-                "script": cleaned_sections[section_name],
-                "bullet_points": all_bullet_points.get(section_name, ["Key information from this section"]),
-                "assigned_image": None
-            }
-        
-        # Store comprehensive script data
-        script_data = {
-            "sections": sections_with_bullets,
-            "full_script": full_script,
-            "status": "generated",
-            "source_type": source_type,
-            "title_intro_script": title_intro.strip()
-        }
-        
-        scripts_storage[paper_id] = script_data
-        
-        # Save to file immediately
-        if not save_scripts_to_file(paper_id, script_data):
-            logger.warning(f"Failed to save scripts to file for paper {paper_id}")
-        
-        # Return only script text for compatibility
-        sections_scripts_only = {k: v["script"] for k, v in sections_with_bullets.items()}
-        
-        return ScriptResponse(
-            sections_scripts=sections_scripts_only,
-            paper_id=paper_id
+        # Identical requests already running share that generation
+        return await generation_flights.run(
+            "script", paper_id_str, lambda: _generate_script(paper_id_str, paper_info, api_keys["gemini_key"])
         )
-        
     except Exception as e:
         logger.error(f"Error generating script: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error generating script: {str(e)}")
 
+async def _generate_script(paper_id: str, paper_info: Dict, gemini_key: str) -> ScriptResponse:
+    """Generate, split and store the script and bullet points for one paper."""
+    # Check if this is a PDF-sourced file or LaTeX file
+    source_type = paper_info.get("source_type", "latex")
+    logger.info(f"Processing paper {paper_id} of source type {source_type}")
+    
+    # Use the same metadata that's stored in paper_info for consistency
+    # This ensures that the title intro script uses the same metadata as the slides
+    metadata = paper_info["metadata"]
+    title_intro = generate_title_introduction(
+        metadata.get("title", "Research Paper"),
+        metadata.get("authors", "Author"),
+        metadata.get("date", "2024")
+    )
+    print(f"Generated title introduction: {title_intro}")
+    # Paper text is read (and LaTeX normalized) once through the shared cache
+    try:
+        input_text = await run_in_threadpool(get_paper_text, paper_info)
+    except FileNotFoundError:
+        available_keys = list(paper_info.keys())
+        logger.error(f"No text or tex file found. Available keys: {available_keys}")
+        raise ValueError(f"No text or tex file found for paper. Available keys: {available_keys}")
+    input_text = clean_text(input_text)
+    
+    # Generate full script using Gemini with improved prompts
+    full_script = await generate_full_script_with_gemini(gemini_key, input_text)
+    
+    # Split into sections
+    sections_scripts = split_script_into_sections(full_script)
+    
+    # Clean each section for TTS
+    cleaned_sections = {}
+    for section_name, script_text in sections_scripts.items():
+        cleaned_sections[section_name] = clean_script_for_tts_and_video(script_text)
+    
+    # Generate bullet points for all sections with a single prompt
+    logger.info(f"Generating bullet points for all sections using single prompt")
+    all_bullet_points = await generate_all_bullet_points_with_gemini(
+        gemini_key,
+        cleaned_sections
+    )
+    logger.info(f"Generated bullet points for {len(all_bullet_points)} sections")
+    
+    # Combine cleaned scripts with bullet points
+    sections_with_bullets = {}
+    for section_name in cleaned_sections.keys():
+        sections_with_bullets[section_name] = {
+            "script": cleaned_sections[section_name],
+            "bullet_points": all_bullet_points.get(section_name, ["Key information from this section"]),
+            "assigned_image": None
+        }
+    
+    # Store comprehensive script data
+    script_data = {
+        "sections": sections_with_bullets,
+        "full_script": full_script,
+        "status": "generated",
+        "source_type": source_type,
+        "title_intro_script": title_intro.strip()
+    }
+    
+    scripts_storage[paper_id] = script_data
+    
+    # Save to file immediately
+    if not save_scripts_to_file(paper_id, script_data):
+        logger.warning(f"Failed to save scripts to file for paper {paper_id}")
+    
+    # Return only script text for compatibility
+    sections_scripts_only = {k: v["script"] for k, v in sections_with_bullets.items()}
+    
+    return ScriptResponse(
+        sections_scripts=sections_scripts_only,
+        paper_id=paper_id
+    )
+
+@router.post("/{paper_id}/generate/stream")
+async def generate_script_stream(
+    paper_id: str,
+    tts: bool = False,
+    voice: str = "vidya",
+    api_keys: dict = Depends(get_api_keys)
+):
+    """
+    Generate the presentation script as a server-sent event stream.
+
+    The script is streamed from Gemini and each section is sent as soon as
+    the next heading starts ("section" events). Bullet points for a finished
+    section, and its English narration when tts is set, are generated while
+    later sections are still streaming ("bullets" and "audio" events). The
+    stored result has the same shape as /generate and ends with a
+    "complete" event.
+
+    Args:
+        paper_id: The paper ID
+        tts: Also synthesize each section's audio with Sarvam
+        voice: Sarvam voice for the narration
+        api_keys: API keys from dependency
+
+    Returns:
+        StreamingResponse of server-sent events
+    """
+    paper_info = storage_manager.get_paper(paper_id)
+    if not paper_info:
+        if paper_id not in papers_storage:
+            raise HTTPException(status_code=404, detail=f"Paper ID {paper_id} not found")
+        paper_info = papers_storage[paper_id]
+
+    if not api_keys.get("gemini_key"):
+        raise HTTPException(status_code=400, detail="Gemini API key required")
+    if tts and not api_keys.get("sarvam_key"):
+        raise HTTPException(status_code=400, detail="Sarvam API key required for audio")
+
+    try:
+        input_text = await run_in_threadpool(get_paper_text, paper_info)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Paper text file not found")
+    input_text = clean_text(input_text)
+
+    metadata = paper_info["metadata"]
+    title_intro = generate_title_introduction(
+        metadata.get("title", "Research Paper"),
+        metadata.get("authors", "Author"),
+        metadata.get("date", "2024")
+    )
+    gemini_key = api_keys["gemini_key"]
+    sarvam_key = api_keys.get("sarvam_key")
+
+    async def event_stream():
+        start = time.perf_counter()
+        queue: asyncio.Queue = asyncio.Queue()
+        splitter = ScriptSectionSplitter()
+        # Section name -> cleaned script its bullet points were built from
+        emitted: Dict[str, str] = {}
+        bullet_points: Dict[str, List[str]] = {}
+        full_script: List[str] = []
+        work: List[asyncio.Task] = []
+        failure: List[str] = []
+
+        async def section_work(section_name: str, script: str, audio_index: int):
+            bullets = await generate_bullet_points_with_gemini(gemini_key, script)
+            bullet_points[section_name] = bullets
+            await queue.put(sse_event("bullets", {
+                "section": section_name,
+                "bullet_points": bullets,
+                "seconds": round(time.perf_counter() - start, 3)
+            }))
+            if tts:
+                # Same file names as /api/media/{id}/generate-audio
+                output_dir = f"temp/audio/{paper_id}"
+                os.makedirs(output_dir, exist_ok=True)
+                audio_path = os.path.join(output_dir, f"{audio_index:02d}_{section_name.lower()}.wav")
+                try:
+                    await run_in_threadpool(generate_audio_sarvam, script, audio_path, sarvam_key, "en-IN", voice)
+                    event = {"section": section_name, "audio_file": Path(audio_path).name}
+                except Exception as e:
+                    logger.error(f"Error generating audio for {section_name}: {str(e)}")
+                    event = {"section": section_name, "error": str(e)}
+                event["seconds"] = round(time.perf_counter() - start, 3)
+                await queue.put(sse_event("audio", event))
+
+        def finish_sections(section_names: List[str]):
+            for section_name in section_names:
+                script = clean_script_for_tts_and_video(splitter.section_text(section_name))
+                # A section reopened by a repeated heading is sent again
+                if not script or emitted.get(section_name) == script:
+                    continue
+                if not emitted:
+                    metrics.observe("script_stream.first_section_seconds", time.perf_counter() - start)
+                emitted[section_name] = script
+                queue.put_nowait(sse_event("section", {
+                    "section": section_name,
+                    "script": script,
+                    "seconds": round(time.perf_counter() - start, 3)
+                }))
+                audio_index = SCRIPT_SECTIONS.index(section_name) + 1
+                work.append(asyncio.create_task(section_work(section_name, script, audio_index)))
+
+        async def produce():
+            try:
+                async for chunk in stream_full_script_with_gemini(gemini_key, input_text):
+                    full_script.append(chunk)
+                    finish_sections(splitter.feed(chunk))
+                finish_sections(splitter.close())
+                await asyncio.gather(*work)
+            except Exception as e:
+                logger.error(f"Error streaming script for paper {paper_id}: {str(e)}")
+                failure.append(str(e))
+            finally:
+                await queue.put(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            yield sse_event("started", {"paper_id": paper_id, "sections": SCRIPT_SECTIONS})
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+
+            if failure:
+                yield sse_event("error", {"detail": f"Error generating script: {failure[0]}"})
+                return
+
+            sections_with_bullets = {}
+            for section_name, script_text in splitter.result().items():
+                sections_with_bullets[section_name] = {
+                    "script": clean_script_for_tts_and_video(script_text),
+                    "bullet_points": bullet_points.get(section_name, ["Key information from this section"]),
+                    "assigned_image": None
+                }
+            script_data = {
+                "sections": sections_with_bullets,
+                "full_script": "".join(full_script),
+                "status": "generated",
+                "source_type": paper_info.get("source_type", "latex"),
+                "title_intro_script": title_intro.strip()
+            }
+            scripts_storage[paper_id] = script_data
+            if not save_scripts_to_file(paper_id, script_data):
+                logger.warning(f"Failed to save scripts to file for paper {paper_id}")
+
+            total = round(time.perf_counter() - start, 3)
+            metrics.observe("script_stream.total_seconds", total)
+            yield sse_event("complete", {
+                "paper_id": paper_id,
+                "sections_scripts": {k: v["script"] for k, v in sections_with_bullets.items()},
+                "total_seconds": total
+            })
+        finally:
+            # Client went away: stop streaming and the per-section work
+            producer.cancel()
+            for task in work:
+                task.cancel()
+
+    return StreamingResponse(event_stream(), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+
 @router.get("/{paper_id}/sections")
 async def get_sections_with_bullets(paper_id: str):
     """Get all section scripts with bullet points."""
@@ -8,6 +8,7 @@ from app.models.request_models import SlideResponse
 from app.routes.papers import papers_storage
 from app.routes.scripts import scripts_storage
 from app.services.beamer_generator import create_beamer_presentation
+from app.services.image_extraction import ensure_images_ready
 from app.utils.latex_to_images import compile_latex, convert_pdf_to_images
 
 router = APIRouter()
@@ -43,8 +44,9 @@ async def generate_slides(paper_id: str):
         # Copy theme files to output directory
         copy_beamer_theme_files(output_dir)
         
-        # Copy images to output directory
-        copy_paper_images(paper_info.get("image_files", []), output_dir)
+        # Copy images to output directory (waits for deferred PDF extraction)
+        image_files = await ensure_images_ready(paper_id, paper_info)
+        copy_paper_images(image_files, output_dir)
         
         # Get image assignments
         image_assignments = {}
@@ -4,18 +4,19 @@ Text Summary Generation Routes
 
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional
 import os
 import logging
 import json
 from pathlib import Path
-import google.generativeai as genai
 
 from app.routes.api_keys import get_api_keys
 from app.routes.papers import papers_storage
 from app.services.storage_manager import storage_manager
-from app.services.script_generator import extract_text_from_file
+from app.services.context_builder import build_paper_context
+from app.services.llm_service import agenerate_text
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -56,46 +57,20 @@ async def generate_summary(
         
         # Extract paper text
         logger.info(f"Extracting text from paper {paper_id}")
-        source_type = paper_info.get("source_type", "pdf")
-        if source_type == "pdf":
-            pdf_path = paper_info.get("pdf_path")
-            if not pdf_path or not os.path.exists(pdf_path):
-                raise HTTPException(status_code=404, detail="PDF file not found")
-            paper_text = extract_text_from_file(pdf_path)
-        else:
-            tex_path = paper_info.get("tex_file_path")
-            if not tex_path or not os.path.exists(tex_path):
-                raise HTTPException(status_code=404, detail="Paper text file not found")
-            with open(tex_path, 'r', encoding='utf-8') as f:
-                paper_text = f.read()
+        try:
+            paper_text = await run_in_threadpool(build_paper_context, paper_info, "summary")
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Paper text file not found")
         
         # Generate summary based on type
         logger.info(f"Generating {request.summary_type} summary for paper {paper_id}")
-        summary = _generate_summary_with_gemini(
+        summary = await _generate_summary_with_gemini(
             paper_text=paper_text,
             gemini_key=api_keys["gemini_key"],
             summary_type=request.summary_type
         )
         
-        # Save summary to file
-        output_dir = Path(f"temp/summaries/{paper_id}")
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        summary_path = output_dir / f"summary_{request.summary_type}.txt"
-        with open(summary_path, 'w', encoding='utf-8') as f:
-            f.write(summary)
-        
-        # Save metadata
-        metadata = {
-            "paper_id": paper_id,
-            "summary": summary,
-            "summary_type": request.summary_type,
-            "summary_path": str(summary_path)
-        }
-        
-        metadata_path = output_dir / "metadata.json"
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2)
+        save_summary(paper_id, summary, request.summary_type)
         
         return {
             "message": "Summary generated successfully",
@@ -111,21 +86,52 @@ async def generate_summary(
         raise HTTPException(status_code=500, detail=f"Failed to generate summary: {str(e)}")
 
 
-def _generate_summary_with_gemini(paper_text: str, gemini_key: str, summary_type: str) -> str:
+def save_summary(paper_id: str, summary: str, summary_type: str) -> str:
+    """
+    Save a generated summary and its metadata.
+    
+    Args:
+        paper_id: The paper ID
+        summary: Summary text
+        summary_type: Type of summary
+    
+    Returns:
+        Path to the saved summary
+    """
+    output_dir = Path(f"temp/summaries/{paper_id}")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    summary_path = output_dir / f"summary_{summary_type}.txt"
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        f.write(summary)
+    
+    # Save metadata
+    metadata = {
+        "paper_id": paper_id,
+        "summary": summary,
+        "summary_type": summary_type,
+        "summary_path": str(summary_path)
+    }
+    
+    metadata_path = output_dir / "metadata.json"
+    with open(metadata_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+    
+    return str(summary_path)
+
+
+async def _generate_summary_with_gemini(paper_text: str, gemini_key: str, summary_type: str) -> str:
     """
     Generate summary using Gemini AI.
     
     Args:
-        paper_text: Full text of the research paper
+        paper_text: Paper text, already fitted to the task budget (see context_builder)
         gemini_key: Gemini API key
         summary_type: Type of summary to generate
     
     Returns:
         Generated summary text
     """
-    genai.configure(api_key=gemini_key)
-    model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    
     summary_prompts = {
         "comprehensive": f"""Generate a comprehensive summary of the following research paper. Include:
 - Main research question and objectives
@@ -137,7 +143,7 @@ def _generate_summary_with_gemini(paper_text: str, gemini_key: str, summary_type
 Keep it detailed but well-organized (400-500 words).
 
 Paper text:
-{paper_text[:15000]}""",
+{paper_text}""",
         
         "concise": f"""Generate a concise summary of the following research paper in 150-200 words.
 Focus on:
@@ -147,7 +153,7 @@ Focus on:
 - Main conclusion
 
 Paper text:
-{paper_text[:15000]}""",
+{paper_text}""",
         
         "abstract": f"""Generate an academic abstract for the following research paper.
 Follow standard abstract structure:
@@ -160,7 +166,7 @@ Follow standard abstract structure:
 Keep it formal and precise (200-250 words).
 
 Paper text:
-{paper_text[:15000]}""",
+{paper_text}""",
         
         "layman": f"""Generate a summary of the following research paper in simple, easy-to-understand language for a general audience.
 Avoid technical jargon and explain concepts clearly.
@@ -173,14 +179,13 @@ Structure:
 Keep it engaging and accessible (300-350 words).
 
 Paper text:
-{paper_text[:15000]}"""
+{paper_text}"""
     }
     
     prompt = summary_prompts.get(summary_type, summary_prompts["comprehensive"])
     
     try:
-        response = model.generate_content(prompt)
-        summary = response.text.strip()
+        summary = (await agenerate_text(prompt, gemini_key, 'gemini-2.0-flash-exp', call_site="summaries.summary")).strip()
         logger.info(f"Generated {summary_type} summary: {len(summary.split())} words")
         return summary
     
@@ -0,0 +1,127 @@
+"""
+Archive Extraction Service
+Extracts uploaded LaTeX source archives member by member, keeping only the
+file types the pipeline uses and enforcing size and count limits
+"""
+
+import os
+import stat
+import zipfile
+import logging
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# File types used downstream (LaTeX sources, bibliography, figures)
+SOURCE_EXTENSIONS = {
+    '.tex', '.ltx', '.bib', '.bbl', '.sty', '.cls', '.bst', '.clo', '.def', '.cfg',
+    '.png', '.jpg', '.jpeg', '.pdf', '.eps', '.svg', '.gif',
+}
+
+# Limits for a single archive (zip-bomb safe: enforced on bytes actually written)
+MAX_MEMBERS = int(os.getenv("ZIP_MAX_MEMBERS", 5000))
+MAX_TOTAL_BYTES = int(os.getenv("ZIP_MAX_TOTAL_BYTES", 512 * 1024 * 1024))
+MAX_MEMBER_BYTES = int(os.getenv("ZIP_MAX_MEMBER_BYTES", 64 * 1024 * 1024))
+
+# Members whose declared compression ratio exceeds this are rejected outright
+MAX_COMPRESSION_RATIO = 200
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ArchiveLimitError(ValueError):
+    """Raised when an archive exceeds the extraction limits."""
+
+
+def extract_zip_source(zip_path: str, extract_dir: str) -> Dict:
+    """
+    Stream the useful members of a ZIP archive to disk.
+
+    Members are copied in chunks and the byte limits are checked against the
+    data actually decompressed, not the sizes declared in the archive.
+    Directories, symlinks, unsafe paths, macOS metadata and file types the
+    pipeline never reads are skipped.
+
+    Args:
+        zip_path: Path to the ZIP archive
+        extract_dir: Directory to extract into
+
+    Returns:
+        Dictionary with extracted and skipped member counts and bytes written
+
+    Raises:
+        ArchiveLimitError: If the archive exceeds a member count or size limit
+        zipfile.BadZipFile: If the file is not a valid ZIP archive
+    """
+    os.makedirs(extract_dir, exist_ok=True)
+    root = os.path.realpath(extract_dir)
+
+    extracted = 0
+    skipped = 0
+    total_bytes = 0
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        members = zip_ref.infolist()
+        if len(members) > MAX_MEMBERS:
+            raise ArchiveLimitError(
+                f"Archive has {len(members)} entries (limit {MAX_MEMBERS})"
+            )
+
+        for member in members:
+            if not _is_wanted(member):
+                skipped += 1
+                continue
+
+            if member.file_size > MAX_MEMBER_BYTES:
+                raise ArchiveLimitError(
+                    f"{member.filename} is larger than {MAX_MEMBER_BYTES} bytes"
+                )
+            if member.compress_size and member.file_size / member.compress_size > MAX_COMPRESSION_RATIO:
+                raise ArchiveLimitError(f"{member.filename} has a suspicious compression ratio")
+
+            target = os.path.realpath(os.path.join(root, member.filename))
+            if not target.startswith(root + os.sep):
+                logger.warning(f"Skipping unsafe archive path: {member.filename}")
+                skipped += 1
+                continue
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            written = 0
+            with zip_ref.open(member) as source, open(target, 'wb') as dest:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    total_bytes += len(chunk)
+                    if written > MAX_MEMBER_BYTES:
+                        raise ArchiveLimitError(
+                            f"{member.filename} is larger than {MAX_MEMBER_BYTES} bytes"
+                        )
+                    if total_bytes > MAX_TOTAL_BYTES:
+                        raise ArchiveLimitError(
+                            f"Archive expands to more than {MAX_TOTAL_BYTES} bytes"
+                        )
+                    dest.write(chunk)
+            extracted += 1
+
+    logger.info(f"Extracted {extracted} files ({total_bytes} bytes), skipped {skipped} from {zip_path}")
+    return {"extracted": extracted, "skipped": skipped, "bytes": total_bytes}
+
+
+def _is_wanted(member: zipfile.ZipInfo) -> bool:
+    """Whether a ZIP member is a regular file of a type the pipeline uses."""
+    if member.is_dir():
+        return False
+
+    # Unix mode bits live in the high 16 bits of external_attr
+    mode = member.external_attr >> 16
+    if mode and stat.S_ISLNK(mode):
+        return False
+
+    name = member.filename.replace('\\', '/')
+    if name.startswith('__MACOSX/') or os.path.basename(name).startswith('._'):
+        return False
+
+    return os.path.splitext(name)[1].lower() in SOURCE_EXTENSIONS
+
@@ -1,4 +1,6 @@
 import os
+import time
+import threading
 import requests
 import shutil
 import re
@@ -7,20 +9,63 @@ import gzip
 from bs4 import BeautifulSoup
 from pathlib import Path
 
+# Overridable so imports can be pointed at a mirror or a local stand-in server
+ARXIV_BASE_URL = os.getenv("ARXIV_BASE_URL", "https://arxiv.org").rstrip("/")
+
+# Minimum delay between requests to arXiv, shared by all scrapers
+ARXIV_MIN_INTERVAL = float(os.getenv("ARXIV_MIN_INTERVAL", 1.0))
+
+REQUEST_TIMEOUT = 60
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls at least min_interval seconds apart."""
+    
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+    
+    def wait(self):
+        """Block until the caller may make its request."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+# Global limiter for arXiv requests
+arxiv_rate_limiter = RateLimiter(ARXIV_MIN_INTERVAL)
+
 class ArxivScraper:
     """Scraper for downloading TeX source files from arXiv papers."""
     
-    def __init__(self, download_dir="temp/arxiv_sources"):
+    def __init__(self, download_dir="temp/arxiv_sources", base_url=None, rate_limiter=arxiv_rate_limiter):
         self.download_dir = download_dir
+        self.base_url = (base_url or ARXIV_BASE_URL).rstrip("/")
+        self.rate_limiter = rate_limiter
         os.makedirs(download_dir, exist_ok=True)
 
     def extract_arxiv_id(self, url):
-        """Extract the arXiv ID from a given URL."""
+        """Extract the arXiv ID from a URL or a bare ID ("2301.12345", "arXiv:2301.12345v2")."""
         match = re.search(r'arxiv\.org/(?:abs|pdf)/([0-9]+\.[0-9]+)(?:v[0-9]+)?', url)
+        if match:
+            return match.group(1)
+        match = re.match(r'^\s*(?:arxiv:)?([0-9]{4}\.[0-9]{4,5})(?:v[0-9]+)?\s*$', url, re.IGNORECASE)
         if match:
             return match.group(1)
         return None
 
+    def abs_url(self, arxiv_id):
+        """Abstract page URL for an arXiv ID."""
+        return f"{self.base_url}/abs/{arxiv_id}"
+
+    def _get(self, url, **kwargs):
+        """GET a URL, respecting the shared rate limit."""
+        if self.rate_limiter:
+            self.rate_limiter.wait()
+        return requests.get(url, timeout=REQUEST_TIMEOUT, **kwargs)
+
     def download_source(self, url):
         """Download the TeX source file for a given arXiv paper URL."""
         arxiv_id = self.extract_arxiv_id(url)
@@ -30,11 +75,11 @@ class ArxivScraper:
         paper_dir = os.path.join(self.download_dir, arxiv_id.replace(".", "_"))
         os.makedirs(paper_dir, exist_ok=True)
 
-        source_url = f"https://arxiv.org/e-print/{arxiv_id}"
+        source_url = f"{self.base_url}/e-print/{arxiv_id}"
         
         try:
             print(f"Downloading source for arXiv paper {arxiv_id}...")
-            response = requests.get(source_url, stream=True)
+            response = self._get(source_url, stream=True)
             response.raise_for_status()
 
             download_path = os.path.join(paper_dir, f"{arxiv_id}.tar.gz")
@@ -89,8 +134,11 @@ class ArxivScraper:
 
     def get_paper_metadata(self, url):
         """Get metadata for the paper (title, authors, date)."""
+        arxiv_id = self.extract_arxiv_id(url)
+        if arxiv_id:
+            url = self.abs_url(arxiv_id)
         try:
-            response = requests.get(url)
+            response = self._get(url)
             response.raise_for_status()
             soup = BeautifulSoup(response.text, 'html.parser')
 
@@ -0,0 +1,191 @@
+"""
+Bulk Import Service
+Runs arXiv imports for whole reading lists concurrently and tracks the
+progress of each item
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.arxiv_scraper import ArxivScraper
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Papers fetched at the same time per job (requests are also rate limited)
+BULK_IMPORT_CONCURRENCY = int(os.getenv("BULK_IMPORT_CONCURRENCY", 4))
+
+# Largest reading list accepted in one job
+MAX_BULK_IMPORT_ITEMS = int(os.getenv("MAX_BULK_IMPORT_ITEMS", 500))
+
+# Item states
+ITEM_QUEUED = "queued"
+ITEM_RUNNING = "running"
+ITEM_DONE = "done"
+ITEM_FAILED = "failed"
+
+# Job states
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+
+# Finished jobs stay available for polling this long
+BULK_IMPORT_JOB_TTL_SECONDS = int(os.getenv("BULK_IMPORT_JOB_TTL_SECONDS", 24 * 3600))
+
+# Finished jobs kept at most; the oldest are dropped first
+MAX_FINISHED_BULK_IMPORTS = int(os.getenv("MAX_FINISHED_BULK_IMPORTS", 100))
+
+# Jobs keyed by job ID (running jobs, and finished ones until pruned)
+_jobs: Dict[str, Dict] = {}
+
+# References to running job tasks so they are not garbage collected
+_tasks = set()
+
+
+def _prune_jobs() -> None:
+    """Drop finished jobs past their TTL or beyond MAX_FINISHED_BULK_IMPORTS."""
+    now = time.time()
+    finished = sorted(
+        (job for job in _jobs.values() if job["finished_at"] is not None),
+        key=lambda job: job["finished_at"]
+    )
+    excess = len(finished) - MAX_FINISHED_BULK_IMPORTS
+    for index, job in enumerate(finished):
+        if index < excess or now - job["finished_at"] > BULK_IMPORT_JOB_TTL_SECONDS:
+            del _jobs[job["job_id"]]
+
+
+def create_bulk_import(inputs: List[str], scraper: ArxivScraper) -> Dict:
+    """
+    Create a job for a list of arXiv IDs or URLs.
+
+    Inputs are normalized to arXiv IDs; duplicates are dropped and inputs
+    that are not arXiv references are recorded as failed items.
+
+    Args:
+        inputs: arXiv IDs or abs/pdf URLs
+        scraper: Scraper used to parse IDs
+
+    Returns:
+        Job dictionary
+    """
+    items = []
+    seen = set()
+    for value in inputs:
+        arxiv_id = scraper.extract_arxiv_id(value)
+        if arxiv_id in seen:
+            continue
+        item = {
+            "input": value,
+            "arxiv_id": arxiv_id,
+            "arxiv_url": None,
+            "status": ITEM_QUEUED,
+            "paper_id": None,
+            "error": None,
+            "seconds": None,
+        }
+        if arxiv_id is None:
+            item["status"] = ITEM_FAILED
+            item["error"] = "Not an arXiv ID or URL"
+        else:
+            # Keep URLs as given (they are stored on the paper), expand bare IDs
+            item["arxiv_url"] = value.strip() if "arxiv.org" in value else f"https://arxiv.org/abs/{arxiv_id}"
+            seen.add(arxiv_id)
+        items.append(item)
+
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "status": JOB_RUNNING,
+        "total": len(items),
+        "completed": 0,
+        "failed": sum(1 for item in items if item["status"] == ITEM_FAILED),
+        "items": items,
+        "created_at": time.time(),
+        "finished_at": None,
+    }
+    _prune_jobs()
+    _jobs[job["job_id"]] = job
+    return job
+
+
+async def run_bulk_import(job: Dict, ingest: Callable[[str], Tuple[str, Dict]],
+                          concurrency: int = BULK_IMPORT_CONCURRENCY,
+                          on_imported: Optional[Callable[[str, Dict], None]] = None) -> Dict:
+    """
+    Import every queued item of a job, a few at a time.
+
+    Args:
+        job: Job created by create_bulk_import
+        ingest: Blocking function taking an arXiv URL and returning
+            (paper_id, paper_info); run in the threadpool
+        concurrency: Maximum number of papers imported at once
+        on_imported: Called on the event loop with (paper_id, paper_info)
+            after each successful import
+
+    Returns:
+        The finished job dictionary
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+
+    async def import_item(item: Dict) -> None:
+        async with semaphore:
+            item["status"] = ITEM_RUNNING
+            item_start = time.perf_counter()
+            try:
+                paper_id, paper_info = await run_in_threadpool(ingest, item["arxiv_url"])
+                item["paper_id"] = paper_id
+                item["status"] = ITEM_DONE
+                job["completed"] += 1
+                metrics.increment("bulk_import.papers_imported")
+                if on_imported:
+                    on_imported(paper_id, paper_info)
+            except Exception as e:
+                logger.error(f"Bulk import of {item['arxiv_id']} failed: {str(e)}")
+                item["status"] = ITEM_FAILED
+                item["error"] = str(e)
+                job["failed"] += 1
+                metrics.increment("bulk_import.papers_failed")
+            finally:
+                item["seconds"] = round(time.perf_counter() - item_start, 3)
+
+    queued = [item for item in job["items"] if item["status"] == ITEM_QUEUED]
+    await asyncio.gather(*(import_item(item) for item in queued))
+
+    job["status"] = JOB_COMPLETED
+    job["finished_at"] = time.time()
+    metrics.observe("bulk_import.job_seconds", time.perf_counter() - start)
+    logger.info(
+        f"Bulk import {job['job_id']} finished: {job['completed']} imported, {job['failed']} failed"
+    )
+    return job
+
+
+def start_bulk_import(job: Dict, ingest: Callable[[str], Tuple[str, Dict]],
+                      on_imported: Optional[Callable[[str, Dict], None]] = None) -> asyncio.Task:
+    """
+    Run a job in the background. Must be called from the event loop.
+
+    Args:
+        job: Job created by create_bulk_import
+        ingest: Blocking ingest function (see run_bulk_import)
+        on_imported: Callback after each imported paper (see run_bulk_import)
+
+    Returns:
+        Task running the job
+    """
+    task = asyncio.create_task(run_bulk_import(job, ingest, on_imported=on_imported))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+def get_bulk_import(job_id: str) -> Optional[Dict]:
+    """Look up a job by ID (None once a finished job has expired)."""
+    _prune_jobs()
+    return _jobs.get(job_id)
@@ -1,11 +1,39 @@
 import os
 import logging
-from typing import Dict, List, Optional
-import google.generativeai as genai
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional
 from pathlib import Path
+from fastapi.concurrency import run_in_threadpool
+from app.services.context_builder import build_paper_context, estimate_tokens
+from app.services.paper_retrieval import (
+    CHAT_RETRIEVAL_TOKENS,
+    CHAT_RETRIEVAL_TOP_K,
+    get_paper_index,
+    format_passages,
+    find_citations,
+)
+from app.services.metrics import metrics
+from app.services.conversation_store import conversation_store
+from app.services.prompt_prefix import prompt_prefixes
+from app.services.llm_service import agenerate_text, astream_text
+from app.services.structured_output import agenerate_json
+from app.models.artifact_models import StudyAids
+from app.services.gemini_key_pool import ensure_pool_keys
 
 logger = logging.getLogger(__name__)
 
+# Recent exchanges sent with each question, and the characters kept of
+# each earlier answer
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", 3))
+CHAT_HISTORY_ANSWER_CHARS = 600
+
+# Characters of a cited passage returned with an answer
+CITATION_SNIPPET_CHARS = 200
+
+# Quiz and suggested questions generated per paper
+STUDY_AIDS_QUIZ_QUESTIONS = int(os.getenv("STUDY_AIDS_QUIZ_QUESTIONS", 10))
+STUDY_AIDS_SUGGESTIONS = 5
+
 class PaperChatbot:
     """
     AI Chatbot service for helping users understand research papers.
@@ -14,28 +42,29 @@ class PaperChatbot:
     
     def __init__(self):
         """Initialize the chatbot with Gemini API."""
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
+        # Server keys (GEMINI_API_KEY or GEMINI_API_KEY_1..N) are pooled
+        pool_keys = ensure_pool_keys()
+        if not pool_keys:
             raise ValueError("GEMINI_API_KEY environment variable not set")
         
-        genai.configure(api_key=api_key)
+        self.api_key = pool_keys[0]
         # Use gemini-2.5-flash which is fast and efficient
         # This model is available with your API key
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.model_name = 'gemini-2.5-flash'
         
-        # Store conversation history per paper
-        self.conversations: Dict[str, List[Dict]] = {}
-        
-        # Store paper contexts
-        self.paper_contexts: Dict[str, str] = {}
+        # Conversation histories per (owner, paper), persisted to disk
+        self.conversations = conversation_store
     
-    def load_paper_context(self, paper_id: str, paper_info: Dict) -> str:
+    def load_paper_context(self, paper_info: Dict, task: str = "chat") -> str:
         """
         Load the paper content to provide context for the chatbot.
         
+        Contexts are not kept here; the context builder caches them per
+        paper version within its memory bound.
+        
         Args:
-            paper_id: Unique identifier for the paper
             paper_info: Dictionary containing paper information
+            task: Context task whose token budget applies ("chat", "quiz")
             
         Returns:
             String containing the paper context
@@ -51,93 +80,76 @@ class PaperChatbot:
         context += f"Authors: {authors}\n\n"
         
         # Try to read the paper text
-        text_file_path = paper_info.get("text_file_path") or paper_info.get("tex_file_path")
-        
-        if text_file_path and os.path.exists(text_file_path):
-            try:
-                with open(text_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    paper_text = f.read()
-                    # Limit context to avoid token limits (approximately 30k characters)
-                    if len(paper_text) > 30000:
-                        paper_text = paper_text[:30000] + "\n...[Content truncated]"
-                    context += "Paper Content:\n" + paper_text
-            except Exception as e:
-                logger.error(f"Error reading paper text: {str(e)}")
-                context += "Paper content could not be loaded."
-        else:
+        try:
+            # Most relevant sections for the task, within its token budget
+            paper_text = build_paper_context(paper_info, task)
+            context += "Paper Content:\n" + paper_text
+        except FileNotFoundError:
             context += "Paper content is not available in text format."
-        
-        # Store the context
-        self.paper_contexts[paper_id] = context
+        except Exception as e:
+            logger.error(f"Error reading paper text: {str(e)}")
+            context += "Paper content could not be loaded."
         
         return context
     
-    def initialize_conversation(self, paper_id: str, paper_info: Dict):
+    def _prepare_paper(self, paper_id: str, paper_info: Dict):
+        """Build a paper's prompt prefix and retrieval index (blocking; run in a worker thread)."""
+        prompt_prefixes.get_prefix(paper_id, paper_info)
+        # Index the paper now so the first question does not wait for it
+        try:
+            get_paper_index(paper_info)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error indexing paper {paper_id} for chat: {str(e)}")
+    
+    async def initialize_conversation(self, paper_id: str, paper_info: Dict, owner: str):
         """
-        Initialize a new conversation for a paper.
+        Prepare a paper for chat: build its prompt prefix and retrieval index.
+        
+        Reading, chunking and indexing the paper run in a worker thread.
         
         Args:
             paper_id: Unique identifier for the paper
             paper_info: Dictionary containing paper information
+            owner: User or session the conversation belongs to
         """
-        if paper_id not in self.conversations:
-            self.conversations[paper_id] = []
-        
-        # Load paper context if not already loaded
-        if paper_id not in self.paper_contexts:
-            self.load_paper_context(paper_id, paper_info)
+        await run_in_threadpool(self._prepare_paper, paper_id, paper_info)
+        # Load the stored history into memory
+        self.conversations.get_history(owner, paper_id)
     
-    def chat(self, paper_id: str, user_message: str, paper_info: Optional[Dict] = None) -> str:
+    async def chat(self, paper_id: str, user_message: str, paper_info: Optional[Dict] = None,
+                   *, owner: str) -> str:
         """
         Process a user message and generate a response.
         
         Args:
             paper_id: Unique identifier for the paper
             user_message: The user's question or message
-            paper_info: Optional paper information (required for first message)
+            paper_info: Paper information
+            owner: User or session the conversation belongs to
             
         Returns:
             The chatbot's response
         """
         try:
-            # Initialize conversation if needed
-            if paper_id not in self.conversations:
-                if not paper_info:
-                    return "Error: Paper information not provided for new conversation."
-                self.initialize_conversation(paper_id, paper_info)
+            if not paper_info:
+                return "Error: Paper information not provided for new conversation."
             
-            # Get paper context
-            paper_context = self.paper_contexts.get(paper_id, "")
-            
-            # Build the prompt with context and conversation history
-            system_prompt = f"""You are an AI assistant helping users understand a research paper. 
-Your role is to:
-1. Answer questions about the paper's content, methodology, results, and conclusions
-2. Explain complex concepts in simple terms
-3. Help users test their understanding by generating relevant questions
-4. Provide insights and connections to related research areas
-
-Here is the paper information:
-{paper_context}
-
-Please provide helpful, accurate, and educational responses based on this paper."""
-
-            # Build conversation history
-            conversation_history = ""
-            for msg in self.conversations[paper_id][-5:]:  # Keep last 5 exchanges
-                conversation_history += f"\nUser: {msg['user']}\nAssistant: {msg['assistant']}\n"
-            
-            # Create the full prompt
-            full_prompt = f"{system_prompt}\n\n{conversation_history}\nUser: {user_message}\nAssistant:"
+            # Retrieval may read and index the paper: keep it off the event loop
+            full_prompt = await run_in_threadpool(self._build_chat_prompt, paper_id, paper_info, user_message, owner)
             
             # Generate response
-            response = self.model.generate_content(full_prompt)
-            assistant_message = response.text
+            # Chat turns depend on the conversation so far; never cached
+            assistant_message = await agenerate_text(
+                full_prompt, self.api_key, self.model_name, call_site="chatbot.chat", use_cache=False
+            )
             
             # Store in conversation history
-            self.conversations[paper_id].append({
+            self.conversations.append_turn(owner, paper_id, {
                 "user": user_message,
-                "assistant": assistant_message
+                "assistant": assistant_message,
+                "citations": self.get_citations(paper_info, assistant_message)
             })
             
             return assistant_message
@@ -146,220 +158,212 @@ Please provide helpful, accurate, and educational responses based on this paper.
             logger.error(f"Error in chatbot: {str(e)}")
             return f"I apologize, but I encountered an error: {str(e)}. Please try again."
     
-    def generate_quiz_questions(self, paper_id: str, paper_info: Optional[Dict] = None, num_questions: int = 5) -> List[Dict]:
+    async def stream_chat(self, paper_id: str, user_message: str, paper_info: Dict,
+                          owner: str) -> AsyncIterator[str]:
         """
-        Generate quiz questions to test user's understanding of the paper.
+        Process a user message and stream the response as it is generated.
+        
+        The exchange is added to the conversation history only when the
+        response is complete; closing the stream early (client disconnect or
+        cancellation) stops the Gemini call and leaves the history unchanged.
         
         Args:
             paper_id: Unique identifier for the paper
-            paper_info: Optional paper information
-            num_questions: Number of questions to generate
+            user_message: The user's question or message
+            paper_info: Paper information
+            owner: User or session the conversation belongs to
             
-        Returns:
-            List of question dictionaries with questions and answers
+        Yields:
+            Chunks of the chatbot's response
+            
+        Raises:
+            Exception: Errors from the Gemini API are propagated
         """
+        full_prompt = await run_in_threadpool(self._build_chat_prompt, paper_id, paper_info, user_message, owner)
+        
+        parts: List[str] = []
+        # aclosing ends the Gemini stream (and frees its pool key) as soon
+        # as this generator is closed
+        async with aclosing(astream_text(
+            full_prompt, self.api_key, self.model_name, call_site="chatbot.chat_stream", use_cache=False
+        )) as chunks:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        
+        assistant_message = "".join(parts)
+        self.conversations.append_turn(owner, paper_id, {
+            "user": user_message,
+            "assistant": assistant_message,
+            "citations": self.get_citations(paper_info, assistant_message)
+        })
+    
+    def _retrieve_passages(self, paper_info: Dict, history: List[Dict], user_message: str) -> str:
+        """
+        Passages of the paper relevant to a question, formatted for the prompt.
+        
+        The previous question is part of the query so that follow-ups
+        ("what about the second one?") still find their passages.
+        """
+        query = user_message
+        if history:
+            query = f"{history[-1]['user']} {user_message}"
         try:
-            # Initialize conversation if needed
-            if paper_id not in self.conversations:
-                if not paper_info:
-                    return [{"error": "Paper information not provided"}]
-                self.initialize_conversation(paper_id, paper_info)
-            
-            # Get paper context
-            paper_context = self.paper_contexts.get(paper_id, "")
-            
-            prompt = f"""Based on the following research paper, generate {num_questions} quiz questions to test understanding.
-For each question, provide:
-1. The question
-2. Four multiple choice options (A, B, C, D)
-3. The correct answer
-4. A brief explanation
-
-Paper information:
-{paper_context[:15000]}  
-
-Format your response as a JSON-like structure for each question:
-Question 1:
-Q: [question text]
-A) [option A]
-B) [option B]
-C) [option C]
-D) [option D]
-Correct Answer: [A/B/C/D]
-Explanation: [brief explanation]
-
-Generate questions that cover key concepts, methodology, results, and implications."""
-
-            response = self.model.generate_content(prompt)
-            questions_text = response.text
-            
-            # Parse the response into structured questions
-            questions = self._parse_quiz_questions(questions_text)
-            
-            return questions
-            
-        except Exception as e:
-            logger.error(f"Error generating quiz questions: {str(e)}")
-            return [{"error": f"Failed to generate questions: {str(e)}"}]
+            index = get_paper_index(paper_info)
+        except FileNotFoundError:
+            return ""
+        chunks = index.retrieve(query, CHAT_RETRIEVAL_TOKENS, top_k=CHAT_RETRIEVAL_TOP_K)
+        metrics.observe("chatbot.retrieved_chunks", len(chunks))
+        return format_passages(chunks)
     
-    def _parse_quiz_questions(self, text: str) -> List[Dict]:
+    def _build_chat_prompt(self, paper_id: str, paper_info: Dict, user_message: str, owner: str) -> str:
         """
-        Parse the generated quiz questions text into structured format.
+        Build the prompt for one chat turn.
         
         Args:
-            text: Raw text containing quiz questions
+            paper_id: Unique identifier for the paper
+            paper_info: Paper information
+            user_message: The user's question or message
+            owner: User or session the conversation belongs to
             
         Returns:
-            List of question dictionaries
+            Prompt starting with the paper's cached prefix (instructions and
+            digest), followed by the retrieved passages, a short recent
+            history and the question
         """
-        questions = []
-        lines = text.split('\n')
+        history = self.conversations.get_history(owner, paper_id)
+        # Same bytes for every turn, so the provider can reuse its cache
+        prefix = prompt_prefixes.get_prefix(paper_id, paper_info)
+        passages = self._retrieve_passages(paper_info, history, user_message)
         
-        current_question = {}
-        options = []
+        # Build conversation history; long answers are clipped since the
+        # passages are retrieved again for each question
+        conversation_history = ""
+        for msg in history[-CHAT_HISTORY_TURNS:]:
+            answer = msg['assistant']
+            if len(answer) > CHAT_HISTORY_ANSWER_CHARS:
+                answer = answer[:CHAT_HISTORY_ANSWER_CHARS].rsplit(" ", 1)[0] + " [...]"
+            conversation_history += f"\nUser: {msg['user']}\nAssistant: {answer}\n"
         
-        for line in lines:
-            line = line.strip()
-            
-            # Detect question start
-            if line.startswith('Q:') or line.startswith('Question') or (line and line[0].isdigit() and '.' in line[:5]):
-                if current_question and 'question' in current_question and current_question.get('options'):
-                    # Only add if it has options
-                    questions.append(current_question)
-                
-                # Extract question text
-                if ':' in line:
-                    question_text = line.split(':', 1)[-1].strip()
-                elif '.' in line[:5]:
-                    question_text = line.split('.', 1)[-1].strip()
-                else:
-                    question_text = line
-                    
-                current_question = {
-                    'question': question_text,
-                    'options': [],
-                    'correct_answer': '',
-                    'explanation': ''
-                }
-                options = []
-            
-            # Detect options (A), B), C), D) or A., B., C., D.
-            elif line and len(line) > 2 and line[0] in ['A', 'B', 'C', 'D'] and line[1] in [')', '.', ':', ' ']:
-                option_text = line[2:].strip() if line[1] != ' ' else line[1:].strip()
-                options.append(option_text)
-                current_question['options'] = options
-            
-            # Detect correct answer
-            elif 'correct answer' in line.lower():
-                answer = line.split(':', 1)[-1].strip() if ':' in line else line.split()[-1]
-                # Extract just the letter A, B, C, or D
-                for char in answer:
-                    if char in ['A', 'B', 'C', 'D']:
-                        current_question['correct_answer'] = char
-                        break
-            
-            # Detect explanation
-            elif line.startswith('Explanation:') or line.startswith('Exp:'):
-                explanation = line.split(':', 1)[-1].strip()
-                current_question['explanation'] = explanation
-        
-        # Add the last question if valid
-        if current_question and 'question' in current_question and current_question.get('options'):
-            questions.append(current_question)
-        
-        # Filter out invalid questions and ensure all have required fields
-        valid_questions = []
-        for q in questions:
-            if (q.get('question') and 
-                q.get('options') and 
-                len(q.get('options', [])) >= 4 and
-                q.get('correct_answer')):
-                valid_questions.append(q)
-        
-        logger.info(f"Parsed {len(valid_questions)} valid quiz questions out of {len(questions)} total")
-        return valid_questions
+        # Create the full prompt
+        full_prompt = (
+            f"{prefix.text}\n\n"
+            f"Passages from the paper relevant to the question, each with its id:\n"
+            f"{passages or '(no matching passages)'}\n\n"
+            f"{conversation_history}\nUser: {user_message}\nAssistant:"
+        )
+        metrics.observe("chatbot.prompt_tokens", estimate_tokens(full_prompt))
+        metrics.observe("chatbot.prompt_new_tokens", estimate_tokens(full_prompt) - prefix.tokens)
+        return full_prompt
     
-    def get_conversation_history(self, paper_id: str) -> List[Dict]:
+    def get_citations(self, paper_info: Dict, text: str) -> List[Dict]:
         """
-        Get the conversation history for a paper.
+        Passages cited in an answer.
         
         Args:
-            paper_id: Unique identifier for the paper
+            paper_info: Paper information
+            text: The chatbot's answer
             
         Returns:
-            List of conversation messages
+            List of citation dictionaries (id, section, snippet); ids that
+            match no passage are left out
         """
-        return self.conversations.get(paper_id, [])
+        chunk_ids = find_citations(text)
+        if not chunk_ids:
+            return []
+        try:
+            index = get_paper_index(paper_info)
+        except FileNotFoundError:
+            return []
+        citations = []
+        for chunk_id in chunk_ids:
+            chunk = index.get_chunk(chunk_id)
+            if chunk is None:
+                continue
+            snippet = chunk["text"][:CITATION_SNIPPET_CHARS]
+            if len(chunk["text"]) > CITATION_SNIPPET_CHARS:
+                snippet = snippet.rsplit(" ", 1)[0].rstrip(".,;:") + "..."
+            citations.append({"id": chunk_id, "section": chunk["section"], "snippet": snippet})
+        return citations
     
-    def clear_conversation(self, paper_id: str):
+    async def generate_study_aids(self, paper_id: str, paper_info: Dict,
+                                  num_questions: int = STUDY_AIDS_QUIZ_QUESTIONS,
+                                  num_suggestions: int = STUDY_AIDS_SUGGESTIONS) -> Dict:
         """
-        Clear the conversation history for a paper.
+        Generate quiz questions and suggested questions in one structured call.
         
         Args:
             paper_id: Unique identifier for the paper
+            paper_info: Dictionary containing paper information
+            num_questions: Number of quiz questions
+            num_suggestions: Number of suggested questions
+            
+        Returns:
+            Dictionary with "quiz" (question, options, correct_answer,
+            explanation) and "suggested_questions"
+            
+        Raises:
+            StructuredOutputError: If no valid JSON could be generated
+            Exception: Errors from the Gemini API are propagated
         """
-        if paper_id in self.conversations:
-            self.conversations[paper_id] = []
+        # Shared paper prefix, then the sections a quiz draws on; both may
+        # read the paper, so they are built in a worker thread
+        prefix = await run_in_threadpool(prompt_prefixes.get_prefix, paper_id, paper_info)
+        paper_context = await run_in_threadpool(self.load_paper_context, paper_info, "quiz")
+        
+        prompt = f"""{prefix.text}
+
+More of the paper:
+{paper_context}
+
+Based on this research paper, create study aids for a reader:
+1. {num_questions} multiple choice quiz questions that test understanding of key concepts, methodology, results, and implications. Each has exactly four options, the letter of the correct option and a brief explanation.
+2. {num_suggestions} interesting and relevant questions a reader might want to ask to better understand the paper.
+
+Return ONLY a JSON object in this format:
+{{
+  "quiz": [
+    {{
+      "question": "Question text",
+      "options": ["Option A", "Option B", "Option C", "Option D"],
+      "correct_answer": "A",
+      "explanation": "Why A is correct"
+    }}
+  ],
+  "suggested_questions": ["Question 1", "Question 2"]
+}}
+
+Do not prefix options with letters."""
+
+        study_aids = await agenerate_json(
+            prompt, self.api_key, StudyAids, self.model_name, call_site="chatbot.study_aids"
+        )
+        result = study_aids.model_dump()
+        result["suggested_questions"] = result["suggested_questions"][:num_suggestions]
+        return result
     
-    def suggest_questions(self, paper_id: str, paper_info: Optional[Dict] = None) -> List[str]:
+    def get_conversation_history(self, paper_id: str, owner: str) -> List[Dict]:
         """
-        Suggest relevant questions the user might want to ask about the paper.
+        Get the conversation history for a paper.
         
         Args:
             paper_id: Unique identifier for the paper
-            paper_info: Optional paper information
+            owner: User or session the conversation belongs to
             
         Returns:
-            List of suggested questions
+            List of conversation messages
         """
-        try:
-            # Initialize conversation if needed
-            if paper_id not in self.conversations:
-                if not paper_info:
-                    return ["What is the main contribution of this paper?"]
-                self.initialize_conversation(paper_id, paper_info)
-            
-            # Get paper context
-            paper_context = self.paper_contexts.get(paper_id, "")
-            
-            prompt = f"""Based on this research paper, suggest 5 interesting and relevant questions that a reader might want to ask to better understand the paper.
-
-Paper information:
-{paper_context[:10000]}
-
-Provide 5 questions, one per line, without numbering."""
-
-            response = self.model.generate_content(prompt)
-            questions_text = response.text
-            
-            # Parse questions
-            questions = [q.strip() for q in questions_text.split('\n') if q.strip() and not q.strip().startswith('#')]
-            
-            # Remove numbering if present
-            cleaned_questions = []
-            for q in questions[:5]:
-                # Remove leading numbers like "1.", "1)", etc.
-                import re
-                cleaned = re.sub(r'^\d+[\.\)]\s*', '', q)
-                cleaned_questions.append(cleaned)
-            
-            return cleaned_questions if cleaned_questions else [
-                "What is the main contribution of this paper?",
-                "What methodology was used in this research?",
-                "What are the key findings?",
-                "What are the limitations of this study?",
-                "How does this work compare to previous research?"
-            ]
-            
-        except Exception as e:
-            logger.error(f"Error suggesting questions: {str(e)}")
-            return [
-                "What is the main contribution of this paper?",
-                "What methodology was used in this research?",
-                "What are the key findings?",
-                "What are the limitations of this study?",
-                "How does this work compare to previous research?"
-            ]
+        return self.conversations.get_history(owner, paper_id)
+    
+    def clear_conversation(self, paper_id: str, owner: str):
+        """
+        Clear the conversation history for a paper.
+        
+        Args:
+            paper_id: Unique identifier for the paper
+            owner: User or session the conversation belongs to
+        """
+        self.conversations.clear(owner, paper_id)
 
 
 # Global chatbot instance
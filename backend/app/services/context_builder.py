@@ -0,0 +1,336 @@
+"""
+Context Builder Service
+Builds the paper excerpt sent to the model for each generation task: picks
+sections from the section index by task priority, fits them into a token
+budget by shortening or dropping the rest, and caches the result
+"""
+
+import os
+import re
+import math
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.services.paper_text import get_paper_text, get_paper_source_path
+from app.services.section_index import build_section_index_from_text, load_section_index
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Rough token estimate for English prose; good enough to size prompts
+CHARS_PER_TOKEN = 4
+
+# Sections that would get fewer tokens than this are dropped, not shortened
+MIN_SECTION_TOKENS = 60
+
+# Built contexts kept in memory (one per paper, task and budget), bounded by
+# count and by total size
+CONTEXT_CACHE_ENTRIES = int(os.getenv("CONTEXT_CACHE_ENTRIES", 256))
+CONTEXT_CACHE_MAX_BYTES = int(os.getenv("CONTEXT_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# Text before the first heading: title, authors and usually the abstract
+FRONT_MATTER = "Front Matter"
+
+# Weight for numbered headings that match no canonical section
+# ("3 Proposed Model"); these are mostly the body of the method
+UNNAMED_SECTION_WEIGHT = 0.5
+
+# Per task: token budget and how much each section matters (0 drops it).
+# Generator budgets match the character limits they used to slice with.
+TASK_PROFILES: Dict[str, Dict] = {
+    "summary": {
+        "budget": 3750,
+        "weights": {FRONT_MATTER: 1.0, "Abstract": 1.0, "Introduction": 0.7, "Related Work": 0.2,
+                    "Methodology": 0.6, "Results": 0.9, "Discussion": 0.6, "Conclusion": 0.9},
+    },
+    "mindmap": {
+        "budget": 3750,
+        "weights": {FRONT_MATTER: 1.0, "Abstract": 1.0, "Introduction": 0.6, "Related Work": 0.4,
+                    "Methodology": 0.9, "Results": 0.8, "Discussion": 0.5, "Conclusion": 0.7},
+    },
+    "reel": {
+        "budget": 2000,
+        "weights": {FRONT_MATTER: 1.0, "Abstract": 1.0, "Introduction": 0.5,
+                    "Methodology": 0.2, "Results": 0.8, "Discussion": 0.3, "Conclusion": 0.8},
+    },
+    "poster": {
+        "budget": 3000,
+        "weights": {FRONT_MATTER: 1.0, "Abstract": 1.0, "Introduction": 0.6, "Related Work": 0.1,
+                    "Methodology": 0.8, "Results": 1.0, "Discussion": 0.5, "Conclusion": 0.8},
+    },
+    "podcast": {
+        "budget": 3000,
+        "weights": {FRONT_MATTER: 1.0, "Abstract": 1.0, "Introduction": 0.8, "Related Work": 0.3,
+                    "Methodology": 0.6, "Results": 0.8, "Discussion": 0.7, "Conclusion": 0.8},
+    },
+    "quiz": {
+        "budget": 3750,
+        "weights": {FRONT_MATTER: 0.8, "Abstract": 0.8, "Introduction": 0.6, "Related Work": 0.3,
+                    "Methodology": 0.9, "Results": 1.0, "Discussion": 0.6, "Conclusion": 0.7},
+    },
+    # Chat sends this overview with every turn; passages relevant to the
+    # question come from the retrieval index (see paper_retrieval)
+    "chat": {
+        "budget": 800,
+        "weights": {FRONT_MATTER: 1.0, "Abstract": 1.0, "Introduction": 0.3, "Conclusion": 0.6},
+    },
+}
+TASK_PROFILES["audio_summary"] = TASK_PROFILES["summary"]
+
+_SENTENCE_END = re.compile(r"[.!?](?=\s)|\n")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate number of model tokens in a text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def get_paper_section_index(paper_info: Dict, text: str) -> Dict:
+    """Section index whose offsets match the paper text, built if missing or stale."""
+    text_file_path = paper_info.get("text_file_path")
+    if text_file_path and get_paper_source_path(paper_info) == text_file_path:
+        index = load_section_index(text_file_path)
+        if index and index.get("text_length") == len(text):
+            return index
+    return build_section_index_from_text(text)
+
+
+def _split_sections(text: str, index: Dict) -> List[Dict]:
+    """
+    Split the text into top-level sections covering the whole document.
+
+    Subsections stay inside their parent; text before the first heading
+    becomes the front matter section.
+    """
+    headings = sorted(index.get("sections", []), key=lambda s: s["start"])
+    top_level = []
+    covered_until = 0
+    for heading in headings:
+        if heading["start"] < covered_until:
+            continue
+        top_level.append(heading)
+        covered_until = heading["end"]
+
+    sections = []
+    first_start = top_level[0]["start"] if top_level else len(text)
+    if text[:first_start].strip():
+        sections.append({"title": None, "name": FRONT_MATTER, "body": text[:first_start]})
+    for heading in top_level:
+        sections.append({
+            "title": heading["title"],
+            "name": heading["name"],
+            "body": text[heading["body_start"]:heading["end"]],
+        })
+    return sections
+
+
+def _allocate(sizes: List[int], weights: List[float], budget: int) -> List[int]:
+    """
+    Share a character budget among sections in proportion to their weights.
+
+    Sections smaller than their share get their full size and the rest is
+    shared again among the remaining sections.
+    """
+    allotted = [0] * len(sizes)
+    active = [i for i, weight in enumerate(weights) if weight > 0 and sizes[i] > 0]
+    remaining = budget
+    while active and remaining > 0:
+        total_weight = sum(weights[i] for i in active)
+        shares = {i: remaining * weights[i] / total_weight for i in active}
+        fits = [i for i in active if sizes[i] <= shares[i]]
+        if not fits:
+            for i in active:
+                allotted[i] = int(shares[i])
+            break
+        for i in fits:
+            allotted[i] = sizes[i]
+            remaining -= sizes[i]
+            active.remove(i)
+    return allotted
+
+
+def _compress(body: str, max_chars: int) -> str:
+    """Keep the leading sentences of a section that fit in max_chars."""
+    body = _BLANK_LINES.sub("\n\n", body.strip())
+    if len(body) <= max_chars:
+        return body
+    cut = max_chars
+    for match in _SENTENCE_END.finditer(body, 0, max_chars):
+        cut = match.end()
+    # No sentence boundary in the second half: cut mid-sentence
+    if cut < max_chars // 2:
+        cut = max_chars
+    return body[:cut].rstrip() + " [...]"
+
+
+def plan_context(text: str, index: Dict, task: str, max_tokens: Optional[int] = None) -> List[Dict]:
+    """
+    Decide how much of each section goes into a task's context.
+
+    Args:
+        text: Full paper text the index was built from
+        index: Section index dictionary
+        task: Task name (a key of TASK_PROFILES)
+        max_tokens: Token budget (default: the task's budget)
+
+    Returns:
+        Sections in document order with title, name, tokens, allotted
+        tokens and mode ("full", "compressed" or "dropped")
+
+    Raises:
+        ValueError: If the task is unknown
+    """
+    if task not in TASK_PROFILES:
+        raise ValueError(f"Unknown context task: {task}")
+    profile = TASK_PROFILES[task]
+    budget = (max_tokens or profile["budget"]) * CHARS_PER_TOKEN
+
+    sections = _split_sections(text, index)
+    sizes = []
+    for section in sections:
+        heading = len(section["title"]) + 1 if section["title"] else 0
+        sizes.append(len(section["body"].strip()) + heading)
+    weights = [
+        profile["weights"].get(s["name"], 0.0) if s["name"] else UNNAMED_SECTION_WEIGHT
+        for s in sections
+    ]
+    allotted = _allocate(sizes, weights, budget)
+
+    plan = []
+    for section, size, chars in zip(sections, sizes, allotted):
+        if chars >= size:
+            mode = "full"
+        elif chars >= MIN_SECTION_TOKENS * CHARS_PER_TOKEN:
+            mode = "compressed"
+        else:
+            mode = "dropped"
+        plan.append({
+            "title": section["title"],
+            "name": section["name"],
+            "body": section["body"],
+            "tokens": math.ceil(size / CHARS_PER_TOKEN),
+            "allotted": math.ceil(chars / CHARS_PER_TOKEN) if mode != "dropped" else 0,
+            "mode": mode,
+        })
+    return plan
+
+
+def render_context(plan: List[Dict]) -> str:
+    """Join the planned sections into one context string."""
+    parts = []
+    for section in plan:
+        if section["mode"] == "dropped":
+            continue
+        max_chars = section["allotted"] * CHARS_PER_TOKEN
+        if section["title"]:
+            max_chars -= len(section["title"]) + 1
+        body = _compress(section["body"], max_chars)
+        parts.append(f"{section['title']}\n{body}" if section["title"] else body)
+    return "\n\n".join(parts)
+
+
+class ContextCache:
+    """LRU cache of built contexts keyed by source file version, task and budget."""
+
+    def __init__(self, max_entries: int = CONTEXT_CACHE_ENTRIES, max_bytes: int = CONTEXT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (context, size in bytes), least recently used first
+        self._entries: "OrderedDict[Tuple, Tuple[str, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Tuple, context: str) -> None:
+        size = len(context.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._entries[key] = (context, size)
+            self._total_bytes += size
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Entry count and bytes used."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Global context cache
+context_cache = ContextCache()
+
+
+def build_paper_context(paper_info: Dict, task: str, max_tokens: Optional[int] = None) -> str:
+    """
+    Get the excerpt of a paper that fits a task's token budget.
+
+    Short papers are returned whole. Longer ones keep the sections that
+    matter most for the task, shortened to their leading sentences when the
+    budget is tight, and drop the rest (references, acknowledgments, ...).
+
+    Args:
+        paper_info: Dictionary containing paper information
+        task: Task name (a key of TASK_PROFILES)
+        max_tokens: Token budget (default: the task's budget)
+
+    Returns:
+        Context text for the prompt
+
+    Raises:
+        FileNotFoundError: If the paper has no readable text source
+        ValueError: If the task is unknown
+    """
+    if task not in TASK_PROFILES:
+        raise ValueError(f"Unknown context task: {task}")
+    path = get_paper_source_path(paper_info)
+    if not path:
+        raise FileNotFoundError("Paper text file not found")
+
+    stat = os.stat(path)
+    budget = max_tokens or TASK_PROFILES[task]["budget"]
+    # mtime and size in the key invalidate entries when a file is rewritten
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, task, budget)
+    context = context_cache.get(key)
+    if context is not None:
+        metrics.increment("paper_context.cache_hits")
+        return context
+
+    metrics.increment("paper_context.cache_misses")
+    text = get_paper_text(paper_info)
+    if estimate_tokens(text) <= budget:
+        context = text
+    else:
+        plan = plan_context(text, get_paper_section_index(paper_info, text), task, budget)
+        context = render_context(plan)
+        logger.debug(
+            f"Context for {task}: " + ", ".join(
+                f"{s['title'] or s['name']}={s['mode']}" for s in plan
+            )
+        )
+    context_cache.put(key, context)
+    return context
@@ -0,0 +1,262 @@
+"""
+Conversation Store
+Chat histories keyed by (owner, paper): persisted to disk as one JSON file
+per conversation, with a bounded LRU of active conversations in memory
+that are dropped after an idle period and reloaded on next use. Files
+unused for the retention period are deleted by a periodic sweep
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_DIR = os.getenv("CONVERSATION_DIR", "temp/conversations")
+
+# Conversations kept in memory; the least recently used are dropped first
+CONVERSATION_MAX_ACTIVE = int(os.getenv("CONVERSATION_MAX_ACTIVE", 1000))
+
+# Conversations unused for this long are dropped from memory
+CONVERSATION_IDLE_SECONDS = int(os.getenv("CONVERSATION_IDLE_SECONDS", 30 * 60))
+
+# Conversations unused for this long are deleted from disk
+CONVERSATION_RETENTION_SECONDS = int(os.getenv("CONVERSATION_RETENTION_SECONDS", 30 * 24 * 3600))
+
+# Turns kept per conversation (prompts only use the most recent ones)
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", 50))
+
+# Minimum time between two idle sweeps
+IDLE_SWEEP_INTERVAL_SECONDS = 60
+
+# Time between two sweeps of expired conversation files
+RETENTION_SWEEP_INTERVAL_SECONDS = 3600
+
+ConversationKey = Tuple[str, str]
+
+
+class ConversationStore:
+    """Per (owner, paper) chat histories, persistent and bounded in memory."""
+
+    def __init__(self, storage_dir: str = CONVERSATION_DIR, max_active: int = CONVERSATION_MAX_ACTIVE,
+                 idle_seconds: int = CONVERSATION_IDLE_SECONDS,
+                 retention_seconds: int = CONVERSATION_RETENTION_SECONDS,
+                 max_turns: int = CONVERSATION_MAX_TURNS):
+        self.storage_dir = storage_dir
+        self.max_active = max_active
+        self.idle_seconds = idle_seconds
+        self.retention_seconds = retention_seconds
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+        # (owner, paper_id) -> {"turns": [...], "last_used": monotonic time}
+        self._active: "OrderedDict[ConversationKey, Dict[str, Any]]" = OrderedDict()
+        self._last_sweep = time.monotonic()
+
+    def _path(self, key: ConversationKey) -> str:
+        digest = hashlib.sha256(f"{key[0]}\0{key[1]}".encode("utf-8")).hexdigest()
+        return os.path.join(self.storage_dir, digest[:2], f"{digest}.json")
+
+    def _load(self, key: ConversationKey) -> List[Dict]:
+        """Turns stored on disk, or [] for a new or expired conversation."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading conversation {key}: {str(e)}")
+            return []
+        if time.time() - data.get("updated_at", 0) > self.retention_seconds:
+            self._delete_file(key)
+            return []
+        return data.get("turns", [])
+
+    def _save(self, key: ConversationKey, turns: List[Dict]) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "owner": key[0],
+                "paper_id": key[1],
+                "updated_at": time.time(),
+                "turns": turns,
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _delete_file(self, key: ConversationKey) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _entry(self, key: ConversationKey) -> Dict[str, Any]:
+        """Active entry for a conversation, loaded from disk if needed (caller holds the lock)."""
+        now = time.monotonic()
+        if now - self._last_sweep >= IDLE_SWEEP_INTERVAL_SECONDS:
+            self._evict_idle(now)
+
+        entry = self._active.get(key)
+        if entry is None:
+            metrics.increment("conversations.loads")
+            entry = {"turns": self._load(key)}
+            self._active[key] = entry
+            while len(self._active) > self.max_active:
+                self._active.popitem(last=False)
+                metrics.increment("conversations.evicted_lru")
+        self._active.move_to_end(key)
+        entry["last_used"] = now
+        return entry
+
+    def _evict_idle(self, now: float) -> int:
+        """Drop idle conversations from memory (caller holds the lock)."""
+        self._last_sweep = now
+        idle = [key for key, entry in self._active.items() if now - entry["last_used"] > self.idle_seconds]
+        for key in idle:
+            del self._active[key]
+        if idle:
+            metrics.increment("conversations.evicted_idle", len(idle))
+        return len(idle)
+
+    def get_history(self, owner: str, paper_id: str) -> List[Dict]:
+        """
+        Turns of a conversation, oldest first.
+
+        Args:
+            owner: User or session the conversation belongs to
+            paper_id: Unique identifier for the paper
+
+        Returns:
+            List of turn dictionaries (a copy)
+        """
+        with self._lock:
+            return list(self._entry((owner, paper_id))["turns"])
+
+    def append_turn(self, owner: str, paper_id: str, turn: Dict) -> None:
+        """
+        Add a turn to a conversation and write it to disk.
+
+        Args:
+            owner: User or session the conversation belongs to
+            paper_id: Unique identifier for the paper
+            turn: Turn dictionary (user, assistant, citations)
+        """
+        key = (owner, paper_id)
+        with self._lock:
+            entry = self._entry(key)
+            entry["turns"] = (entry["turns"] + [turn])[-self.max_turns:]
+            try:
+                self._save(key, entry["turns"])
+            except OSError as e:
+                logger.error(f"Error saving conversation {key}: {str(e)}")
+
+    def clear(self, owner: str, paper_id: str) -> None:
+        """
+        Delete a conversation from memory and disk.
+
+        Args:
+            owner: User or session the conversation belongs to
+            paper_id: Unique identifier for the paper
+        """
+        key = (owner, paper_id)
+        with self._lock:
+            self._active.pop(key, None)
+            self._delete_file(key)
+
+    def evict_idle(self) -> int:
+        """Drop conversations idle longer than idle_seconds from memory; returns how many."""
+        with self._lock:
+            return self._evict_idle(time.monotonic())
+
+    def delete_expired(self) -> int:
+        """
+        Delete conversation files unused for retention_seconds.
+
+        Every saved turn rewrites its file, so the file's mtime is the last
+        time the conversation was used. Runs without the lock: it only
+        touches files, and an expired conversation is long gone from memory.
+
+        Returns:
+            Number of deleted files
+        """
+        cutoff = time.time() - self.retention_seconds
+        deleted = 0
+        for root, _, files in os.walk(self.storage_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        deleted += 1
+                except OSError:
+                    continue
+        if deleted:
+            metrics.increment("conversations.expired_files", deleted)
+            logger.info(f"Deleted {deleted} expired conversation files")
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        """Active conversation count and limits."""
+        with self._lock:
+            return {
+                "active": len(self._active),
+                "max_active": self.max_active,
+                "idle_seconds": self.idle_seconds,
+                "max_turns": self.max_turns,
+            }
+
+
+# Global conversation store
+conversation_store = ConversationStore()
+
+# Periodic retention sweep, kept referenced while it runs
+_sweep_task: Optional["asyncio.Task[None]"] = None
+
+
+async def _sweep_expired_conversations() -> None:
+    while True:
+        try:
+            await run_in_threadpool(conversation_store.delete_expired)
+        except Exception as e:
+            logger.error(f"Error deleting expired conversations: {str(e)}")
+        await asyncio.sleep(RETENTION_SWEEP_INTERVAL_SECONDS)
+
+
+def start_conversation_sweeps() -> None:
+    """Delete expired conversation files now and then hourly. Must be called from the event loop."""
+    global _sweep_task
+    if _sweep_task is None or _sweep_task.done():
+        _sweep_task = asyncio.create_task(_sweep_expired_conversations())
+
+
+def get_conversation_owner(user: Optional[Dict], session_id: Optional[str] = None) -> str:
+    """
+    Owner key for conversations: the signed-in user, else the client session.
+
+    Args:
+        user: Authenticated user (token payload) or None
+        session_id: Client session id from the X-Session-Id header or cookie
+
+    Returns:
+        Owner string ("user:<id>" or "session:<id>")
+
+    Raises:
+        ValueError: If there is neither a user nor a session id; clients
+            without one are issued a session id instead of sharing a history
+    """
+    if user and user.get("id"):
+        return f"user:{user['id']}"
+    if session_id:
+        return f"session:{session_id}"
+    raise ValueError("A signed-in user or a session id is required to own a conversation")
@@ -0,0 +1,83 @@
+"""
+Gemini Client Registry
+Holds one async Gemini client per API key and one model per (API key, model
+name), so requests reuse connections and never touch the process-wide
+genai.configure state. Clients are kept per event loop, since their gRPC
+channels are bound to the loop that created them
+"""
+
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Dict
+
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+from google.api_core import client_options as client_options_lib
+from google.api_core import gapic_v1
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "genai-py"
+
+
+class GeminiClientRegistry:
+    """Thread-safe cache of Gemini service clients and models keyed by API key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Event loop -> {(api_key, model_name): model with an async client}
+        self._async_models: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @staticmethod
+    def _client_kwargs(api_key: str) -> Dict:
+        return {
+            "client_options": client_options_lib.ClientOptions(api_key=api_key),
+            "client_info": gapic_v1.client_info.ClientInfo(user_agent=f"{USER_AGENT}/{genai.__version__}"),
+        }
+
+    def get_async_model(self, api_key: str, model_name: str) -> genai.GenerativeModel:
+        """
+        Model bound to an API key's async client on the running event loop.
+
+        One async client per API key is shared by that loop's models. Must be
+        called from a coroutine.
+
+        Args:
+            api_key: Gemini API key
+            model_name: Gemini model name
+
+        Returns:
+            GenerativeModel whose generate_content_async uses this key only
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            loop_models = self._async_models.setdefault(loop, {})
+            model = loop_models.get((api_key, model_name))
+            if model is not None:
+                return model
+            client = loop_models.get(api_key)
+            if client is None:
+                client = glm.GenerativeServiceAsyncClient(**self._client_kwargs(api_key))
+                loop_models[api_key] = client
+            model = genai.GenerativeModel(model_name)
+            # The SDK falls back to the global default client when this is unset
+            model._async_client = client
+            loop_models[(api_key, model_name)] = model
+            return model
+
+    def stats(self) -> Dict[str, int]:
+        """Number of cached clients and models."""
+        with self._lock:
+            async_entries = [entry for models in self._async_models.values() for entry in models]
+            return {
+                "async_clients": sum(1 for entry in async_entries if isinstance(entry, str)),
+                "async_models": sum(1 for entry in async_entries if isinstance(entry, tuple)),
+            }
+
+
+# Global Gemini client registry
+gemini_clients = GeminiClientRegistry()
@@ -0,0 +1,204 @@
+"""
+Gemini Key Pool
+Spreads Gemini calls over every configured server key, cools down keys that
+hit their rate limit and keeps per-key usage counters
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STRATEGY_ROUND_ROBIN = "round_robin"
+STRATEGY_LEAST_LOADED = "least_loaded"
+
+GEMINI_KEY_STRATEGY = os.getenv("GEMINI_KEY_STRATEGY", STRATEGY_LEAST_LOADED)
+
+# Cooldown after a 429 doubles with each consecutive one, up to the maximum
+RATE_LIMIT_BASE_COOLDOWN = float(os.getenv("GEMINI_RATE_LIMIT_COOLDOWN", 2.0))
+RATE_LIMIT_MAX_COOLDOWN = float(os.getenv("GEMINI_RATE_LIMIT_MAX_COOLDOWN", 60.0))
+
+
+def mask_key(api_key: str) -> str:
+    """Printable form of a key (last four characters only)."""
+    return f"...{api_key[-4:]}" if len(api_key) > 4 else "..."
+
+
+class GeminiKeyPool:
+    """Thread-safe pool of API keys with load balancing and 429 backoff."""
+
+    def __init__(self, strategy: str = GEMINI_KEY_STRATEGY,
+                 base_cooldown: float = RATE_LIMIT_BASE_COOLDOWN,
+                 max_cooldown: float = RATE_LIMIT_MAX_COOLDOWN):
+        self.strategy = strategy
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._keys: List[str] = []
+        self._state: Dict[str, Dict] = {}
+        self._next_index = 0
+
+    def set_keys(self, api_keys: List[str]) -> None:
+        """Use these keys, keeping the counters of keys already in the pool."""
+        with self._lock:
+            self._keys = list(dict.fromkeys(k for k in api_keys if k))
+            for api_key in self._keys:
+                self._state.setdefault(api_key, {
+                    "in_flight": 0,
+                    "requests": 0,
+                    "successes": 0,
+                    "errors": 0,
+                    "rate_limited": 0,
+                    "consecutive_rate_limits": 0,
+                    "cooldown_until": 0.0,
+                    "total_seconds": 0.0,
+                })
+            self._state = {k: v for k, v in self._state.items() if k in self._keys}
+
+    def keys(self) -> List[str]:
+        """Keys in the pool, in configuration order."""
+        with self._lock:
+            return list(self._keys)
+
+    def __contains__(self, api_key: str) -> bool:
+        with self._lock:
+            return api_key in self._state
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._keys)
+
+    async def acquire_async(self) -> str:
+        """
+        Pick a key for one call and count it as in flight.
+
+        Keys cooling down after a 429 are skipped; if every key is cooling
+        down, this waits for the first one to become available without
+        blocking the event loop.
+
+        Returns:
+            API key to use; pass it back to release()
+
+        Raises:
+            RuntimeError: If the pool has no keys
+        """
+        while True:
+            api_key, wait = self._try_acquire()
+            if api_key:
+                return api_key
+            logger.warning(f"All Gemini keys are rate limited; waiting {wait:.1f}s")
+            await asyncio.sleep(wait)
+
+    def _try_acquire(self) -> Tuple[Optional[str], float]:
+        """Take an available key, or return how long until one cools down."""
+        with self._lock:
+            if not self._keys:
+                raise RuntimeError("Gemini key pool is empty")
+            now = time.monotonic()
+            available = [k for k in self._keys if self._state[k]["cooldown_until"] <= now]
+            if available:
+                api_key = self._choose(available)
+                state = self._state[api_key]
+                state["in_flight"] += 1
+                state["requests"] += 1
+                return api_key, 0.0
+            wait = min(self._state[k]["cooldown_until"] for k in self._keys) - now
+            return None, max(wait, 0.01)
+
+    def _choose(self, available: List[str]) -> str:
+        """Pick among available keys (caller holds the lock)."""
+        if self.strategy == STRATEGY_ROUND_ROBIN:
+            for _ in range(len(self._keys)):
+                api_key = self._keys[self._next_index % len(self._keys)]
+                self._next_index += 1
+                if api_key in available:
+                    return api_key
+        # Least loaded; ties go to the key used least overall
+        return min(available, key=lambda k: (self._state[k]["in_flight"], self._state[k]["requests"]))
+
+    def release(self, api_key: str, seconds: float = 0.0, rate_limited: bool = False,
+                error: bool = False) -> None:
+        """
+        Record the outcome of a call made with an acquired key.
+
+        Args:
+            api_key: Key returned by acquire_async()
+            seconds: Duration of the call
+            rate_limited: Whether the API answered 429 (starts a cooldown)
+            error: Whether the call failed for another reason
+        """
+        with self._lock:
+            state = self._state.get(api_key)
+            if state is None:
+                return
+            state["in_flight"] = max(0, state["in_flight"] - 1)
+            state["total_seconds"] += seconds
+            if rate_limited:
+                state["rate_limited"] += 1
+                state["consecutive_rate_limits"] += 1
+                cooldown = min(
+                    self.base_cooldown * 2 ** (state["consecutive_rate_limits"] - 1),
+                    self.max_cooldown
+                )
+                state["cooldown_until"] = time.monotonic() + cooldown
+                logger.warning(f"Gemini key {mask_key(api_key)} rate limited; cooling down {cooldown:.0f}s")
+            elif error:
+                state["errors"] += 1
+            else:
+                state["successes"] += 1
+                state["consecutive_rate_limits"] = 0
+
+    def usage(self) -> Dict:
+        """Per-key counters with masked keys."""
+        with self._lock:
+            now = time.monotonic()
+            keys = []
+            for index, api_key in enumerate(self._keys, 1):
+                state = self._state[api_key]
+                completed = state["requests"] - state["in_flight"]
+                keys.append({
+                    "index": index,
+                    "key": mask_key(api_key),
+                    "in_flight": state["in_flight"],
+                    "requests": state["requests"],
+                    "successes": state["successes"],
+                    "errors": state["errors"],
+                    "rate_limited": state["rate_limited"],
+                    "cooling_down_for": round(max(0.0, state["cooldown_until"] - now), 1),
+                    "avg_seconds": state["total_seconds"] / completed if completed else 0.0,
+                })
+            return {"strategy": self.strategy, "keys": keys}
+
+
+# Global Gemini key pool (filled from GEMINI_API_KEY_1..N by get_api_keys)
+gemini_key_pool = GeminiKeyPool()
+
+
+def discover_env_keys() -> List[str]:
+    """Server Gemini keys from GEMINI_API_KEY_1..N, or GEMINI_API_KEY."""
+    gemini_keys = []
+    i = 1
+    while True:
+        key = os.getenv(f"GEMINI_API_KEY_{i}")
+        if key:
+            gemini_keys.append(key)
+            i += 1
+        else:
+            break
+    # Fallback to GEMINI_API_KEY if no numbered keys found
+    if not gemini_keys:
+        key = os.getenv("GEMINI_API_KEY")
+        if key:
+            gemini_keys.append(key)
+    return gemini_keys
+
+
+def ensure_pool_keys() -> List[str]:
+    """Fill the global pool from the environment if it is still empty."""
+    if not len(gemini_key_pool):
+        gemini_key_pool.set_keys(discover_env_keys())
+    return gemini_key_pool.keys()
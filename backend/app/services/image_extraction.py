@@ -0,0 +1,97 @@
+"""
+Image Extraction Stage
+Runs PDF image extraction after upload, in the background, and lets the
+routes that need images wait for it on demand
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.pdf_processor import extract_images_from_pdf_file
+from app.services.storage_manager import storage_manager
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Image stage states stored under paper_info["images_status"]
+IMAGES_PENDING = "pending"
+IMAGES_READY = "ready"
+IMAGES_FAILED = "failed"
+
+# In-flight extraction jobs keyed by paper ID
+_jobs: Dict[str, "asyncio.Task[List[str]]"] = {}
+
+
+async def _run_extraction(paper_id: str, pdf_path: str, image_dir: str) -> List[str]:
+    """Extract images for one paper and record the result."""
+    start = time.perf_counter()
+    paper_info = storage_manager.get_paper(paper_id) or {}
+    try:
+        # Only the extraction runs in a worker thread; paper_info is
+        # updated and saved here, on the event loop
+        image_files = await run_in_threadpool(extract_images_from_pdf_file, pdf_path, image_dir)
+        paper_info["image_files"] = image_files
+        paper_info["images_status"] = IMAGES_READY
+        logger.info(f"Extracted {len(image_files)} images for paper {paper_id}")
+        return image_files
+    except Exception as e:
+        logger.error(f"Error extracting images for paper {paper_id}: {str(e)}")
+        paper_info["image_files"] = []
+        paper_info["images_status"] = IMAGES_FAILED
+        return []
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe("images.extraction_seconds", elapsed)
+        paper_info.setdefault("timings", {})["image_extraction"] = round(elapsed, 3)
+        storage_manager.save_paper(paper_id, paper_info)
+
+
+def start_image_extraction(paper_id: str) -> "asyncio.Task[List[str]]":
+    """
+    Start (or join) background image extraction for a PDF paper.
+
+    Must be called from the event loop.
+
+    Args:
+        paper_id: Unique identifier for the paper
+
+    Returns:
+        Task resolving to the list of extracted image paths
+    """
+    if paper_id in _jobs:
+        return _jobs[paper_id]
+
+    paper_info = storage_manager.get_paper(paper_id) or {}
+    task = asyncio.create_task(_run_extraction(paper_id, paper_info["pdf_path"], paper_info["image_dir"]))
+    _jobs[paper_id] = task
+    task.add_done_callback(lambda _: _jobs.pop(paper_id, None))
+    return task
+
+
+async def ensure_images_ready(paper_id: str, paper_info: Dict) -> List[str]:
+    """
+    Wait for a paper's images if they are still being extracted.
+
+    Papers whose images were extracted at upload (LaTeX sources, older PDF
+    uploads) return immediately. A pending paper with no running job (e.g.
+    after a restart) has its extraction started here.
+
+    Args:
+        paper_id: Unique identifier for the paper
+        paper_info: Dictionary containing paper information
+
+    Returns:
+        List of image file paths
+    """
+    if paper_info.get("images_status") != IMAGES_PENDING:
+        return paper_info.get("image_files", [])
+
+    start = time.perf_counter()
+    # Shield so a cancelled request does not cancel extraction for others
+    image_files = await asyncio.shield(start_image_extraction(paper_id))
+    metrics.observe("images.wait_seconds", time.perf_counter() - start)
+    return image_files
@@ -1,10 +1,57 @@
 import os
 import re
+import json
+import shutil
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Dict
 
+# Bytes read from each .tex file when looking for the root document
+TEX_HEADER_BYTES = 16 * 1024
+
+# Conventional names for the root document, in order of preference
+ROOT_TEX_NAMES = ["main.tex", "ms.tex", "paper.tex", "article.tex"]
+
+# Flattened documents are cached here, one directory per source tree hash
+LATEX_CACHE_DIR = "temp/latex_cache"
+
+# Guard against pathological include chains
+MAX_INCLUDE_DEPTH = 20
+
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.pdf', '.eps', '.svg']
+
+# Order in which pdflatex tries extensions for \includegraphics{name}
+LATEX_GRAPHICS_EXTENSIONS = ['.pdf', '.png', '.jpg', '.jpeg', '.eps']
+
+# Converted PDF figures are cached here by content hash
+FIGURE_CACHE_DIR = "temp/figure_cache"
+FIGURE_DPI = 300
+FIGURE_CONVERSION_WORKERS = min(4, os.cpu_count() or 1)
+
+_INCLUDE_PATTERN = re.compile(
+    r'\\(?P<command>input|include|subfile)\s*\{(?P<braced>[^}]+)\}'
+    r'|\\input\s+(?P<bare>[^\s{}\\%]+)'
+)
+_DOCUMENTCLASS_PATTERN = re.compile(r'^[^%\n]*\\documentclass', re.MULTILINE)
+_COMMENT_PATTERN = re.compile(r'(?<!\\)%')
+
+def _read_tex_header(tex_file):
+    """Read the first TEX_HEADER_BYTES of a .tex file."""
+    with open(tex_file, 'r', encoding='utf-8', errors='ignore') as f:
+        return f.read(TEX_HEADER_BYTES)
+
 def find_tex_file(directory):
-    """Find the main .tex file in a directory."""
+    r"""
+    Find the main .tex file in a directory.
+    
+    Only the header of each file is read. Files with an uncommented
+    \documentclass are root candidates; subfiles roots
+    (\documentclass[...]{subfiles}) are skipped, then conventional names
+    (main.tex, ms.tex, ...) and finally the largest candidate win.
+    """
     tex_files = []
     for root, dirs, files in os.walk(directory):
         for file in files:
@@ -14,110 +61,372 @@ def find_tex_file(directory):
     if not tex_files:
         raise FileNotFoundError("No .tex files found in the directory")
     
+    tex_files.sort()
+    
     # Prefer main.tex or files with \documentclass
+    candidates = []
     for tex_file in tex_files:
         try:
-            with open(tex_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                if '\\documentclass' in content:
-                    return tex_file
-        except:
+            header = _read_tex_header(tex_file)
+        except Exception:
+            continue
+        match = _DOCUMENTCLASS_PATTERN.search(header)
+        if match and '{subfiles}' not in header[match.start():match.start() + 200]:
+            candidates.append(tex_file)
+    
+    if not candidates:
+        # Return the first .tex file found
+        return tex_files[0]
+    
+    for name in ROOT_TEX_NAMES:
+        for candidate in candidates:
+            if os.path.basename(candidate).lower() == name:
+                return candidate
+    
+    return max(candidates, key=os.path.getsize)
+
+def compute_source_tree_hash(directory):
+    """Hash the relative paths and contents of all .tex files in a tree."""
+    digest = hashlib.sha256()
+    for root, dirs, files in sorted(os.walk(directory)):
+        dirs.sort()
+        for file in sorted(files):
+            if not file.endswith('.tex'):
+                continue
+            path = os.path.join(root, file)
+            digest.update(os.path.relpath(path, directory).replace(os.sep, '/').encode('utf-8'))
+            digest.update(b'\0')
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+def flatten_latex_document(directory, root_tex_path=None):
+    r"""
+    Build one flattened LaTeX document with \input, \include and \subfile
+    resolved recursively.
+    
+    The flattened document and a source map (which output lines came from
+    which file and line) are cached per source tree hash, so re-ingesting the
+    same sources reuses them.
+    
+    Args:
+        directory: Root of the extracted LaTeX source tree
+        root_tex_path: Root document; found with find_tex_file if omitted
+        
+    Returns:
+        Dictionary with flattened_path, source_map_path and root_tex_path
+    """
+    if root_tex_path is None:
+        root_tex_path = find_tex_file(directory)
+    
+    tree_hash = compute_source_tree_hash(directory)
+    root_rel = os.path.relpath(root_tex_path, directory).replace(os.sep, '/')
+    cache_key = hashlib.sha256(f"{tree_hash}:{root_rel}".encode('utf-8')).hexdigest()[:32]
+    cache_dir = os.path.join(LATEX_CACHE_DIR, cache_key)
+    flattened_path = os.path.join(cache_dir, "flattened.tex")
+    source_map_path = os.path.join(cache_dir, "source_map.json")
+    
+    result = {
+        "flattened_path": flattened_path,
+        "source_map_path": source_map_path,
+        "root_tex_path": root_tex_path
+    }
+    
+    if os.path.exists(flattened_path) and os.path.exists(source_map_path):
+        return result
+    
+    output_lines = []
+    source_map = []
+    _flatten_file(
+        os.path.abspath(root_tex_path),
+        os.path.abspath(directory),
+        output_lines,
+        source_map,
+        stack=[],
+        body_only=False
+    )
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    # Per-process/thread temp names: the same tree may be flattened concurrently
+    suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+    map_tmp_path = f"{source_map_path}.{suffix}"
+    with open(map_tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"root": root_rel, "segments": source_map}, f)
+    os.replace(map_tmp_path, source_map_path)
+    # flattened.tex goes last: its presence marks a complete cache entry
+    tmp_path = f"{flattened_path}.{suffix}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.writelines(output_lines)
+    os.replace(tmp_path, flattened_path)
+    
+    return result
+
+def _resolve_include(name, current_dir, root_dir):
+    """Resolve an included file name relative to the including file, then the root."""
+    name = name.strip()
+    candidates = [name] if name.endswith('.tex') else [name + '.tex', name]
+    for base in (current_dir, root_dir):
+        for candidate in candidates:
+            path = os.path.abspath(os.path.join(base, candidate))
+            # Never follow includes out of the source tree
+            if not path.startswith(root_dir + os.sep):
+                continue
+            if os.path.isfile(path):
+                return path
+    return None
+
+def _flatten_file(path, root_dir, output_lines, source_map, stack, body_only):
+    """Append one file's lines to output_lines, inlining its includes."""
+    rel_path = os.path.relpath(path, root_dir).replace(os.sep, '/')
+    
+    if path in stack:
+        print(f"Include cycle detected at {rel_path}, skipping")
+        output_lines.append(f"% [include cycle: {rel_path}]\n")
+        return
+    if len(stack) >= MAX_INCLUDE_DEPTH:
+        print(f"Include depth limit reached at {rel_path}, skipping")
+        output_lines.append(f"% [include depth limit: {rel_path}]\n")
+        return
+    
+    try:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            lines = f.readlines()
+    except Exception as e:
+        print(f"Error reading {rel_path}: {e}")
+        return
+    
+    # A \subfile is a standalone document; only its body is inlined
+    if body_only:
+        begin = next((i for i, l in enumerate(lines) if '\\begin{document}' in l), None)
+        end = next((i for i, l in enumerate(lines) if '\\end{document}' in l), None)
+        if begin is not None:
+            lines = lines[begin + 1:end if end is not None else len(lines)]
+            first_line = begin + 2
+        else:
+            first_line = 1
+    else:
+        first_line = 1
+    
+    stack.append(path)
+    current_dir = os.path.dirname(path)
+    segment_open = False
+    
+    for offset, line in enumerate(lines):
+        line_number = first_line + offset
+        if not line.endswith('\n'):
+            line += '\n'
+        
+        comment = _COMMENT_PATTERN.search(line)
+        code = line[:comment.start()] if comment else line
+        match = _INCLUDE_PATTERN.search(code) if '\\' in code else None
+        
+        if not match:
+            if not segment_open:
+                source_map.append([len(output_lines) + 1, rel_path, line_number])
+                segment_open = True
+            output_lines.append(line)
             continue
+        
+        position = 0
+        for match in _INCLUDE_PATTERN.finditer(code):
+            before = code[position:match.start()]
+            if before.strip():
+                source_map.append([len(output_lines) + 1, rel_path, line_number])
+                output_lines.append(before + '\n')
+            position = match.end()
+            
+            name = match.group('braced') or match.group('bare')
+            included = _resolve_include(name, current_dir, root_dir)
+            if included:
+                _flatten_file(included, root_dir, output_lines, source_map, stack,
+                              body_only=match.group('command') == 'subfile')
+            else:
+                source_map.append([len(output_lines) + 1, rel_path, line_number])
+                output_lines.append(f"% [missing include: {name}]\n")
+        
+        rest = line[position:]
+        if rest.strip():
+            source_map.append([len(output_lines) + 1, rel_path, line_number])
+            output_lines.append(rest if rest.endswith('\n') else rest + '\n')
+        segment_open = False
     
-    # Return the first .tex file found
-    return tex_files[0]
+    stack.pop()
 
 def find_image_references(tex_file_path):
-    """Find image references in LaTeX file."""
+    """Find image references in LaTeX file, in document order."""
     image_refs = []
     
     try:
         with open(tex_file_path, 'r', encoding='utf-8') as f:
             content = f.read()
         
-        # Find \includegraphics commands
-        includegraphics_pattern = r'\\includegraphics(?:\[[^\]]*\])?\{([^}]+)\}'
-        matches = re.findall(includegraphics_pattern, content)
-        image_refs.extend(matches)
-        
-        # Find \figure and \begin{figure} environments
-        figure_pattern = r'\\begin\{figure\}.*?\\end\{figure\}'
-        figure_matches = re.findall(figure_pattern, content, re.DOTALL)
+        # Drop comments so commented-out figures are not converted
+        content = re.sub(r'(?<!\\)%.*', '', content)
         
-        for figure in figure_matches:
-            img_matches = re.findall(includegraphics_pattern, figure)
-            image_refs.extend(img_matches)
+        # Find \includegraphics commands (inside figure environments or not)
+        includegraphics_pattern = r'\\includegraphics\*?(?:\[[^\]]*\])?\{([^}]+)\}'
+        image_refs = [ref.strip() for ref in re.findall(includegraphics_pattern, content)]
             
     except Exception as e:
         print(f"Error finding image references: {e}")
     
-    return list(set(image_refs))  # Remove duplicates
+    return list(dict.fromkeys(image_refs))  # Remove duplicates, keep order
 
 def find_image_files(directory, image_refs):
-    """Find actual image files in the directory."""
-    image_files = []
-    image_extensions = ['.png', '.jpg', '.jpeg', '.pdf', '.eps', '.svg']
+    """
+    Find actual image files in the directory.
     
-    # Search for all image files in directory
+    References are resolved to files first; only referenced PDF figures are
+    converted to PNG, in parallel, with conversions cached by file hash. When
+    there are no references (or none resolve) every image is returned, as
+    before, with PDFs converted the same way.
+    """
+    all_images = []
+    
+    # Search for all image files in directory (no conversion yet)
     for root, dirs, files in os.walk(directory):
         for file in files:
-            file_lower = file.lower()
-            if any(file_lower.endswith(ext) for ext in image_extensions):
-                full_path = os.path.join(root, file)
-                
-                # Convert PDF to PNG if needed
-                if file_lower.endswith('.pdf'):
-                    try:
-                        png_path = os.path.splitext(full_path)[0] + '.png'
-                        # Use pdf2image or similar library to convert PDF to PNG
-                        convert_pdf_to_png(full_path, png_path)
-                        if os.path.exists(png_path):
-                            image_files.append(png_path)
-                        else:
-                            image_files.append(full_path)  # Fall back to PDF if conversion fails
-                    except Exception as e:
-                        print(f"Error converting PDF to PNG: {e}")
-                        image_files.append(full_path)  # Fall back to PDF
-                else:
-                    image_files.append(full_path)
-    
-    # If we have specific references, try to match them
+            if file.lower().endswith(tuple(IMAGE_EXTENSIONS)):
+                all_images.append(os.path.join(root, file))
+    all_images.sort()
+    
+    selected = []
     if image_refs:
-        matched_files = []
         for ref in image_refs:
-            ref_name = os.path.basename(ref)
-            ref_name_no_ext = os.path.splitext(ref_name)[0]
-            
-            for img_file in image_files:
-                img_name = os.path.basename(img_file)
-                img_name_no_ext = os.path.splitext(img_name)[0]
-                
-                if (ref_name in img_name or 
-                    ref_name_no_ext in img_name_no_ext or
-                    img_name_no_ext in ref_name_no_ext):
-                    matched_files.append(img_file)
-                    break
+            match = _resolve_image_reference(ref, directory, all_images)
+            if match and match not in selected:
+                selected.append(match)
+    
+    if not selected:
+        selected = all_images
+    
+    # Convert PDF figures to PNG
+    pdf_files = [f for f in selected if f.lower().endswith('.pdf')]
+    converted = convert_pdfs_to_png(pdf_files) if pdf_files else {}
+    
+    # A PDF converted on an earlier run already has its PNG in the tree
+    return list(dict.fromkeys(converted.get(f, f) for f in selected))
+
+def _resolve_image_reference(ref, directory, image_files):
+    r"""
+    Resolve one \includegraphics argument to an image file.
+    
+    Tries the exact path relative to the source root (with LaTeX's extension
+    search order when the reference has no extension), then a file with the
+    same base name anywhere in the tree, then a loose name match.
+    """
+    ref = ref.strip().replace('\\', '/')
+    ref_base, ref_ext = os.path.splitext(ref)
+    extensions = [ref_ext] if ref_ext.lower() in IMAGE_EXTENSIONS else [''] + LATEX_GRAPHICS_EXTENSIONS
+    if ref_ext.lower() not in IMAGE_EXTENSIONS:
+        ref_base = ref
+    
+    by_path = {os.path.relpath(f, directory).replace(os.sep, '/').lower(): f for f in image_files}
+    for ext in extensions:
+        candidate = os.path.normpath(ref_base + ext).replace(os.sep, '/').lower()
+        if candidate in by_path:
+            return by_path[candidate]
+    
+    ref_name = os.path.basename(ref_base).lower()
+    same_name = [f for f in image_files
+                 if os.path.splitext(os.path.basename(f))[0].lower() == ref_name]
+    if same_name:
+        for ext in extensions:
+            for f in same_name:
+                if not ext or f.lower().endswith(ext.lower()):
+                    return f
+    
+    # Loose match, as the original implementation did
+    for img_file in image_files:
+        img_name_no_ext = os.path.splitext(os.path.basename(img_file))[0].lower()
+        if ref_name and (ref_name in img_name_no_ext or img_name_no_ext in ref_name):
+            return img_file
+    
+    return None
+
+def convert_pdfs_to_png(pdf_files, dpi=FIGURE_DPI):
+    """
+    Convert PDF figures to PNG in a process pool.
+    
+    Each PNG is written next to its PDF. Conversions are cached by the hash
+    of the PDF's contents, so the same figure is rendered once across papers
+    and re-uploads.
+    
+    Args:
+        pdf_files: Paths of PDF figures
+        dpi: Rendering resolution
         
-        if matched_files:
-            return matched_files
+    Returns:
+        Dictionary mapping each PDF path to its PNG path (PDFs that failed to
+        convert are left out)
+    """
+    os.makedirs(FIGURE_CACHE_DIR, exist_ok=True)
+    
+    converted = {}
+    pending = []
+    for pdf_path in pdf_files:
+        png_path = os.path.splitext(pdf_path)[0] + '.png'
+        cached_path = os.path.join(FIGURE_CACHE_DIR, f"{_file_hash(pdf_path)}_{dpi}.png")
+        if os.path.exists(cached_path):
+            shutil.copyfile(cached_path, png_path)
+            converted[pdf_path] = png_path
+        else:
+            pending.append((pdf_path, png_path, cached_path, dpi))
+    
+    if not pending:
+        return converted
+    
+    workers = min(FIGURE_CONVERSION_WORKERS, len(pending))
+    if workers < 2:
+        results = map(_convert_pdf_task, pending)
+        for (pdf_path, png_path, _, _), ok in zip(pending, results):
+            if ok:
+                converted[pdf_path] = png_path
+        return converted
     
-    return image_files
+    # Spawn, not fork: this runs in a threadpool worker of a multi-threaded
+    # server, and a forked child can inherit locks held by other threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        for (pdf_path, png_path, _, _), ok in zip(pending, executor.map(_convert_pdf_task, pending)):
+            if ok:
+                converted[pdf_path] = png_path
+    return converted
 
-def convert_pdf_to_png(pdf_path, png_path):
-    """Convert PDF file to PNG using pdf2image."""
-    try:
-        from pdf2image import convert_from_path
-        
-        # Convert the first page of the PDF to PNG
-        images = convert_from_path(pdf_path, dpi=300, first_page=1, last_page=1)
-        if images:
-            images[0].save(png_path, 'PNG')
-            print(f"Successfully converted {pdf_path} to {png_path}")
-            return True
-        return False
-    except ImportError:
-        print("pdf2image library not installed. Please install with: pip install pdf2image")
+def _convert_pdf_task(task):
+    """Process-pool worker: convert one PDF figure and store it in the cache."""
+    pdf_path, png_path, cached_path, dpi = task
+    if not convert_pdf_to_png(pdf_path, png_path, dpi=dpi):
         return False
+    try:
+        tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+        shutil.copyfile(png_path, tmp_path)
+        os.replace(tmp_path, cached_path)
+    except Exception as e:
+        print(f"Could not cache converted figure {pdf_path}: {e}")
+    return True
+
+def _file_hash(path):
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def convert_pdf_to_png(pdf_path, png_path, dpi=FIGURE_DPI):
+    """Convert the first page of a PDF file to PNG using PyMuPDF."""
+    try:
+        import fitz  # PyMuPDF
+        
+        with fitz.open(pdf_path) as doc:
+            if doc.page_count == 0:
+                return False
+            pix = doc[0].get_pixmap(dpi=dpi)
+            pix.save(png_path)
+        print(f"Successfully converted {pdf_path} to {png_path}")
+        return True
     except Exception as e:
         print(f"Error during PDF to PNG conversion: {e}")
         return False
@@ -0,0 +1,501 @@
+r"""
+LaTeX Text Service
+Converts LaTeX source to plain text in a single linear pass, keeping the
+content arguments of formatting macros, dropping math, comments and markup,
+and recording section boundaries for the section index
+"""
+
+import os
+import threading
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from app.services.section_index import (
+    finalize_index,
+    get_index_path,
+    match_heading,
+    save_section_index,
+)
+
+logger = logging.getLogger(__name__)
+
+LATEX_TEXT_FILENAME = "paper_text.txt"
+
+# Sectioning commands and their heading level
+SECTION_LEVELS = {
+    "chapter": 1,
+    "section": 1,
+    "subsection": 2,
+    "subsubsection": 3,
+}
+
+# Argument specs for known macros: one character per braced argument,
+# "k" = content that is kept, "d" = argument that is dropped.
+# Optional [...] arguments are always skipped.
+MACRO_ARGS = {
+    # Formatting whose argument is text
+    "textbf": "k", "textit": "k", "emph": "k", "underline": "k", "texttt": "k",
+    "textrm": "k", "textsf": "k", "textsc": "k", "textsl": "k", "textup": "k",
+    "textmd": "k", "textnormal": "k", "mbox": "k", "hbox": "k", "text": "k",
+    "uline": "k", "caption": "k", "footnote": "k", "paragraph": "k",
+    "subparagraph": "k", "textsuperscript": "k", "textsubscript": "k",
+    "href": "dk", "textcolor": "dk", "colorbox": "dk",
+    # References, labels and layout whose arguments are not prose
+    "label": "d", "ref": "d", "eqref": "d", "autoref": "d", "cref": "d", "Cref": "d",
+    "pageref": "d", "cite": "d", "citep": "d", "citet": "d", "citealp": "d",
+    "citeauthor": "d", "citeyear": "d", "nocite": "d", "url": "d",
+    "includegraphics": "d", "input": "d", "include": "d", "subfile": "d",
+    "usepackage": "d", "documentclass": "d", "bibliography": "d",
+    "bibliographystyle": "d", "vspace": "d", "hspace": "d",
+    "setlength": "dd", "addtolength": "dd", "setcounter": "dd", "addtocounter": "dd",
+    "newcommand": "dd", "renewcommand": "dd", "providecommand": "dd",
+    "newenvironment": "ddd", "renewenvironment": "ddd", "DeclareMathOperator": "dd",
+    "newtheorem": "dd", "color": "d", "pagestyle": "d", "thispagestyle": "d",
+    "title": "d", "author": "d", "date": "d", "affiliation": "d", "address": "d",
+    "email": "d", "thanks": "d", "keywords": "d",
+}
+
+# Macros without arguments that stand for text
+MACRO_TEXT = {
+    "LaTeX": "LaTeX", "TeX": "TeX", "ldots": "...", "dots": "...",
+    "textendash": "-", "textemdash": "-", "textasciitilde": "~",
+    "%": "%", "&": "&", "#": "#", "_": "_", "$": "$", "{": "{", "}": "}",
+}
+
+# Environments skipped entirely (math, tables, code, drawings)
+SKIP_ENVIRONMENTS = {
+    "equation", "equation*", "align", "align*", "alignat", "alignat*",
+    "gather", "gather*", "multline", "multline*", "eqnarray", "eqnarray*",
+    "displaymath", "math", "flalign", "flalign*", "split",
+    "tabular", "tabular*", "tabularx", "longtable", "array",
+    "tikzpicture", "pgfpicture", "picture",
+    "verbatim", "verbatim*", "lstlisting", "minted", "comment",
+    "algorithmic",
+}
+
+# Environments that begin a canonical section of their own
+SECTION_ENVIRONMENTS = {
+    "abstract": "Abstract",
+    "thebibliography": "References",
+}
+
+# Argument specs for environments that take braced arguments
+ENVIRONMENT_ARGS = {
+    "minipage": "d", "subfigure": "d", "wrapfigure": "dd", "multicols": "d",
+    "thebibliography": "d",
+}
+
+# Characters that interrupt a run of plain text
+_SPECIAL = re.compile(r'[\\{}$%~&\n]')
+_CONTROL_WORD = re.compile(r'[a-zA-Z@]+\*?')
+_BRACES = re.compile(r'\\.|[{}]', re.DOTALL)
+_DOLLAR = re.compile(r'(?<!\\)\$')
+_DOUBLE_DOLLAR = re.compile(r'(?<!\\)\$\$')
+_BEGIN_DOCUMENT = re.compile(r'^[^%\n]*\\begin\s*\{document\}', re.MULTILINE)
+_END_DOCUMENT = re.compile(r'\\end\s*\{document\}')
+
+# Pending whitespace, from weakest to strongest
+_SPACE, _NEWLINE, _PARAGRAPH = 1, 2, 3
+_WHITESPACE = {_SPACE: " ", _NEWLINE: "\n", _PARAGRAPH: "\n\n"}
+
+
+class _TextWriter:
+    """Output buffer that collapses whitespace and tracks character offsets."""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.length = 0
+        self._pending = 0
+        self._trailing_newlines = 0
+
+    def whitespace(self, kind: int) -> None:
+        """Request whitespace before the next text (the strongest request wins)."""
+        if self.length and kind > self._pending:
+            self._pending = kind
+
+    def flush(self) -> None:
+        """Write pending whitespace now so the next offset is final."""
+        if not self._pending:
+            return
+        separator = _WHITESPACE[self._pending]
+        if self._trailing_newlines:
+            separator = separator[self._trailing_newlines:] if separator.startswith("\n") else ""
+        self._pending = 0
+        if separator:
+            self._append(separator)
+
+    def write(self, text: str) -> None:
+        """Write text verbatim (no whitespace inside)."""
+        if text:
+            self.flush()
+            self._append(text)
+
+    def write_run(self, run: str) -> None:
+        """Write a run of source text, collapsing its whitespace."""
+        words = run.split()
+        if not words:
+            if run:
+                self.whitespace(_SPACE)
+            return
+        if run[0].isspace():
+            self.whitespace(_SPACE)
+        self.write(" ".join(words))
+        if run[-1].isspace():
+            self.whitespace(_SPACE)
+
+    def _append(self, text: str) -> None:
+        self.parts.append(text)
+        self.length += len(text)
+        stripped = text.rstrip("\n")
+        if stripped:
+            self._trailing_newlines = len(text) - len(stripped)
+        else:
+            self._trailing_newlines += len(text)
+
+    def text_since(self, part_index: int) -> str:
+        return "".join(self.parts[part_index:])
+
+    def getvalue(self) -> str:
+        return "".join(self.parts)
+
+
+def _skip_group(source: str, pos: int) -> int:
+    """Position after the brace group starting at pos (source[pos] == '{')."""
+    depth = 0
+    for match in _BRACES.finditer(source, pos):
+        token = match.group()
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    return len(source)
+
+
+def _skip_optional(source: str, pos: int) -> int:
+    """Skip whitespace and any [...] optional arguments."""
+    length = len(source)
+    while pos < length:
+        while pos < length and source[pos] in " \t\n":
+            pos += 1
+        if pos < length and source[pos] == "[":
+            depth = 0
+            while pos < length:
+                char = source[pos]
+                if char == "\\":
+                    pos += 2
+                    continue
+                if char == "[":
+                    depth += 1
+                elif char == "]":
+                    depth -= 1
+                    if depth == 0:
+                        pos += 1
+                        break
+                elif char == "{":
+                    pos = _skip_group(source, pos)
+                    continue
+                pos += 1
+        else:
+            break
+    return pos
+
+
+def _skip_until(source: str, pos: int, closing: str) -> int:
+    """Position after the next occurrence of closing, or pos if there is none."""
+    end = source.find(closing, pos)
+    return end + len(closing) if end != -1 else pos
+
+
+def _read_braced_name(source: str, pos: int) -> Tuple[Optional[str], int]:
+    """Read {name} (e.g. an environment name) starting at pos."""
+    while pos < len(source) and source[pos] in " \t":
+        pos += 1
+    if pos >= len(source) or source[pos] != "{":
+        return None, pos
+    end = source.find("}", pos)
+    if end == -1:
+        return None, pos
+    return source[pos + 1:end].strip(), end + 1
+
+
+class _Converter:
+    """Single-pass LaTeX to text conversion state."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.out = _TextWriter()
+        # Open groups: (kind, remaining argument spec, heading or None)
+        self.stack: List[Tuple[str, str, Optional[Dict]]] = []
+        self.headings: List[Dict] = []
+
+    def run(self, pos: int, end: int) -> None:
+        source = self.source
+        out = self.out
+        while pos < end:
+            match = _SPECIAL.search(source, pos, end)
+            if not match:
+                out.write_run(source[pos:end])
+                break
+            if match.start() > pos:
+                out.write_run(source[pos:match.start()])
+            pos = match.start()
+            char = source[pos]
+
+            if char == "\\":
+                pos = self._command(pos + 1)
+            elif char == "{":
+                self.stack.append(("group", "", None))
+                pos += 1
+            elif char == "}":
+                pos = self._close_group(pos + 1)
+            elif char == "$":
+                if source.startswith("$$", pos):
+                    closing = _DOUBLE_DOLLAR.search(source, pos + 2)
+                else:
+                    closing = _DOLLAR.search(source, pos + 1)
+                pos = closing.end() if closing else pos + 1
+                out.whitespace(_SPACE)
+            elif char == "%":
+                newline = source.find("\n", pos)
+                pos = newline + 1 if newline != -1 else end
+            elif char == "\n":
+                pos += 1
+                # A blank line is a paragraph break
+                probe = pos
+                while probe < end and source[probe] in " \t":
+                    probe += 1
+                if probe < end and source[probe] == "\n":
+                    out.whitespace(_PARAGRAPH)
+                else:
+                    out.whitespace(_SPACE)
+            else:  # "~" and "&"
+                out.whitespace(_SPACE)
+                pos += 1
+
+        # Close headings left open by unbalanced braces
+        while self.stack:
+            kind, _, heading = self.stack.pop()
+            if heading is not None and kind == "arg":
+                self._finish_heading(heading)
+
+    def _command(self, pos: int) -> int:
+        """Handle a control sequence; pos is just after the backslash."""
+        source = self.source
+        out = self.out
+        if pos >= len(source):
+            return pos
+
+        match = _CONTROL_WORD.match(source, pos)
+        if not match:
+            symbol = source[pos]
+            if symbol in MACRO_TEXT:
+                out.write(MACRO_TEXT[symbol])
+            elif symbol == "\\":
+                out.whitespace(_NEWLINE)
+            elif symbol == "(":
+                return _skip_until(source, pos + 1, "\\)")
+            elif symbol == "[":
+                out.whitespace(_SPACE)
+                return _skip_until(source, pos + 1, "\\]")
+            elif symbol in ",;:! \n\t":
+                out.whitespace(_SPACE)
+            # Accents (\'e, \"o, ...) fall through: the letter is kept
+            return pos + 1
+
+        word = match.group()
+        name = word.rstrip("*")
+        pos = match.end()
+
+        if name == "begin":
+            return self._begin_environment(pos)
+        if name == "end":
+            _, pos = _read_braced_name(source, pos)
+            out.whitespace(_PARAGRAPH)
+            return pos
+        if name in SECTION_LEVELS:
+            return self._start_heading(pos, SECTION_LEVELS[name])
+        if name in MACRO_ARGS:
+            if name in ("paragraph", "subparagraph"):
+                out.whitespace(_PARAGRAPH)
+            elif name == "footnote":
+                out.whitespace(_SPACE)
+            return self._parse_args(pos, MACRO_ARGS[name])
+        if name in MACRO_TEXT:
+            out.write(MACRO_TEXT[name])
+            return pos
+        if name == "item":
+            out.whitespace(_NEWLINE)
+            return _skip_optional(source, pos)
+        if name == "par":
+            out.whitespace(_PARAGRAPH)
+            return pos
+        if name in ("newline", "linebreak"):
+            out.whitespace(_NEWLINE)
+            return pos
+        if name in ("def", "gdef", "edef", "xdef"):
+            # \def\name<params>{body}
+            brace = source.find("{", pos)
+            return _skip_group(source, brace) if brace != -1 else len(source)
+        if name == "verb" and pos < len(source):
+            closing = source.find(source[pos], pos + 1)
+            return closing + 1 if closing != -1 else pos + 1
+
+        # Unknown macro: drop the name, any following group is read as text
+        return pos
+
+    def _parse_args(self, pos: int, spec: str, heading: Optional[Dict] = None) -> int:
+        """Consume macro arguments per spec, opening a group for the next kept one."""
+        source = self.source
+        for i, kind in enumerate(spec):
+            pos = _skip_optional(source, pos)
+            if pos >= len(source) or source[pos] != "{":
+                return pos
+            if kind == "d":
+                pos = _skip_group(source, pos)
+            else:
+                self.stack.append(("arg", spec[i + 1:], heading))
+                return pos + 1
+        return pos
+
+    def _close_group(self, pos: int) -> int:
+        """Close the innermost group; pos is just after the '}'."""
+        if not self.stack:
+            return pos
+        kind, remaining, heading = self.stack.pop()
+        if heading is not None and kind == "arg":
+            self._finish_heading(heading)
+        elif remaining:
+            return self._parse_args(pos, remaining)
+        return pos
+
+    def _start_heading(self, pos: int, level: int) -> int:
+        self.out.whitespace(_PARAGRAPH)
+        self.out.flush()
+        heading = {"level": level, "start": self.out.length, "part_index": len(self.out.parts)}
+        pos = _skip_optional(self.source, pos)
+        if pos < len(self.source) and self.source[pos] == "{":
+            self.stack.append(("arg", "", heading))
+            return pos + 1
+        return pos
+
+    def _finish_heading(self, heading: Dict) -> None:
+        title = self.out.text_since(heading.pop("part_index")).strip()
+        if not title:
+            return
+        self._add_heading(title, None, heading["level"], heading["start"])
+
+    def _add_heading(self, title: str, name: Optional[str], level: int, start: int) -> None:
+        if name is None:
+            matched = match_heading(title)
+            name = matched["name"] if matched else None
+        self.out.whitespace(_NEWLINE)
+        self.out.flush()
+        self.headings.append({
+            "title": title,
+            "name": name,
+            "level": level,
+            "start": start,
+            "body_start": self.out.length,
+        })
+
+    def _begin_environment(self, pos: int) -> int:
+        source = self.source
+        env, pos = _read_braced_name(source, pos)
+        if env is None:
+            return pos
+        if env in SKIP_ENVIRONMENTS:
+            self.out.whitespace(_SPACE)
+            end = re.compile(r'\\end\s*\{' + re.escape(env) + r'\}').search(source, pos)
+            return end.end() if end else len(source)
+
+        self.out.whitespace(_PARAGRAPH)
+        if env in SECTION_ENVIRONMENTS:
+            self.out.flush()
+            title = SECTION_ENVIRONMENTS[env]
+            start = self.out.length
+            self.out.write(title)
+            self._add_heading(title, title, 1, start)
+        spec = ENVIRONMENT_ARGS.get(env)
+        if spec:
+            pos = _skip_optional(source, pos)
+            for _ in spec:
+                if pos < len(source) and source[pos] == "{":
+                    pos = _skip_optional(source, _skip_group(source, pos))
+            return pos
+        return _skip_optional(source, pos)
+
+
+def convert_latex(source: str) -> Tuple[str, Dict]:
+    r"""
+    Convert LaTeX source to plain text and a section index in one pass.
+
+    Only the document body is converted when \begin{document} is present.
+    The index uses the same format as PDF section indexes, so sections can
+    be sliced out with section_index.get_section_text.
+
+    Args:
+        source: LaTeX source (ideally flattened, see flatten_latex_document)
+
+    Returns:
+        Tuple of (plain text, section index)
+    """
+    start = 0
+    end = len(source)
+    begin = _BEGIN_DOCUMENT.search(source)
+    if begin:
+        start = begin.end()
+        finish = _END_DOCUMENT.search(source, start)
+        if finish:
+            end = finish.start()
+
+    converter = _Converter(source)
+    converter.run(start, end)
+    text = converter.out.getvalue()
+    return text, finalize_index(converter.headings, len(text), source="latex")
+
+
+def latex_to_plain_text(content: str) -> str:
+    """Strip LaTeX markup from source text."""
+    text, _ = convert_latex(content)
+    return text
+
+
+def write_latex_text(tex_file_path: str) -> Dict:
+    """
+    Convert a LaTeX file to plain text and save it with its section index.
+
+    The text is written next to the LaTeX file; flattened documents live in
+    a content-addressed cache directory, so existing output is reused.
+
+    Args:
+        tex_file_path: Path to the (flattened) LaTeX document
+
+    Returns:
+        Dictionary with text_file_path and section_index_path
+    """
+    text_file_path = os.path.join(os.path.dirname(tex_file_path), LATEX_TEXT_FILENAME)
+
+    if not os.path.exists(text_file_path):
+        with open(tex_file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            source = f.read()
+        text, section_index = convert_latex(source)
+
+        # Concurrent ingests of the same tree each write their own temp
+        # files; whichever replace lands last leaves identical content
+        save_section_index(section_index, text_file_path)
+        tmp_path = f"{text_file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, text_file_path)
+        logger.info(
+            f"Converted {tex_file_path} to {len(text)} chars of text "
+            f"with {len(section_index['sections'])} sections"
+        )
+
+    return {
+        "text_file_path": text_file_path,
+        "section_index_path": get_index_path(text_file_path),
+    }
@@ -0,0 +1,537 @@
+"""
+Library Index Service
+Inverted BM25 index over the chunks of every paper in the store, updated one
+paper at a time as papers are ingested, for search and question answering
+across a reading list. Postings and chunk metadata stay in memory; chunk
+texts live in one file per paper and are read only for the results returned.
+A search converts only its terms' postings to NumPy and scores without
+holding the index lock; re-indexed papers' old chunks are compacted away
+once they outnumber the live ones
+"""
+
+import os
+import re
+import json
+import math
+import time
+import asyncio
+import logging
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.paper_text import get_paper_text, get_paper_source_path
+from app.services.context_builder import estimate_tokens, get_paper_section_index
+from app.services.paper_retrieval import BM25_B, BM25_K1, chunk_paper, tokenize
+from app.services.storage_manager import storage_manager
+from app.services.metrics import metrics
+from app.services.llm_service import agenerate_text
+from app.services.chatbot_service import chatbot_service
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_INDEX_DIR = os.getenv("LIBRARY_INDEX_DIR", "temp/library_index")
+
+# Passages from one paper in a result list, so one long paper cannot crowd
+# out the rest of the library
+MAX_RESULTS_PER_PAPER = 3
+
+# Characters of a passage returned by search
+SNIPPET_CHARS = 300
+
+# Chunk slots allocated up front; the per-chunk arrays double when full
+INITIAL_CHUNK_CAPACITY = 1024
+
+# Query terms whose postings are kept as NumPy arrays between searches
+NP_POSTINGS_CACHE_TERMS = 4096
+
+# Passages considered and token budget for a library question
+LIBRARY_CHAT_TOP_K = int(os.getenv("LIBRARY_CHAT_TOP_K", 12))
+LIBRARY_CHAT_TOKENS = int(os.getenv("LIBRARY_CHAT_TOKENS", 3000))
+
+_SOURCE_CITATION = re.compile(r"\[(S\d+(?:\s*,\s*S\d+)*)\]")
+
+LIBRARY_CHAT_PROMPT = """You are an AI assistant helping an instructor and students with a reading list of research papers.
+Answer the question using only the passages below. Each passage has a source id and the paper it comes from.
+Cite the sources you use in square brackets, e.g. [S2] or [S1, S4], and name the papers when comparing them.
+If the passages do not contain the answer, say so instead of guessing.
+
+Passages:
+{passages}
+
+Question: {question}
+Answer:"""
+
+
+class LibraryIndex:
+    """BM25 inverted index over all papers, with incremental add and replace."""
+
+    def __init__(self, index_dir: str = LIBRARY_INDEX_DIR, k1: float = BM25_K1, b: float = BM25_B):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        # term -> (chunk numbers, term frequencies); appended as papers arrive
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        # NumPy copies of recently searched postings, current while their
+        # length matches the posting's
+        self._np_postings: "OrderedDict[str, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        # Per chunk number: length in terms, paper number and live flag. The
+        # arrays grow by reallocation and entries below the chunk count only
+        # change to mark chunks deleted, so searches read them unlocked
+        self._doc_len = np.zeros(INITIAL_CHUNK_CAPACITY, dtype=np.float32)
+        self._doc_paper = np.zeros(INITIAL_CHUNK_CAPACITY, dtype=np.int32)
+        self._alive = np.zeros(INITIAL_CHUNK_CAPACITY, dtype=bool)
+        self._doc_chunk: List[str] = []
+        self._live_docs = 0
+        self._live_terms = 0
+        # paper_id -> {"number", "first", "last", "version", "title"}
+        self._papers: Dict[str, Dict[str, Any]] = {}
+        self._paper_ids: List[str] = []
+
+    def _chunk_file(self, paper_id: str) -> str:
+        return os.path.join(self.index_dir, f"{paper_id}.json")
+
+    @staticmethod
+    def _version(paper_info: Dict) -> Optional[List[int]]:
+        path = get_paper_source_path(paper_info)
+        if not path:
+            return None
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _load_or_build_chunks(self, paper_id: str, paper_info: Dict, version: List[int]) -> List[Dict]:
+        """Chunks with term counts, from the paper's chunk file when it is current."""
+        path = self._chunk_file(paper_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == version:
+                return data["chunks"]
+        except (OSError, ValueError):
+            pass
+
+        text = get_paper_text(paper_info)
+        chunks = chunk_paper(text, get_paper_section_index(paper_info, text))
+        for chunk in chunks:
+            chunk["terms"] = dict(Counter(tokenize(chunk["text"])))
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"paper_id": paper_id, "version": version, "chunks": chunks}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        metrics.increment("library_index.papers_chunked")
+        return chunks
+
+    def add_paper(self, paper_id: str, paper_info: Dict) -> bool:
+        """
+        Index a paper, replacing its previous version.
+
+        Args:
+            paper_id: Unique identifier for the paper
+            paper_info: Dictionary containing paper information
+
+        Returns:
+            True if the paper was (re)indexed, False if it was current or
+            has no text
+        """
+        version = self._version(paper_info)
+        if version is None:
+            return False
+        with self._lock:
+            current = self._papers.get(paper_id)
+            if current is not None and current["version"] == version:
+                return False
+
+        chunks = self._load_or_build_chunks(paper_id, paper_info, version)
+        title = paper_info.get("metadata", {}).get("title", "Research Paper")
+
+        with self._lock:
+            self._remove_locked(paper_id)
+            if paper_id in self._papers:
+                number = self._papers[paper_id]["number"]
+            else:
+                number = len(self._paper_ids)
+                self._paper_ids.append(paper_id)
+            first = len(self._doc_chunk)
+            self._reserve_locked(first + len(chunks))
+            for doc, chunk in enumerate(chunks, first):
+                length = sum(chunk["terms"].values())
+                for term, count in chunk["terms"].items():
+                    ids, tfs = self._postings.setdefault(term, (array("i"), array("f")))
+                    ids.append(doc)
+                    tfs.append(count)
+                self._doc_len[doc] = length
+                self._doc_paper[doc] = number
+                self._alive[doc] = True
+                self._doc_chunk.append(chunk["id"])
+                self._live_docs += 1
+                self._live_terms += length
+            self._papers[paper_id] = {
+                "number": number,
+                "first": first,
+                "last": len(self._doc_chunk),
+                "version": version,
+                "title": title,
+            }
+            self._compact_if_needed_locked()
+        metrics.increment("library_index.papers_indexed")
+        return True
+
+    def _reserve_locked(self, size: int) -> None:
+        """Grow the per-chunk arrays to hold size chunks (caller holds the lock)."""
+        capacity = len(self._alive)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2)
+        count = len(self._doc_chunk)
+        # New arrays, so searches still reading the old ones are unaffected
+        for name in ("_doc_len", "_doc_paper", "_alive"):
+            old = getattr(self, name)
+            grown = np.zeros(capacity, dtype=old.dtype)
+            grown[:count] = old[:count]
+            setattr(self, name, grown)
+
+    def _remove_locked(self, paper_id: str) -> None:
+        """Mark a paper's chunks as deleted (caller holds the lock)."""
+        paper = self._papers.get(paper_id)
+        if paper is None:
+            return
+        span = slice(paper["first"], paper["last"])
+        live = self._alive[span]
+        self._live_docs -= int(live.sum())
+        self._live_terms -= int(self._doc_len[span][live].sum())
+        self._alive[span] = False
+        paper["first"] = paper["last"] = len(self._doc_chunk)
+        paper["version"] = None
+
+    def remove_paper(self, paper_id: str) -> None:
+        """Drop a paper from search results and delete its chunk file."""
+        with self._lock:
+            self._remove_locked(paper_id)
+            self._compact_if_needed_locked()
+        try:
+            os.remove(self._chunk_file(paper_id))
+        except OSError:
+            pass
+
+    def _compact_if_needed_locked(self) -> None:
+        """Compact once deleted chunks outnumber live ones (caller holds the lock)."""
+        if len(self._doc_chunk) - self._live_docs > self._live_docs:
+            self._compact_locked()
+
+    def _compact_locked(self) -> None:
+        """Remove deleted chunks from postings and renumber the live ones (caller holds the lock)."""
+        start = time.perf_counter()
+        alive = self._alive[:len(self._doc_chunk)]
+        live = np.flatnonzero(alive)
+        new_doc = (np.cumsum(alive) - 1).astype(np.int32)
+        postings = {}
+        for term, (ids, tfs) in self._postings.items():
+            ids_np = np.array(ids, dtype=np.int32)
+            keep = alive[ids_np]
+            if keep.any():
+                postings[term] = (
+                    array("i", new_doc[ids_np[keep]].tobytes()),
+                    array("f", np.array(tfs, dtype=np.float32)[keep].tobytes()),
+                )
+        self._postings = postings
+        self._np_postings.clear()
+        # Fresh arrays and list: searches holding the old ones finish unaffected
+        capacity = max(INITIAL_CHUNK_CAPACITY, 2 * len(live))
+        doc_len = np.zeros(capacity, dtype=np.float32)
+        doc_len[:len(live)] = self._doc_len[live]
+        doc_paper = np.zeros(capacity, dtype=np.int32)
+        doc_paper[:len(live)] = self._doc_paper[live]
+        alive_new = np.zeros(capacity, dtype=bool)
+        alive_new[:len(live)] = True
+        self._doc_len, self._doc_paper, self._alive = doc_len, doc_paper, alive_new
+        self._doc_chunk = [self._doc_chunk[doc] for doc in live]
+        for paper in self._papers.values():
+            # A live paper's chunks are all alive, so its range just shifts
+            count = paper["last"] - paper["first"]
+            paper["first"] = int(np.searchsorted(live, paper["first"]))
+            paper["last"] = paper["first"] + count
+        metrics.increment("library_index.compactions")
+        logger.info(f"Compacted library index to {len(live)} chunks in {time.perf_counter() - start:.2f}s")
+
+    def _np_posting_locked(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """A term's posting as NumPy arrays, converted again only after it grew (caller holds the lock)."""
+        posting = self._postings.get(term)
+        if posting is None:
+            return None
+        cached = self._np_postings.get(term)
+        if cached is None or len(cached[0]) != len(posting[0]):
+            cached = (np.array(posting[0], dtype=np.int32), np.array(posting[1], dtype=np.float32))
+            self._np_postings[term] = cached
+            while len(self._np_postings) > NP_POSTINGS_CACHE_TERMS:
+                self._np_postings.popitem(last=False)
+        self._np_postings.move_to_end(term)
+        return cached
+
+    def _scores(self, postings: List[Tuple[np.ndarray, np.ndarray]], count: int, doc_len: np.ndarray,
+                alive: np.ndarray, live_docs: int, live_terms: int) -> np.ndarray:
+        """BM25 score of the first count chunks for the query terms' postings."""
+        scores = np.zeros(count, dtype=np.float32)
+        if not live_docs:
+            return scores
+        avg_len = live_terms / live_docs
+        for ids, tfs in postings:
+            live = alive[ids]
+            if not live.all():
+                ids, tfs = ids[live], tfs[live]
+            df = len(ids)
+            if not df:
+                continue
+            idf = math.log(1 + (live_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_len[ids] / avg_len)
+            # A term lists each chunk once, so this adds without collisions
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        return scores
+
+    def search(self, query: str, top_k: int = 10, paper_ids: Optional[List[str]] = None,
+               max_per_paper: int = MAX_RESULTS_PER_PAPER) -> List[Dict]:
+        """
+        Best matching passages across the library.
+
+        Only the query terms' postings are read; scoring runs without the
+        index lock.
+
+        Args:
+            query: Question or search text
+            top_k: Maximum number of passages
+            paper_ids: Restrict the search to these papers (a reading list)
+            max_per_paper: Maximum number of passages from one paper
+
+        Returns:
+            Passages, best first, with paper_id, title, chunk id, section,
+            score and text
+        """
+        start = time.perf_counter()
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._doc_chunk)
+            postings = [p for p in (self._np_posting_locked(term) for term in terms) if p is not None]
+            doc_len, doc_paper, alive = self._doc_len, self._doc_paper, self._alive
+            doc_chunk, all_paper_ids = self._doc_chunk, self._paper_ids
+            live_docs, live_terms = self._live_docs, self._live_terms
+            # A paper's live chunks are one contiguous range
+            ranges = None
+            if paper_ids is not None:
+                ranges = [(self._papers[p]["first"], self._papers[p]["last"]) for p in paper_ids if p in self._papers]
+
+        scores = self._scores(postings, count, doc_len, alive, live_docs, live_terms)
+        if ranges is not None:
+            selected = np.zeros(count, dtype=bool)
+            for first, last in ranges:
+                selected[first:last] = True
+            scores *= selected
+
+        matching = np.flatnonzero(scores > 0)
+        # Enough candidates to fill top_k under the per-paper cap
+        candidates = min(len(matching), top_k * max(1, max_per_paper) * 4)
+        if not candidates:
+            return []
+        best = matching[np.argpartition(-scores[matching], candidates - 1)[:candidates]]
+        best = best[np.argsort(-scores[best], kind="stable")]
+
+        picked = []
+        per_paper: Counter = Counter()
+        for doc in best:
+            if len(picked) >= top_k:
+                break
+            paper_id = all_paper_ids[doc_paper[doc]]
+            if per_paper[paper_id] >= max_per_paper:
+                continue
+            per_paper[paper_id] += 1
+            picked.append((paper_id, doc_chunk[doc], float(scores[doc])))
+        with self._lock:
+            hits = [(paper_id, self._papers[paper_id]["title"], chunk_id, score)
+                    for paper_id, chunk_id, score in picked]
+
+        results = self._attach_text(hits)
+        metrics.observe("library_index.search_seconds", time.perf_counter() - start)
+        return results
+
+    def _attach_text(self, hits: List[Tuple[str, str, str, float]]) -> List[Dict]:
+        """Read the text of each hit from its paper's chunk file."""
+        chunk_files: Dict[str, Dict[str, Dict]] = {}
+        results = []
+        for paper_id, title, chunk_id, score in hits:
+            if paper_id not in chunk_files:
+                try:
+                    with open(self._chunk_file(paper_id), "r", encoding="utf-8") as f:
+                        chunk_files[paper_id] = {c["id"]: c for c in json.load(f)["chunks"]}
+                except (OSError, ValueError) as e:
+                    logger.error(f"Error reading library chunks of paper {paper_id}: {str(e)}")
+                    chunk_files[paper_id] = {}
+            chunk = chunk_files[paper_id].get(chunk_id)
+            if chunk is None:
+                continue
+            results.append({
+                "paper_id": paper_id,
+                "title": title,
+                "chunk_id": chunk_id,
+                "section": chunk["section"],
+                "score": round(score, 4),
+                "text": chunk["text"],
+            })
+        return results
+
+    def sync(self, papers: Dict[str, Dict]) -> int:
+        """
+        Bring the index in line with the paper store.
+
+        Current chunk files are reused, so a restart does not re-read or
+        re-tokenize papers that did not change.
+
+        Args:
+            papers: All stored papers by ID
+
+        Returns:
+            Number of papers (re)indexed
+        """
+        start = time.perf_counter()
+        indexed = 0
+        for paper_id, paper_info in list(papers.items()):
+            try:
+                if self.add_paper(paper_id, paper_info):
+                    indexed += 1
+            except Exception as e:
+                logger.error(f"Error indexing paper {paper_id} for library search: {str(e)}")
+        with self._lock:
+            gone = [paper_id for paper_id in self._papers if paper_id not in papers]
+        for paper_id in gone:
+            self.remove_paper(paper_id)
+        logger.info(f"Library index synced: {indexed} papers indexed in {time.perf_counter() - start:.1f}s")
+        return indexed
+
+    def stats(self) -> Dict[str, int]:
+        """Indexed paper, chunk and term counts."""
+        with self._lock:
+            return {
+                "papers": sum(1 for paper in self._papers.values() if paper["version"] is not None),
+                "chunks": self._live_docs,
+                "deleted_chunks": len(self._doc_chunk) - self._live_docs,
+                "terms": len(self._postings),
+            }
+
+
+# Global library index
+library_index = LibraryIndex()
+
+# Background indexing tasks, kept referenced until done
+_tasks: set = set()
+
+
+def schedule_library_indexing(paper_id: str, paper_info: Optional[Dict] = None) -> None:
+    """
+    Index a newly ingested paper in the background.
+
+    Must be called from the event loop.
+
+    Args:
+        paper_id: Unique identifier for the paper
+        paper_info: Paper information (looked up in storage if not given)
+    """
+    paper_info = paper_info or storage_manager.get_paper(paper_id)
+    if not paper_info:
+        return
+
+    async def index() -> None:
+        try:
+            await run_in_threadpool(library_index.add_paper, paper_id, paper_info)
+        except Exception as e:
+            logger.error(f"Error indexing paper {paper_id} for library search: {str(e)}")
+
+    task = asyncio.create_task(index())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def start_library_sync() -> None:
+    """Index every stored paper in the background. Must be called from the event loop."""
+    task = asyncio.create_task(run_in_threadpool(library_index.sync, storage_manager.get_all_papers()))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def format_library_passages(passages: List[Dict]) -> Tuple[str, List[Dict]]:
+    """
+    Passages for a prompt, numbered as sources [S1], [S2], ... with their paper.
+
+    Args:
+        passages: Results of LibraryIndex.search
+
+    Returns:
+        (prompt text, sources with id, paper_id, title, chunk_id, section
+        and snippet)
+    """
+    parts = []
+    sources = []
+    for number, passage in enumerate(passages, 1):
+        source_id = f"S{number}"
+        section = f", {passage['section']}" if passage["section"] else ""
+        parts.append(f"[{source_id}] ({passage['title']}{section})\n{passage['text']}")
+        sources.append({
+            "id": source_id,
+            "paper_id": passage["paper_id"],
+            "title": passage["title"],
+            "chunk_id": passage["chunk_id"],
+            "section": passage["section"],
+            "snippet": passage["text"][:SNIPPET_CHARS],
+        })
+    return "\n\n".join(parts), sources
+
+
+def fit_passages(passages: List[Dict], max_tokens: int) -> List[Dict]:
+    """Best passages that fit a token budget, in ranking order."""
+    selected = []
+    used = 0
+    for passage in passages:
+        tokens = estimate_tokens(passage["text"])
+        if used + tokens > max_tokens:
+            continue
+        selected.append(passage)
+        used += tokens
+    return selected
+
+
+async def answer_library_question(question: str, paper_ids: Optional[List[str]] = None) -> Dict:
+    """
+    Answer a question from passages retrieved across the library.
+
+    Only the retrieved passages go into the prompt, never whole papers.
+
+    Args:
+        question: The user's question
+        paper_ids: Restrict retrieval to these papers (a reading list)
+
+    Returns:
+        Dictionary with "answer" and "sources" (each with paper_id, title,
+        chunk_id, section, snippet and whether the answer cites it)
+
+    Raises:
+        Exception: Errors from the Gemini API are propagated
+    """
+    passages = await run_in_threadpool(library_index.search, question, LIBRARY_CHAT_TOP_K, paper_ids)
+    passages = fit_passages(passages, LIBRARY_CHAT_TOKENS)
+    if not passages:
+        return {"answer": "None of the papers in the library has a passage matching this question.", "sources": []}
+
+    passage_text, sources = format_library_passages(passages)
+    prompt = LIBRARY_CHAT_PROMPT.format(passages=passage_text, question=question)
+    metrics.observe("library_chat.prompt_tokens", estimate_tokens(prompt))
+    answer = await agenerate_text(prompt, chatbot_service.api_key, chatbot_service.model_name,
+                                  call_site="library.chat")
+
+    cited = set()
+    for match in _SOURCE_CITATION.finditer(answer):
+        cited.update(re.split(r"\s*,\s*", match.group(1)))
+    for source in sources:
+        source["cited"] = source["id"] in cited
+    return {"answer": answer, "sources": sources}
@@ -0,0 +1,195 @@
+"""
+LLM Response Cache
+Disk-backed cache of model responses keyed on model, prompt and generation
+config, with a TTL, a size bound and per-call-site hit metrics
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "temp/llm_cache")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Request header that skips cache reads for one request ("X-LLM-Cache: bypass")
+BYPASS_HEADER = "x-llm-cache"
+BYPASS_VALUE = "bypass"
+
+# Set per request (see main.py middleware); fresh responses are still stored
+llm_cache_bypass: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+def make_cache_key(model_name: str, prompt: str, generation_config: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Cache key for one model call.
+
+    Args:
+        model_name: Model the prompt is sent to
+        prompt: Full prompt text
+        generation_config: Generation parameters (temperature, schema, ...)
+
+    Returns:
+        Hex digest identifying the call
+    """
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    config = json.dumps(generation_config or {}, sort_keys=True, default=str)
+    return hashlib.sha256(f"{model_name}\0{prompt_hash}\0{config}".encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Response cache stored as one JSON file per entry, evicted oldest-used first."""
+
+    def __init__(self, cache_dir: str = LLM_CACHE_DIR, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> file size, in least recently used order
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_index(self) -> None:
+        """Rebuild the in-memory size index from the files on disk."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                found.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def get(self, key: str, call_site: str = "default") -> Optional[str]:
+        """
+        Cached response text, or None on a miss or an expired entry.
+
+        Args:
+            key: Key from make_cache_key
+            call_site: Name of the calling generator, for hit-rate metrics
+
+        Returns:
+            Response text or None
+        """
+        path = self._path(key)
+        entry = None
+        with self._lock:
+            if key in self._entries:
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        entry = json.load(f)
+                except (OSError, ValueError):
+                    self._remove(key)
+
+            if entry is not None and time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+                self._remove(key)
+                entry = None
+
+            if entry is not None:
+                self._entries.move_to_end(key)
+                # mtime records recency so eviction order survives restarts
+                os.utime(path)
+
+        if entry is None:
+            metrics.increment(f"llm_cache.{call_site}.misses")
+            return None
+        metrics.increment(f"llm_cache.{call_site}.hits")
+        return entry["text"]
+
+    def put(self, key: str, text: str, model_name: str, call_site: str = "default") -> None:
+        """
+        Store a response and evict least recently used entries over budget.
+
+        Args:
+            key: Key from make_cache_key
+            text: Response text
+            model_name: Model that produced the response
+            call_site: Name of the calling generator
+        """
+        data = json.dumps({
+            "created_at": time.time(),
+            "model": model_name,
+            "call_site": call_site,
+            "text": text,
+        }, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        """Delete one entry (caller holds the lock)."""
+        self._total_bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def invalidate(self, key: str) -> None:
+        """Delete one cached response (e.g. one that failed validation)."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """Delete every cached response."""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count, bytes used and hit rate per call site."""
+        counters = metrics.snapshot()["counters"]
+        call_sites: Dict[str, Dict[str, float]] = {}
+        for name, value in counters.items():
+            if not name.startswith("llm_cache."):
+                continue
+            site, kind = name[len("llm_cache."):].rsplit(".", 1)
+            call_sites.setdefault(site, {"hits": 0, "misses": 0})[kind] = value
+        for site in call_sites.values():
+            lookups = site["hits"] + site["misses"]
+            site["hit_rate"] = site["hits"] / lookups if lookups else 0.0
+
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "call_sites": call_sites,
+            }
+
+
+# Global LLM response cache
+llm_cache = LLMResponseCache()
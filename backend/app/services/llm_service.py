@@ -0,0 +1,231 @@
+"""
+LLM Service
+Single entry point for Gemini text generation, shared by every generator,
+with responses served from the LLM response cache when possible. Calls run
+on the event loop with a deadline per call
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from app.services.gemini_clients import gemini_clients
+from app.services.gemini_key_pool import gemini_key_pool
+from app.services.llm_cache import llm_cache, llm_cache_bypass, make_cache_key
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# Deadline for one async call, including retries on other pool keys
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", 120))
+
+
+class LLMTimeoutError(TimeoutError):
+    """A Gemini call did not finish before its deadline."""
+
+
+async def agenerate_text(prompt: str, api_key: str, model_name: str = DEFAULT_MODEL,
+                         call_site: str = "default", generation_config: Optional[Dict[str, Any]] = None,
+                         use_cache: bool = True, timeout: Optional[float] = None) -> str:
+    """
+    Generate text with Gemini, reusing cached responses for identical calls.
+
+    The request runs on the event loop, not in a thread; cancelling the
+    awaiting task cancels the request.
+
+    Args:
+        prompt: Full prompt text
+        api_key: Gemini API key
+        model_name: Gemini model name
+        call_site: Name of the calling generator (for metrics)
+        generation_config: Generation parameters, part of the cache key
+        use_cache: Whether the response may be cached
+        timeout: Deadline in seconds (default LLM_CALL_TIMEOUT)
+
+    Returns:
+        Response text
+
+    Raises:
+        LLMTimeoutError: If the deadline passes first
+        Exception: Errors from the Gemini API are propagated
+    """
+    key = make_cache_key(model_name, prompt, generation_config)
+    if use_cache and not llm_cache_bypass.get():
+        cached = llm_cache.get(key, call_site)
+        if cached is not None:
+            return cached
+
+    deadline = timeout or LLM_CALL_TIMEOUT
+    start = time.perf_counter()
+    if api_key in gemini_key_pool:
+        call = _agenerate_with_pool(prompt, model_name, generation_config)
+    else:
+        call = _agenerate(prompt, api_key, model_name, generation_config)
+    try:
+        response = await asyncio.wait_for(call, deadline)
+    except asyncio.TimeoutError:
+        metrics.increment(f"llm.{call_site}.timeouts")
+        raise LLMTimeoutError(f"Gemini call {call_site} did not finish within {deadline:g}s")
+    metrics.observe(f"llm.{call_site}.seconds", time.perf_counter() - start)
+
+    text = response.text
+    if use_cache and text:
+        llm_cache.put(key, text, model_name, call_site)
+    return text
+
+
+async def astream_text(prompt: str, api_key: str, model_name: str = DEFAULT_MODEL,
+                       call_site: str = "default", generation_config: Optional[Dict[str, Any]] = None,
+                       use_cache: bool = True, timeout: Optional[float] = None) -> AsyncIterator[str]:
+    """
+    Generate text with Gemini, yielding it in chunks as the model produces them.
+
+    A cached response is yielded as a single chunk; a streamed response is
+    cached once it completes. The deadline covers the whole stream.
+
+    Args:
+        prompt: Full prompt text
+        api_key: Gemini API key
+        model_name: Gemini model name
+        call_site: Name of the calling generator (for metrics)
+        generation_config: Generation parameters, part of the cache key
+        use_cache: Whether the response may be cached
+        timeout: Deadline in seconds (default LLM_CALL_TIMEOUT)
+
+    Yields:
+        Chunks of response text
+
+    Raises:
+        LLMTimeoutError: If the deadline passes first
+        Exception: Errors from the Gemini API are propagated
+    """
+    key = make_cache_key(model_name, prompt, generation_config)
+    if use_cache and not llm_cache_bypass.get():
+        cached = llm_cache.get(key, call_site)
+        if cached is not None:
+            yield cached
+            return
+
+    deadline = timeout or LLM_CALL_TIMEOUT
+    loop = asyncio.get_running_loop()
+    expires_at = loop.time() + deadline
+    start = time.perf_counter()
+    if api_key in gemini_key_pool:
+        chunks = _astream_with_pool(prompt, model_name, generation_config)
+    else:
+        chunks = _astream(prompt, api_key, model_name, generation_config)
+
+    parts = []
+    try:
+        while True:
+            try:
+                text = await asyncio.wait_for(chunks.__anext__(), expires_at - loop.time())
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                metrics.increment(f"llm.{call_site}.timeouts")
+                raise LLMTimeoutError(f"Gemini stream {call_site} did not finish within {deadline:g}s")
+            if not parts:
+                metrics.observe(f"llm.{call_site}.first_chunk_seconds", time.perf_counter() - start)
+            parts.append(text)
+            yield text
+    finally:
+        await chunks.aclose()
+    metrics.observe(f"llm.{call_site}.seconds", time.perf_counter() - start)
+
+    text = "".join(parts)
+    if use_cache and text:
+        llm_cache.put(key, text, model_name, call_site)
+
+
+async def _agenerate(prompt: str, api_key: str, model_name: str,
+                     generation_config: Optional[Dict[str, Any]] = None):
+    """Send one async request with a specific key."""
+    model = gemini_clients.get_async_model(api_key, model_name)
+    if generation_config:
+        return await model.generate_content_async(prompt, generation_config=generation_config)
+    return await model.generate_content_async(prompt)
+
+
+async def _agenerate_with_pool(prompt: str, model_name: str,
+                               generation_config: Optional[Dict[str, Any]] = None):
+    """
+    Send one async request with a key from the server pool.
+
+    A 429 cools the key down and the request is retried on another key, up
+    to one attempt per key plus one. A cancelled call gives its key back.
+    """
+    last_error = None
+    for _ in range(len(gemini_key_pool) + 1):
+        api_key = await gemini_key_pool.acquire_async()
+        start = time.perf_counter()
+        try:
+            response = await _agenerate(prompt, api_key, model_name, generation_config)
+        except (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests) as e:
+            gemini_key_pool.release(api_key, time.perf_counter() - start, rate_limited=True)
+            metrics.increment("llm.rate_limited")
+            last_error = e
+            continue
+        except asyncio.CancelledError:
+            gemini_key_pool.release(api_key, time.perf_counter() - start)
+            raise
+        except Exception:
+            gemini_key_pool.release(api_key, time.perf_counter() - start, error=True)
+            raise
+        gemini_key_pool.release(api_key, time.perf_counter() - start)
+        return response
+    raise last_error
+
+
+async def _astream(prompt: str, api_key: str, model_name: str,
+                   generation_config: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """Stream one async request with a specific key, yielding text chunks."""
+    model = gemini_clients.get_async_model(api_key, model_name)
+    if generation_config:
+        response = await model.generate_content_async(prompt, generation_config=generation_config, stream=True)
+    else:
+        response = await model.generate_content_async(prompt, stream=True)
+    async for chunk in response:
+        if chunk.parts:
+            yield chunk.text
+
+
+async def _astream_with_pool(prompt: str, model_name: str,
+                             generation_config: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """
+    Stream one async request with a key from the server pool.
+
+    A 429 before the first chunk is retried on another key, as in
+    _agenerate_with_pool; once text has been yielded errors are raised.
+    """
+    last_error = None
+    for _ in range(len(gemini_key_pool) + 1):
+        api_key = await gemini_key_pool.acquire_async()
+        start = time.perf_counter()
+        started = False
+        try:
+            async for text in _astream(prompt, api_key, model_name, generation_config):
+                started = True
+                yield text
+        except (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests) as e:
+            gemini_key_pool.release(api_key, time.perf_counter() - start, rate_limited=True)
+            metrics.increment("llm.rate_limited")
+            if started:
+                raise
+            last_error = e
+            continue
+        except (GeneratorExit, asyncio.CancelledError):
+            gemini_key_pool.release(api_key, time.perf_counter() - start)
+            raise
+        except Exception:
+            gemini_key_pool.release(api_key, time.perf_counter() - start, error=True)
+            raise
+        gemini_key_pool.release(api_key, time.perf_counter() - start)
+        return
+    raise last_error
@@ -0,0 +1,54 @@
+"""
+Metrics Service
+Process-local counters and timings for performance monitoring
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, Any
+
+
+class MetricsRegistry:
+    """Thread-safe registry of named counters and timing summaries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """Add value to a counter."""
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        """Record one observation (e.g. a duration in seconds)."""
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                self._timings[name] = {
+                    "count": 1, "sum": value, "min": value, "max": value, "last": value
+                }
+                return
+            timing["count"] += 1
+            timing["sum"] += value
+            timing["min"] = min(timing["min"], value)
+            timing["max"] = max(timing["max"], value)
+            timing["last"] = value
+
+    def get_counter(self, name: str) -> float:
+        """Current value of a counter (0 if never incremented)."""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copy of all counters and timings, with averages filled in."""
+        with self._lock:
+            timings = {}
+            for name, timing in self._timings.items():
+                timings[name] = {**timing, "avg": timing["sum"] / timing["count"]}
+            return {"counters": dict(self._counters), "timings": timings}
+
+
+# Global metrics instance
+metrics = MetricsRegistry()
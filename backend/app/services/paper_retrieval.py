@@ -0,0 +1,288 @@
+"""
+Paper Retrieval Service
+Splits a paper into section-aware chunks and ranks them against a question
+with BM25 (NumPy), so chat prompts carry only the passages that matter
+"""
+
+import os
+import re
+import math
+import logging
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.paper_text import get_paper_text, get_paper_source_path
+from app.services.context_builder import estimate_tokens, get_paper_section_index
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Target chunk size; chunks end at a sentence or line break and never span
+# two sections
+CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", 1000))
+
+# Token budget and chunk count for the passages retrieved for each question
+CHAT_RETRIEVAL_TOKENS = int(os.getenv("CHAT_RETRIEVAL_TOKENS", 2000))
+CHAT_RETRIEVAL_TOP_K = int(os.getenv("CHAT_RETRIEVAL_TOP_K", 6))
+
+# Indexed papers kept in memory, bounded by count and by approximate size
+PAPER_INDEX_CACHE_ENTRIES = int(os.getenv("PAPER_INDEX_CACHE_ENTRIES", 64))
+PAPER_INDEX_CACHE_MAX_BYTES = int(os.getenv("PAPER_INDEX_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_CITATION = re.compile(r"\[((?:c\d+)(?:\s*,\s*c\d+)*)\]")
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers him his how i if in into is it its itself just me more most my no nor not now
+of off on once only or other our ours out over own paper same she should so some such than that the
+their theirs them then there these they this those through to too under until up very was we were
+what when where which while who whom why will with would you your yours
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords or single characters."""
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def chunk_paper(text: str, index: Dict, chunk_chars: int = CHUNK_CHARS) -> List[Dict]:
+    """
+    Split paper text into chunks of about chunk_chars characters.
+
+    Args:
+        text: Full paper text the index was built from
+        index: Section index dictionary
+        chunk_chars: Target chunk size in characters
+
+    Returns:
+        Chunks in document order with id ("c0", "c1", ...), section title,
+        start/end offsets and text
+    """
+    headings = sorted(index.get("sections", []), key=lambda s: s["start"])
+    boundaries = sorted({0, len(text)} | {h["start"] for h in headings})
+
+    chunks = []
+    for segment_start, segment_end in zip(boundaries, boundaries[1:]):
+        # Innermost heading containing this segment
+        section = None
+        for heading in headings:
+            if heading["start"] <= segment_start < heading["end"]:
+                section = heading["title"]
+
+        pos = segment_start
+        while pos < segment_end:
+            end = min(pos + chunk_chars, segment_end)
+            if end < segment_end:
+                half = pos + chunk_chars // 2
+                cut = max(text.rfind(". ", half, end), text.rfind("\n", half, end))
+                if cut != -1:
+                    end = cut + 1
+            piece = text[pos:end].strip()
+            if piece:
+                chunks.append({
+                    "id": f"c{len(chunks)}",
+                    "section": section,
+                    "start": pos,
+                    "end": end,
+                    "text": piece,
+                })
+            pos = end
+    return chunks
+
+
+class BM25Index:
+    """BM25 over a fixed set of documents, with per-term posting arrays."""
+
+    def __init__(self, documents: List[List[str]], k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.size = len(documents)
+        doc_len = np.array([len(doc) for doc in documents], dtype=np.float32)
+        avg_len = float(doc_len.mean()) if self.size and doc_len.mean() > 0 else 1.0
+        # Length normalization per document, precomputed once
+        self._norm = k1 * (1 - b + b * doc_len / avg_len)
+
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        for doc_id, doc in enumerate(documents):
+            for term, count in Counter(doc).items():
+                ids, tfs = postings.setdefault(term, ([], []))
+                ids.append(doc_id)
+                tfs.append(count)
+
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        for term, (ids, tfs) in postings.items():
+            df = len(ids)
+            idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+            self._postings[term] = (np.array(ids, dtype=np.int32), np.array(tfs, dtype=np.float32), idf)
+
+    @property
+    def size_bytes(self) -> int:
+        """Approximate memory used by the postings."""
+        return sum(ids.nbytes + tfs.nbytes + len(term) + 100 for term, (ids, tfs, _) in self._postings.items())
+
+    def scores(self, query_terms: List[str]) -> np.ndarray:
+        """BM25 score of every document for the query terms."""
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(query_terms):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs, idf = posting
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + self._norm[ids])
+        return scores
+
+
+class PaperIndex:
+    """Chunks of one paper and their BM25 index."""
+
+    def __init__(self, text: str, section_index: Dict, chunk_chars: int = CHUNK_CHARS):
+        self.chunks = chunk_paper(text, section_index, chunk_chars)
+        self._by_id = {chunk["id"]: chunk for chunk in self.chunks}
+        self.bm25 = BM25Index([tokenize(chunk["text"]) for chunk in self.chunks])
+        # Chunk texts plus postings, for the cache's size bound
+        self.size_bytes = sum(len(chunk["text"]) + 200 for chunk in self.chunks) + self.bm25.size_bytes
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[Dict, float]]:
+        """
+        Best matching chunks for a query.
+
+        Args:
+            query: Question or search text
+            top_k: Maximum number of chunks
+
+        Returns:
+            (chunk, score) pairs, best first; chunks sharing no term with the
+            query are left out
+        """
+        scores = self.bm25.scores(tokenize(query))
+        if not len(scores):
+            return []
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(self.chunks[i], float(scores[i])) for i in best if scores[i] > 0]
+
+    def retrieve(self, query: str, max_tokens: int, top_k: int = 8) -> List[Dict]:
+        """
+        Passages for a prompt: best matches that fit the token budget.
+
+        Args:
+            query: Question or search text
+            max_tokens: Token budget for the passages
+            top_k: Maximum number of chunks
+
+        Returns:
+            Chunks in document order
+        """
+        selected = []
+        used = 0
+        for chunk, _ in self.search(query, top_k):
+            tokens = estimate_tokens(chunk["text"])
+            if used + tokens > max_tokens:
+                continue
+            selected.append(chunk)
+            used += tokens
+        return sorted(selected, key=lambda chunk: chunk["start"])
+
+    def get_chunk(self, chunk_id: str) -> Optional[Dict]:
+        """Chunk by id, or None."""
+        return self._by_id.get(chunk_id)
+
+
+def format_passages(chunks: List[Dict]) -> str:
+    """Passages for a prompt, each prefixed with its citable id and section."""
+    parts = []
+    for chunk in chunks:
+        label = f"[{chunk['id']}]" + (f" ({chunk['section']})" if chunk["section"] else "")
+        parts.append(f"{label}\n{chunk['text']}")
+    return "\n\n".join(parts)
+
+
+def find_citations(text: str) -> List[str]:
+    """Chunk ids cited in an answer ("[c3]", "[c3, c7]"), in order of first use."""
+    cited = []
+    for match in _CITATION.finditer(text):
+        for chunk_id in re.split(r"\s*,\s*", match.group(1)):
+            if chunk_id not in cited:
+                cited.append(chunk_id)
+    return cited
+
+
+class PaperIndexCache:
+    """LRU cache of paper indexes keyed by source file version."""
+
+    def __init__(self, max_entries: int = PAPER_INDEX_CACHE_ENTRIES, max_bytes: int = PAPER_INDEX_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, int, int], PaperIndex]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_index(self, paper_info: Dict) -> PaperIndex:
+        """
+        Index of a paper, built on first use.
+
+        Args:
+            paper_info: Dictionary containing paper information
+
+        Returns:
+            PaperIndex for the paper's current text
+
+        Raises:
+            FileNotFoundError: If the paper has no readable text source
+        """
+        path = get_paper_source_path(paper_info)
+        if not path:
+            raise FileNotFoundError("Paper text file not found")
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                return index
+
+        text = get_paper_text(paper_info)
+        index = PaperIndex(text, get_paper_section_index(paper_info, text))
+        metrics.increment("paper_retrieval.indexes_built")
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old.size_bytes
+            self._entries[key] = index
+            self._total_bytes += index.size_bytes
+            # The newest index stays even if it alone is over the bound
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.size_bytes
+        return index
+
+    def stats(self) -> Dict[str, int]:
+        """Indexed paper count and approximate bytes used."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Global paper index cache
+paper_index_cache = PaperIndexCache()
+
+
+def get_paper_index(paper_info: Dict) -> PaperIndex:
+    """Retrieval index of a paper through the shared cache."""
+    return paper_index_cache.get_index(paper_info)
@@ -0,0 +1,154 @@
+"""
+Paper Text Service
+Single accessor for a paper's plain text, shared by every generator, with a
+byte-bounded LRU cache so repeated requests do not re-read the source
+"""
+
+import os
+import sys
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.services.latex_text import latex_to_plain_text
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Total size of cached texts kept in memory
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def get_paper_source_path(paper_info: Dict) -> Optional[str]:
+    """
+    Path of the file a paper's text comes from.
+
+    PDF papers have an extracted text file; LaTeX papers only have the .tex
+    source, which is normalized to plain text when read.
+
+    Args:
+        paper_info: Dictionary containing paper information
+
+    Returns:
+        Path to the text or LaTeX file, or None if the paper has neither
+    """
+    for key in ("text_file_path", "tex_file_path"):
+        path = paper_info.get(key)
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def _read_file(path: str) -> str:
+    """Read a UTF-8 file (each version is read once; the cache holds the text)."""
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return f.read()
+
+
+class PaperTextCache:
+    """LRU cache of normalized paper texts, bounded by total memory size."""
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._sizes: Dict[Tuple[str, int, int], int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_text(self, paper_info: Dict) -> str:
+        """
+        Get a paper's plain text, reading and normalizing it at most once.
+
+        Args:
+            paper_info: Dictionary containing paper information
+
+        Returns:
+            Plain text of the paper (LaTeX markup stripped)
+
+        Raises:
+            FileNotFoundError: If the paper has no readable text source
+        """
+        path = get_paper_source_path(paper_info)
+        if not path:
+            raise FileNotFoundError("Paper text file not found")
+
+        stat = os.stat(path)
+        # mtime and size in the key invalidate entries when a file is rewritten
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                metrics.increment("paper_text.cache_hits")
+                return text
+
+        metrics.increment("paper_text.cache_misses")
+        text = _read_file(path)
+        if not path.endswith('.txt'):
+            text = latex_to_plain_text(text)
+
+        self._put(key, text)
+        return text
+
+    def _put(self, key: Tuple[str, int, int], text: str) -> None:
+        """Insert an entry and evict least recently used ones over budget."""
+        size = sys.getsizeof(text)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                return
+            # Drop stale versions of the same file
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                self._evict(stale)
+            self._entries[key] = text
+            self._sizes[key] = size
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: Tuple[str, int, int]) -> None:
+        """Remove one entry (caller holds the lock)."""
+        del self._entries[key]
+        self._total_bytes -= self._sizes.pop(key)
+
+    def clear(self) -> None:
+        """Drop all cached texts."""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict:
+        """Number of cached papers and bytes used."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+# Global paper text cache
+paper_text_cache = PaperTextCache(
+    max_bytes=int(os.getenv("PAPER_TEXT_CACHE_BYTES", DEFAULT_CACHE_BYTES))
+)
+
+
+def get_paper_text(paper_info: Dict) -> str:
+    """
+    Get a paper's plain text through the shared cache.
+
+    Args:
+        paper_info: Dictionary containing paper information
+
+    Returns:
+        Plain text of the paper
+
+    Raises:
+        FileNotFoundError: If the paper has no readable text source
+    """
+    return paper_text_cache.get_text(paper_info)
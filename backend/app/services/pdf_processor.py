@@ -1,19 +1,46 @@
 import os
+import io
+import hashlib
 import fitz  # PyMuPDF
 import re
 import tempfile
 import uuid
+import multiprocessing
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+from app.services.section_index import (
+    match_heading,
+    finalize_index,
+    save_section_index,
+    get_sections
+)
 
-def process_pdf_file(pdf_path: str, paper_id: str) -> Dict:
+# Embedded images smaller than this (pixels, either side) are icons or bullets
+MIN_IMAGE_DIMENSION = 64
+
+# Embedded bitmaps larger than this (pixels, longest side) are downscaled
+MAX_IMAGE_DIMENSION = 2400
+
+# Figure-region fallback: minimum figure size and merge distance (points),
+# render zoom, and worker processes used to render pages
+MIN_FIGURE_SIZE = 100
+FIGURE_MERGE_GAP = 12
+FIGURE_RENDER_ZOOM = 2
+FIGURE_RENDER_WORKERS = min(4, os.cpu_count() or 1)
+
+def process_pdf_file(pdf_path: str, paper_id: str, extract_images: bool = True) -> Dict:
     """
     Process a PDF file to extract text, images, and metadata.
     
     Args:
         pdf_path: Path to the PDF file
         paper_id: Unique identifier for the paper
+        extract_images: Extract images now; when False the result is marked
+            with images_status "pending" and images are extracted later with
+            extract_images_from_pdf_file
         
     Returns:
         Dictionary with metadata, extracted images, and text
@@ -32,18 +59,18 @@ def process_pdf_file(pdf_path: str, paper_id: str) -> Dict:
     # Extract metadata
     metadata = extract_pdf_metadata(doc)
     
-    # Extract text
-    full_text = ""
-    for page in doc:
-        full_text += page.get_text() + "\n\n"
+    # Extract text and locate section headings in the same pass
+    full_text, section_index = extract_text_with_section_index(doc)
     
     # Extract and save images
-    image_files = extract_pdf_images(doc, image_dir)
+    image_files = extract_pdf_images(doc, image_dir) if extract_images else []
+    doc.close()
     
     # Create a text file with the extracted content
     text_file_path = os.path.join(extract_dir, "extracted_text.txt")
     with open(text_file_path, "w", encoding="utf-8") as f:
         f.write(full_text)
+    section_index_path = save_section_index(section_index, text_file_path)
     
     # Save a copy of the PDF
     pdf_copy_path = os.path.join(extract_dir, f"paper.pdf")
@@ -54,12 +81,30 @@ def process_pdf_file(pdf_path: str, paper_id: str) -> Dict:
         "metadata": metadata,
         "text_file_path": text_file_path,
         "tex_file_path": text_file_path,  # Add this for compatibility with script generator
+        "section_index_path": section_index_path,
         "source_dir": extract_dir,
+        "image_dir": image_dir,
         "image_files": image_files,
+        "images_status": "ready" if extract_images else "pending",
         "pdf_path": pdf_copy_path,
         "status": "processed"
     }
 
+def extract_images_from_pdf_file(pdf_path: str, image_dir: str) -> List[str]:
+    """
+    Open a PDF and extract its images (the deferred image stage of ingest).
+    
+    Args:
+        pdf_path: Path to the PDF file
+        image_dir: Directory to save extracted images
+        
+    Returns:
+        List of paths to saved image files
+    """
+    os.makedirs(image_dir, exist_ok=True)
+    with fitz.open(pdf_path) as doc:
+        return extract_pdf_images(doc, image_dir)
+
 def extract_pdf_metadata(doc: fitz.Document) -> Dict:
     """Extract metadata from the PDF document."""
     metadata = {
@@ -102,36 +147,77 @@ def extract_pdf_metadata(doc: fitz.Document) -> Dict:
     
     return metadata
 
-def extract_pdf_images(doc: fitz.Document, output_dir: str) -> List[str]:
+def extract_pdf_images(
+    doc: fitz.Document,
+    output_dir: str,
+    min_dimension: int = MIN_IMAGE_DIMENSION,
+    max_dimension: Optional[int] = MAX_IMAGE_DIMENSION
+) -> List[str]:
     """
     Extract images from PDF and save them to disk.
     
+    Each embedded image is extracted once, even if it is placed on many pages
+    (logos, headers), and byte-identical images stored under different xrefs
+    are written only once. Tiny images and stencil/soft masks are skipped.
+    
     Args:
         doc: PyMuPDF document
         output_dir: Directory to save extracted images
+        min_dimension: Images narrower or shorter than this (pixels) are skipped
+        max_dimension: Bitmaps whose longest side exceeds this (pixels) are
+            downscaled and re-encoded; None keeps the original bytes
         
     Returns:
-        List of paths to saved image files
+        Deduplicated list of paths to saved image files
     """
     image_files = []
-    image_count = 0
+    seen_xrefs = set()
+    seen_hashes = set()
+    
+    # Soft masks are referenced by the images they belong to; never keep them
+    mask_xrefs = set()
+    for page in doc:
+        for img in page.get_images(full=True):
+            if img[1]:
+                mask_xrefs.add(img[1])
     
     for page_index, page in enumerate(doc):
         # Get images
         image_list = page.get_images(full=True)
         
         for img_index, img in enumerate(image_list):
-            xref = img[0]
+            xref, _, width, height, bpc, colorspace = img[:6]
+            
+            if xref in seen_xrefs or xref in mask_xrefs:
+                continue
+            seen_xrefs.add(xref)
+            
+            # Skip icons, bullets and 1-bit stencil masks
+            if width < min_dimension or height < min_dimension:
+                continue
+            if bpc == 1 and not colorspace:
+                continue
             
             # Extract image
             base_image = doc.extract_image(xref)
+            if not base_image:
+                continue
             image_bytes = base_image["image"]
             
+            # The same picture is often embedded under several xrefs
+            digest = hashlib.sha1(image_bytes).hexdigest()
+            if digest in seen_hashes:
+                continue
+            seen_hashes.add(digest)
+            
             # Get extension
             ext = base_image["ext"]
             if ext.lower() == "jpeg":
                 ext = "jpg"
             
+            if max_dimension and max(width, height) > max_dimension:
+                image_bytes, ext = _reencode_image(image_bytes, ext, max_dimension)
+            
             # Save image
             image_filename = f"image_{page_index+1}_{img_index+1}.{ext}"
             image_path = os.path.join(output_dir, image_filename)
@@ -140,18 +226,49 @@ def extract_pdf_images(doc: fitz.Document, output_dir: str) -> List[str]:
                 f.write(image_bytes)
             
             image_files.append(image_path)
-            image_count += 1
     
     # If no images found, try alternative extraction method for figures
-    if image_count == 0:
+    if not image_files:
         image_files = extract_figures_from_pdf(doc, output_dir)
     
     return image_files
 
+def _reencode_image(image_bytes: bytes, ext: str, max_dimension: int) -> Tuple[bytes, str]:
+    """
+    Downscale a large bitmap so its longest side is at most max_dimension.
+    
+    Args:
+        image_bytes: Original encoded image
+        ext: Original file extension
+        max_dimension: Maximum width/height in pixels
+        
+    Returns:
+        Tuple of (encoded bytes, extension); the original image is returned
+        unchanged if it cannot be decoded
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            if img.mode in ("RGBA", "LA", "P"):
+                img.save(buffer, format="PNG", optimize=True)
+                return buffer.getvalue(), "png"
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.save(buffer, format="JPEG", quality=85, optimize=True)
+            return buffer.getvalue(), "jpg"
+    except Exception as e:
+        print(f"Could not re-encode image, keeping original: {e}")
+        return image_bytes, ext
+
 def extract_figures_from_pdf(doc: fitz.Document, output_dir: str) -> List[str]:
     """
     Alternative method to extract figures as images from the PDF.
-    This tries to identify figure regions and extract them as images.
+    This locates figure regions from the page's vector drawings and image
+    placements and renders each region once.
+    
+    Pages are rendered in a process pool when the document was opened from a
+    file, since PyMuPDF documents cannot be shared between threads.
     
     Args:
         doc: PyMuPDF document
@@ -160,102 +277,187 @@ def extract_figures_from_pdf(doc: fitz.Document, output_dir: str) -> List[str]:
     Returns:
         List of paths to saved figure files
     """
+    tasks = []
+    for page_index, page in enumerate(doc):
+        regions = detect_figure_regions(page)
+        if regions:
+            tasks.append((doc.name, page_index, [tuple(r) for r in regions], output_dir))
+    
+    if not tasks:
+        return []
+    
+    region_count = sum(len(task[2]) for task in tasks)
+    workers = min(FIGURE_RENDER_WORKERS, len(tasks))
+    
+    # Spawning workers only pays off for several pages of figures
+    if not doc.name or not os.path.exists(doc.name) or workers < 2 or region_count < 4:
+        image_files = []
+        for _, page_index, regions, _ in tasks:
+            image_files.extend(_render_regions(doc[page_index], page_index, regions, output_dir))
+        return image_files
+    
     image_files = []
+    # Spawn, not fork: this runs in a threadpool worker of a multi-threaded
+    # server, and a forked child can inherit locks held by other threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        for page_files in executor.map(_render_page_regions, tasks):
+            image_files.extend(page_files)
+    return image_files
+
+def detect_figure_regions(page: fitz.Page) -> List[fitz.Rect]:
+    """
+    Locate figure-like regions on a page from drawing and image bounding boxes.
     
-    # Try to find figures based on text patterns
-    figure_patterns = [r"Figure \d+", r"Fig\. \d+", r"FIGURE \d+"]
+    Nearby vector paths and image placements are merged into clusters; the
+    clusters large enough to be figures are returned with overlaps removed.
     
-    for page_index, page in enumerate(doc):
-        text_blocks = page.get_text("dict")["blocks"]
+    Args:
+        page: PyMuPDF page
         
-        for block_index, block in enumerate(text_blocks):
-            if "lines" in block:
-                for line in block["lines"]:
-                    if "spans" in line:
-                        for span in line["spans"]:
-                            text = span.get("text", "")
-                            
-                            # Check if this might be a figure caption
-                            is_figure_caption = False
-                            for pattern in figure_patterns:
-                                if re.search(pattern, text):
-                                    is_figure_caption = True
-                                    break
-                            
-                            if is_figure_caption:
-                                # Try to capture the area above this caption as a figure
-                                # This is an approximation - figures are usually above captions
-                                caption_rect = fitz.Rect(span["bbox"])
-                                figure_rect = fitz.Rect(
-                                    caption_rect.x0 - 20,
-                                    caption_rect.y0 - 200,  # Look 200 points above
-                                    caption_rect.x1 + 20,
-                                    caption_rect.y0 - 10
-                                )
-                                
-                                # Make sure the rect is within page bounds
-                                figure_rect.intersect(page.rect)
-                                
-                                # Only proceed if the rect has sufficient area
-                                if figure_rect.width > 100 and figure_rect.height > 100:
-                                    # Render this region as an image
-                                    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), clip=figure_rect)
-                                    image_filename = f"figure_{page_index+1}_{block_index+1}.png"
-                                    image_path = os.path.join(output_dir, image_filename)
-                                    pix.save(image_path)
-                                    image_files.append(image_path)
+    Returns:
+        List of non-overlapping figure rectangles in page coordinates
+    """
+    page_rect = page.rect
+    rects = [fitz.Rect(drawing["rect"]) for drawing in page.get_drawings()]
+    rects.extend(fitz.Rect(info["bbox"]) for info in page.get_image_info())
+    
+    # Page backgrounds and borders would swallow every other cluster
+    page_area = page_rect.width * page_rect.height
+    rects = [
+        r & page_rect for r in rects
+        if r.width * r.height < page_area * 0.9
+    ]
+    
+    # Clipping an off-page rect leaves it invalid; zero-height rules are kept
+    clusters = _merge_rects([r for r in rects if r.is_valid], FIGURE_MERGE_GAP)
+    
+    regions = []
+    for cluster in clusters:
+        if cluster.width < MIN_FIGURE_SIZE or cluster.height < MIN_FIGURE_SIZE:
+            continue
+        if cluster.width * cluster.height >= page_area * 0.9:
+            continue
+        regions.append(cluster)
     
+    # Drop regions that sit inside (or mostly overlap) a larger region
+    regions.sort(key=lambda r: r.width * r.height, reverse=True)
+    unique = []
+    for region in regions:
+        area = region.width * region.height
+        if any((region & kept).width * (region & kept).height > 0.5 * area for kept in unique):
+            continue
+        unique.append(region)
+    
+    return sorted(unique, key=lambda r: (r.y0, r.x0))
+
+def _merge_rects(rects: List[fitz.Rect], gap: float) -> List[fitz.Rect]:
+    """Merge rectangles that overlap or lie within gap points of each other."""
+    merged = []
+    for rect in sorted(rects, key=lambda r: (r.y0, r.x0)):
+        # Give axis lines and rules some thickness; PyMuPDF treats
+        # zero-width rectangles as empty and never intersects them
+        current = fitz.Rect(rect) + (-0.5, -0.5, 0.5, 0.5)
+        changed = True
+        while changed:
+            changed = False
+            grown = current + (-gap, -gap, gap, gap)
+            for i, other in enumerate(merged):
+                if grown.intersects(other):
+                    current |= other
+                    merged.pop(i)
+                    changed = True
+                    break
+        merged.append(current)
+    return merged
+
+def _render_regions(page: fitz.Page, page_index: int, regions: List[Tuple], output_dir: str) -> List[str]:
+    """Render each region of a page to a PNG file exactly once."""
+    image_files = []
+    matrix = fitz.Matrix(FIGURE_RENDER_ZOOM, FIGURE_RENDER_ZOOM)
+    for region_index, region in enumerate(regions):
+        pix = page.get_pixmap(matrix=matrix, clip=fitz.Rect(region))
+        image_filename = f"figure_{page_index+1}_{region_index+1}.png"
+        image_path = os.path.join(output_dir, image_filename)
+        pix.save(image_path)
+        image_files.append(image_path)
     return image_files
 
-def extract_text_sections_from_pdf(doc: fitz.Document) -> Dict[str, str]:
+def _render_page_regions(task: Tuple) -> List[str]:
+    """Process-pool worker: open the PDF and render one page's regions."""
+    pdf_path, page_index, regions, output_dir = task
+    with fitz.open(pdf_path) as doc:
+        return _render_regions(doc[page_index], page_index, regions, output_dir)
+
+def extract_text_with_section_index(doc: fitz.Document) -> Tuple[str, Dict]:
     """
-    Try to extract structured sections (intro, methods, results, etc.) from PDF.
+    Extract the full text of a PDF and index its section headings in one pass.
+    
+    The text is assembled line by line from get_text("dict"), which yields the
+    same text as get_text() plus the font size and weight of every span, so
+    headings can be told apart from body lines that mention "results".
     
     Args:
         doc: PyMuPDF document
         
     Returns:
-        Dictionary mapping section names to their text content
+        Tuple of (full text, section index with character offsets into it)
     """
-    sections = {
-        "Introduction": "",
-        "Methodology": "",
-        "Results": "",
-        "Discussion": "",
-        "Conclusion": ""
-    }
+    pages = [page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT) for page in doc]
     
-    # Common section heading patterns in academic papers
-    section_patterns = {
-        "Introduction": [r"introduction", r"1\.?\s+introduction"],
-        "Methodology": [r"methodology", r"methods", r"experimental setup", r"materials and methods"],
-        "Results": [r"results", r"findings", r"experimental results"],
-        "Discussion": [r"discussion"],
-        "Conclusion": [r"conclusion", r"conclusions", r"summary", r"final remarks"]
-    }
+    # The dominant font size (by character count) is the body text size
+    size_counts = {}
+    for page_dict in pages:
+        for block in page_dict["blocks"]:
+            for line in block.get("lines", []):
+                for span in line["spans"]:
+                    size = round(span["size"], 1)
+                    size_counts[size] = size_counts.get(size, 0) + len(span["text"])
+    body_font_size = max(size_counts, key=size_counts.get) if size_counts else None
     
-    full_text = ""
-    for page in doc:
-        full_text += page.get_text() + "\n\n"
+    parts = []
+    headings = []
+    offset = 0
+    for page_index, page_dict in enumerate(pages):
+        for block in page_dict["blocks"]:
+            for line in block.get("lines", []):
+                spans = line["spans"]
+                line_text = "".join(span["text"] for span in spans) + "\n"
+                
+                if spans:
+                    heading = match_heading(
+                        line_text,
+                        font_size=max(span["size"] for span in spans),
+                        body_font_size=body_font_size,
+                        bold=all(span["flags"] & 16 for span in spans if span["text"].strip())
+                    )
+                    if heading:
+                        heading["start"] = offset
+                        heading["body_start"] = offset + len(line_text)
+                        heading["page"] = page_index + 1
+                        headings.append(heading)
+                
+                parts.append(line_text)
+                offset += len(line_text)
+        parts.append("\n\n")
+        offset += 2
     
-    # Split text into lines
-    lines = full_text.split("\n")
+    full_text = "".join(parts)
+    section_index = finalize_index(headings, len(full_text), body_font_size=body_font_size)
+    return full_text, section_index
+
+def extract_text_sections_from_pdf(doc: fitz.Document) -> Dict[str, str]:
+    """
+    Try to extract structured sections (intro, methods, results, etc.) from PDF.
     
-    current_section = None
-    for i, line in enumerate(lines):
-        line_lower = line.strip().lower()
-        
-        # Check if this line is a section heading
-        for section, patterns in section_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, line_lower):
-                    current_section = section
-                    break
-            if current_section:
-                break
+    Args:
+        doc: PyMuPDF document
         
-        # If we're in a section, add text to it
-        if current_section and i < len(lines) - 1:
-            sections[current_section] += lines[i+1] + "\n"
-    
-    return sections 
\ No newline at end of file
+    Returns:
+        Dictionary mapping section names to their text content
+    """
+    full_text, section_index = extract_text_with_section_index(doc)
+    return get_sections(
+        full_text,
+        section_index,
+        ["Introduction", "Methodology", "Results", "Discussion", "Conclusion"]
+    )
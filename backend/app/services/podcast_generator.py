@@ -8,17 +8,18 @@ import json
 import logging
 from pathlib import Path
 from typing import Dict, List, Optional
-import google.generativeai as genai
+from app.services.structured_output import agenerate_json
+from app.models.artifact_models import PodcastScript
 
 logger = logging.getLogger(__name__)
 
 
-def generate_podcast_script(paper_text: str, gemini_key: str, duration_minutes: int = 5, language: str = "en-IN") -> Dict:
+async def generate_podcast_script(paper_text: str, gemini_key: str, duration_minutes: int = 5, language: str = "en-IN") -> Dict:
     """
     Generate a conversational 2-speaker podcast script from a research paper.
     
     Args:
-        paper_text: Full text of the research paper
+        paper_text: Paper text, already fitted to the task budget (see context_builder)
         gemini_key: Gemini API key
         duration_minutes: Target duration in minutes (default 5)
         language: Language code for the podcast (default: en-IN)
@@ -26,9 +27,6 @@ def generate_podcast_script(paper_text: str, gemini_key: str, duration_minutes:
     Returns:
         Dict with podcast script and metadata with 2 speakers
     """
-    genai.configure(api_key=gemini_key)
-    model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    
     # Calculate approximate word count for target duration (150 words per minute for podcasts)
     target_words = duration_minutes * 150
     
@@ -114,7 +112,7 @@ Target duration: {duration_minutes} minutes (~{target_words} words)
 🌍 OUTPUT LANGUAGE: {language_name}{language_instruction}
 
 Paper text (English - you must discuss this in {language_name}):
-{paper_text[:12000]}
+{paper_text}
 
 Create a natural dialogue between two speakers. Make it feel like a real conversation with:
 - Natural back-and-forth exchanges
@@ -142,17 +140,11 @@ Return ONLY a JSON object with this EXACT format:
 
     try:
         logger.info(f"Generating podcast in language: {language} ({language_name})")
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # Remove markdown code blocks if present
-        if response_text.startswith('```'):
-            response_text = response_text.split('```')[1]
-            if response_text.startswith('json'):
-                response_text = response_text[4:]
-            response_text = response_text.strip()
-        
-        result = json.loads(response_text)
+        result = (await agenerate_json(
+            prompt, gemini_key, PodcastScript, 'gemini-2.0-flash-exp', call_site="podcasts.script"
+        )).model_dump()
+        if result["duration_minutes"] is None:
+            result["duration_minutes"] = duration_minutes
         logger.info(f"Generated podcast script in {language_name}: {result.get('title', 'Untitled')}")
         
         # Log first dialogue line to verify language
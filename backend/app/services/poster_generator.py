@@ -10,26 +10,24 @@ import random
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
-import google.generativeai as genai
+from app.services.structured_output import agenerate_json
+from app.models.artifact_models import PosterContent
 
 logger = logging.getLogger(__name__)
 
 
-def generate_poster_content(paper_text: str, gemini_key: str, language: str = "en") -> Dict:
+async def generate_poster_content(paper_text: str, gemini_key: str, language: str = "en") -> Dict:
     """
     Generate poster content (title, key points, findings) from research paper.
     
     Args:
-        paper_text: Full text of the research paper
+        paper_text: Paper text, already fitted to the task budget (see context_builder)
         gemini_key: Gemini API key
         language: Language code for content generation (default: 'en')
     
     Returns:
         Dict with poster content
     """
-    genai.configure(api_key=gemini_key)
-    model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    
     # Language name mapping
     language_names = {
         'en': 'English',
@@ -52,7 +50,7 @@ def generate_poster_content(paper_text: str, gemini_key: str, language: str = "e
     prompt = f"""Analyze this research paper and create content for an academic poster.
 
 Paper text:
-{paper_text[:12000]}
+{paper_text}
 
 Generate poster content that is visually appealing and informative.{language_instruction}
 
@@ -78,17 +76,9 @@ Important:
 {f"- Write EVERYTHING in {language_name}" if language != 'en' else ""}"""
 
     try:
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # Remove markdown code blocks if present
-        if response_text.startswith('```'):
-            response_text = response_text.split('```')[1]
-            if response_text.startswith('json'):
-                response_text = response_text[4:]
-            response_text = response_text.strip()
-        
-        result = json.loads(response_text)
+        result = (await agenerate_json(
+            prompt, gemini_key, PosterContent, 'gemini-2.0-flash-exp', call_site="posters.content"
+        )).model_dump()
         logger.info(f"Generated poster content: {result.get('title', 'Untitled')}")
         return result
     
@@ -0,0 +1,166 @@
+"""
+Prompt Prefix Service
+Builds one stable prompt prefix per paper (instructions and a compact paper
+digest) that every chat turn, quiz and suggestion call starts with, and
+tracks it per paper with an expiry. Gemini caches repeated prompt prefixes
+on its side, so a byte-identical prefix is only processed in full once
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.paper_text import get_paper_text, get_paper_source_path
+from app.services.context_builder import build_paper_context, estimate_tokens, get_paper_section_index
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# A paper's prefix is rebuilt after this long (and whenever its text changes)
+PROMPT_PREFIX_TTL_SECONDS = int(os.getenv("PROMPT_PREFIX_TTL_SECONDS", 3600))
+
+# Papers whose prefix is kept in memory
+PROMPT_PREFIX_ENTRIES = int(os.getenv("PROMPT_PREFIX_ENTRIES", 256))
+
+# Section headings listed in the digest outline
+MAX_OUTLINE_SECTIONS = 40
+
+PREFIX_INSTRUCTIONS = """You are an AI assistant helping users understand a research paper.
+Your role is to:
+1. Answer questions about the paper's content, methodology, results, and conclusions
+2. Explain complex concepts in simple terms
+3. Help users test their understanding by generating relevant questions
+4. Provide insights and connections to related research areas
+
+Please provide helpful, accurate, and educational responses based on this paper.
+When you use a passage, cite its id in square brackets, e.g. [c4] or [c4, c9].
+If the paper information and passages do not contain the answer, say so instead of guessing."""
+
+
+def build_paper_digest(paper_info: Dict) -> str:
+    """
+    Compact digest of a paper: title, authors, section outline and overview.
+
+    Args:
+        paper_info: Dictionary containing paper information
+
+    Returns:
+        Digest text (deterministic for a given paper version)
+    """
+    metadata = paper_info.get("metadata", {})
+    lines = [
+        f"Paper Title: {metadata.get('title', 'Research Paper')}",
+        f"Authors: {metadata.get('authors', 'Unknown')}",
+    ]
+    try:
+        text = get_paper_text(paper_info)
+        outline = [s["title"] for s in get_paper_section_index(paper_info, text).get("sections", [])]
+        if outline:
+            lines.append("Sections: " + "; ".join(outline[:MAX_OUTLINE_SECTIONS]))
+        lines.append("")
+        lines.append("Overview:\n" + build_paper_context(paper_info, "chat"))
+    except FileNotFoundError:
+        lines.append("Paper content is not available in text format.")
+    return "\n".join(lines)
+
+
+class PaperPrefix:
+    """The prompt prefix of one paper version."""
+
+    def __init__(self, paper_id: str, text: str, ttl_seconds: int):
+        self.paper_id = paper_id
+        self.text = text
+        # Identifies the cached prefix; changes whenever its text does
+        self.prefix_id = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+        self.tokens = estimate_tokens(text)
+        self.created_at = time.time()
+        self.expires_at = self.created_at + ttl_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "paper_id": self.paper_id,
+            "prefix_id": self.prefix_id,
+            "tokens": self.tokens,
+            "created_at": self.created_at,
+            "expires_at": self.expires_at,
+        }
+
+
+class PromptPrefixRegistry:
+    """Per-paper prompt prefixes with expiry, least recently used dropped first."""
+
+    def __init__(self, ttl_seconds: int = PROMPT_PREFIX_TTL_SECONDS, max_entries: int = PROMPT_PREFIX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # paper_id -> (source version, prefix)
+        self._entries: "OrderedDict[str, Tuple[Optional[Tuple[str, int, int]], PaperPrefix]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version(paper_info: Dict) -> Optional[Tuple[str, int, int]]:
+        path = get_paper_source_path(paper_info)
+        if not path:
+            return None
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    def get_prefix(self, paper_id: str, paper_info: Dict) -> PaperPrefix:
+        """
+        Prompt prefix of a paper, rebuilt when expired or when the paper changed.
+
+        A rebuild reads the paper and builds its digest; call this from a
+        worker thread, not the event loop.
+
+        Args:
+            paper_id: Unique identifier for the paper
+            paper_info: Dictionary containing paper information
+
+        Returns:
+            PaperPrefix whose text every chatbot prompt starts with
+        """
+        version = self._version(paper_info)
+        with self._lock:
+            entry = self._entries.get(paper_id)
+            if entry is not None and entry[0] == version and entry[1].expires_at > time.time():
+                self._entries.move_to_end(paper_id)
+                metrics.increment("prompt_prefix.hits")
+                return entry[1]
+
+        prefix = PaperPrefix(paper_id, f"{PREFIX_INSTRUCTIONS}\n\nHere is the paper information:\n{build_paper_digest(paper_info)}",
+                             self.ttl_seconds)
+        metrics.increment("prompt_prefix.builds")
+        if entry is not None and entry[1].prefix_id != prefix.prefix_id:
+            logger.info(f"Prompt prefix for paper {paper_id} changed: {entry[1].prefix_id} -> {prefix.prefix_id}")
+        with self._lock:
+            self._entries[paper_id] = (version, prefix)
+            self._entries.move_to_end(paper_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return prefix
+
+    def invalidate(self, paper_id: str) -> None:
+        """Drop a paper's prefix (e.g. after the paper was replaced)."""
+        with self._lock:
+            self._entries.pop(paper_id, None)
+
+    def list_prefixes(self) -> List[Dict[str, Any]]:
+        """Current prefixes, most recently used last."""
+        with self._lock:
+            return [prefix.to_dict() for _, prefix in self._entries.values()]
+
+    def stats(self) -> Dict[str, Any]:
+        """Prefix count, TTL and total prefix tokens."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl_seconds,
+                "tokens": sum(prefix.tokens for _, prefix in self._entries.values()),
+            }
+
+
+# Global prompt prefix registry
+prompt_prefixes = PromptPrefixRegistry()
@@ -6,37 +6,34 @@ Creates short-form vertical videos with:
 """
 
 import os
-import json
 import logging
 from pathlib import Path
 from typing import Dict, List, Optional
 import subprocess
-import google.generativeai as genai
+from app.services.structured_output import agenerate_json
+from app.models.artifact_models import ReelSummary
 from PIL import Image, ImageDraw, ImageFont
 
 logger = logging.getLogger(__name__)
 
 
-def generate_reel_summary(paper_text: str, gemini_key: str, duration: int = 40) -> Dict:
+async def generate_reel_summary(paper_text: str, gemini_key: str, duration: int = 40) -> Dict:
     """
     Generate a concise 3-slide summary for a reel (40 seconds).
     
     Args:
-        paper_text: Full text of the research paper
+        paper_text: Paper text, already fitted to the task budget (see context_builder)
         gemini_key: Gemini API key
         duration: Target duration in seconds (default 40)
     
     Returns:
         Dict with slides and narration script
     """
-    genai.configure(api_key=gemini_key)
-    model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    
     prompt = f"""You are creating a {duration}-second social media reel explaining a research paper.
 Generate EXACTLY 3 slides with concise content and a {duration}-second narration script.
 
 Paper text:
-{paper_text[:8000]}
+{paper_text}
 
 Create a response in this EXACT JSON format:
 {{
@@ -67,17 +64,9 @@ Requirements:
 - Focus on the most interesting finding or application"""
 
     try:
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # Remove markdown code blocks if present
-        if response_text.startswith('```'):
-            response_text = response_text.split('```')[1]
-            if response_text.startswith('json'):
-                response_text = response_text[4:]
-            response_text = response_text.strip()
-        
-        result = json.loads(response_text)
+        result = (await agenerate_json(
+            prompt, gemini_key, ReelSummary, 'gemini-2.0-flash-exp', call_site="reels.summary"
+        )).model_dump()
         logger.info(f"Generated reel summary with {len(result['slides'])} slides")
         return result
     
@@ -1,9 +1,11 @@
-import google.generativeai as genai
 import re
 import unicodedata
 from typing import Dict, List
 import os
 
+from app.services.latex_text import latex_to_plain_text
+from app.services.llm_service import agenerate_text, astream_text
+
 def extract_paper_metadata(file_path):
     """Extract paper metadata from LaTeX or PDF text file."""
     metadata = {
@@ -86,13 +88,7 @@ def extract_text_from_file(file_path):
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
         
-        # Remove LaTeX commands and comments
-        content = re.sub(r'%.*?\n', '\n', content)
-        content = re.sub(r'\\[a-zA-Z]+\*?(\[[^\]]*\])?(\{[^}]*\})*', ' ', content)
-        content = re.sub(r'\{[^}]*\}', ' ', content)
-        content = re.sub(r'\s+', ' ', content)
-        
-        return content.strip()
+        return latex_to_plain_text(content)
     except Exception as e:
         print(f"Error extracting text from LaTeX file: {e}")
         return ""
@@ -109,13 +105,10 @@ def clean_text(text):
     
     return text
 
-def generate_full_script_with_gemini(api_key, input_text):
-    """Generate presentation script using Gemini API with improved prompts from app_1.py"""
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
+def build_full_script_prompt(input_text):
+    """Prompt for the full presentation script (shared by the plain and streamed calls)."""
     # Enhanced prompt based on app_1.py
-    prompt = f"""
+    return f"""
 Create a script for a 3-5 minute educational video based on this research paper.
 STRUCTURE:
 Create scripts for exactly these 5 sections:
@@ -139,18 +132,25 @@ Research Paper Content:
 Please generate the complete presentation script with clear section headers:
 """
 
+async def generate_full_script_with_gemini(api_key, input_text):
+    """Generate presentation script using Gemini API with improved prompts from app_1.py"""
+    prompt = build_full_script_prompt(input_text)
+
     try:
-        response = model.generate_content(prompt)
-        return response.text
+        return await agenerate_text(prompt, api_key, 'gemini-2.0-flash', call_site="script.full")
     except Exception as e:
         print(f"Error generating script with Gemini: {e}")
         raise
 
-def generate_bullet_points_with_gemini(api_key, section_text):
+def stream_full_script_with_gemini(api_key, input_text):
+    """Stream the presentation script from Gemini, yielding text chunks as they arrive."""
+    prompt = build_full_script_prompt(input_text)
+    # Same call site and prompt as generate_full_script_with_gemini, so the
+    # two share cached responses
+    return astream_text(prompt, api_key, 'gemini-2.0-flash', call_site="script.full")
+
+async def generate_bullet_points_with_gemini(api_key, section_text):
     """Generate bullet points for a section using improved prompts."""
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
     prompt = f"""
 Convert this presentation script into 3-5 clear, concise bullet points for a slide.
 
@@ -179,8 +179,7 @@ Generate exactly 3-5 bullet points in this format:
 """
 
     try:
-        response = model.generate_content(prompt)
-        bullet_text = response.text.strip()
+        bullet_text = (await agenerate_text(prompt, api_key, 'gemini-2.0-flash', call_site="script.section_bullets")).strip()
         
         # Extract bullet points more robustly
         bullets = []
@@ -206,11 +205,8 @@ Generate exactly 3-5 bullet points in this format:
         print(f"Error generating bullet points: {e}")
         return ["Key information from this section"]
 
-def generate_all_bullet_points_with_gemini(api_key, sections_scripts):
+async def generate_all_bullet_points_with_gemini(api_key, sections_scripts):
     """Generate bullet points for all sections using a single prompt."""
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
     print(f"Generating bullet points for {len(sections_scripts)} sections using single prompt")
     
     # Prepare sections text for the prompt
@@ -262,13 +258,8 @@ Process all sections in the input and generate bullet points accordingly."""
         if not api_key:
             raise ValueError("API key is not provided")
             
-        response = model.generate_content(prompt)
-        
-        # Check if response is valid
-        if not response or not hasattr(response, 'text'):
-            raise ValueError("Invalid response from Gemini API")
-            
-        bullet_text = response.text.strip() if response.text else ""
+        response_text = await agenerate_text(prompt, api_key, 'gemini-2.0-flash', call_site="script.bullets")
+        bullet_text = response_text.strip() if response_text else ""
         print(f"Received response from Gemini API (length: {len(bullet_text)} chars)")
         
         if not bullet_text:
@@ -386,46 +377,87 @@ Process all sections in the input and generate bullet points accordingly."""
         print("Used fallback bullet generation for all sections")
         return sections_bullets
 
-def split_script_into_sections(full_script):
-    """Split the generated script into sections."""
-    sections = {
-        "Introduction": "",
-        "Methodology": "", 
-        "Results": "",
-        "Discussion": "",
-        "Conclusion": ""
-    }
-    
-    current_section = None
-    lines = full_script.split('\n')
-    
-    for line in lines:
+SCRIPT_SECTIONS = ["Introduction", "Methodology", "Results", "Discussion", "Conclusion"]
+
+def match_script_heading(line):
+    """Return the script section a (stripped) line is the heading of, or None."""
+    for section_name in SCRIPT_SECTIONS:
+        if section_name.lower() in line.lower() and (
+            line.startswith('#') or
+            line.startswith('**') or
+            line.isupper() or
+            ':' in line
+        ):
+            return section_name
+    return None
+
+class ScriptSectionSplitter:
+    """
+    Split a script into sections while it is still being generated.
+
+    Text is fed in arbitrary chunks; feed() and close() return the names of
+    sections that are finished, i.e. whose next heading has started (or the
+    script has ended).
+    """
+
+    def __init__(self):
+        self.sections = {name: "" for name in SCRIPT_SECTIONS}
+        self.current_section = None
+        self._buffer = ""
+
+    def feed(self, chunk):
+        """Add a chunk of script text; returns the sections it finished."""
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split('\n')
+        finished = []
+        for line in lines:
+            finished.extend(self._add_line(line))
+        return finished
+
+    def close(self):
+        """Mark the end of the script; returns the sections still open."""
+        finished = self._add_line(self._buffer)
+        self._buffer = ""
+        if self.current_section:
+            finished.append(self.current_section)
+            self.current_section = None
+        return finished
+
+    def _add_line(self, line):
         line = line.strip()
         if not line:
-            continue
-            
-        # Check if line is a section header
-        for section_name in sections.keys():
-            if section_name.lower() in line.lower() and (
-                line.startswith('#') or
-                line.startswith('**') or
-                line.isupper() or
-                ':' in line
-            ):
-                current_section = section_name
-                break
-        else:
-            # Add content to current section
-            if current_section:
-                sections[current_section] += line + " "
-    
-    # Clean up sections
-    for section in sections:
-        sections[section] = sections[section].strip()
-        if not sections[section]:
-            sections[section] = f"Content for {section} section needs to be added."
-    
-    return sections
+            return []
+        heading = match_script_heading(line)
+        if heading:
+            finished = []
+            if self.current_section and self.current_section != heading:
+                finished.append(self.current_section)
+            self.current_section = heading
+            return finished
+        # Add content to current section
+        if self.current_section:
+            self.sections[self.current_section] += line + " "
+        return []
+
+    def section_text(self, section_name):
+        """Text collected so far for one section."""
+        return self.sections[section_name].strip()
+
+    def result(self):
+        """All sections, with a placeholder for any the script left empty."""
+        sections = {}
+        for section in self.sections:
+            sections[section] = self.section_text(section)
+            if not sections[section]:
+                sections[section] = f"Content for {section} section needs to be added."
+        return sections
+
+def split_script_into_sections(full_script):
+    """Split the generated script into sections."""
+    splitter = ScriptSectionSplitter()
+    splitter.feed(full_script)
+    splitter.close()
+    return splitter.result()
 
 def clean_script_for_tts_and_video(script_text):
     """Clean script text for TTS and video generation."""
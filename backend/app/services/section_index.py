@@ -0,0 +1,250 @@
+"""
+Section Index Service
+Locates section headings in extracted paper text once, at ingest, and
+persists their character offsets so later stages can slice sections directly
+"""
+
+import os
+import re
+import json
+import threading
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SECTION_INDEX_FILENAME = "section_index.json"
+SECTION_INDEX_VERSION = 1
+
+# Canonical section names and the heading phrases that map to them
+CANONICAL_SECTIONS = {
+    "Abstract": [r"abstract"],
+    "Introduction": [r"introduction"],
+    "Related Work": [r"related work", r"background", r"literature review", r"prior work"],
+    "Methodology": [r"methodology", r"methods?", r"approach", r"proposed method",
+                    r"experimental setup", r"materials and methods"],
+    "Results": [r"results", r"findings", r"experimental results", r"experiments",
+                r"evaluation", r"results and discussion"],
+    "Discussion": [r"discussion"],
+    "Conclusion": [r"conclusions?", r"summary", r"final remarks", r"concluding remarks",
+                   r"conclusions? and future work"],
+    "Acknowledgments": [r"acknowledge?ments?"],
+    "References": [r"references", r"bibliography"],
+    "Appendix": [r"appendix(?:\s+[a-z])?", r"appendices"],
+}
+
+# Optional heading number: "1", "2.3", "IV", "A"
+_NUMBER = r"(?P<number>(?:\d+(?:\.\d+)*|[IVXLC]+|[A-Z])\.?)"
+
+# One combined pattern: a heading line is an optional number followed by
+# exactly one canonical phrase, so the whole table is tested in a single match
+_GROUP_NAMES = {f"s{i}": name for i, name in enumerate(CANONICAL_SECTIONS)}
+_CANONICAL_PATTERN = re.compile(
+    r"^\s*(?:" + _NUMBER + r"\s+)?(?:"
+    + "|".join(
+        f"(?P<{group}>{'|'.join(CANONICAL_SECTIONS[name])})"
+        for group, name in _GROUP_NAMES.items()
+    )
+    + r")\s*[:.]?\s*$",
+    re.IGNORECASE,
+)
+
+# Numbered heading with free-form title ("3 Proposed Model", "4.2 Ablations")
+_NUMBERED_PATTERN = re.compile(r"^\s*(?P<number>\d+(?:\.\d+){0,2})\.?\s+(?P<title>[A-Z][^.!?]{1,80})$")
+
+# Headings are short; longer lines are body text that happens to match
+MAX_HEADING_CHARS = 90
+
+
+def match_heading(line: str, font_size: Optional[float] = None,
+                  body_font_size: Optional[float] = None, bold: bool = False) -> Optional[Dict]:
+    """
+    Decide whether a line of text is a section heading.
+
+    Args:
+        line: Line of text
+        font_size: Font size of the line, if known (PDF sources)
+        body_font_size: Dominant font size of the document body, if known
+        bold: Whether the line is set in a bold font
+
+    Returns:
+        Dict with title, canonical name (or None) and level, or None if the
+        line is not a heading
+    """
+    text = line.strip()
+    if not text or len(text) > MAX_HEADING_CHARS:
+        return None
+
+    has_font_cue = bool(
+        bold or (font_size and body_font_size and font_size >= body_font_size * 1.1)
+    )
+    # Body text set in a smaller font than the body is never a heading
+    if font_size and body_font_size and font_size < body_font_size * 0.9:
+        return None
+
+    match = _CANONICAL_PATTERN.match(text)
+    if match:
+        name = next(_GROUP_NAMES[g] for g in _GROUP_NAMES if match.group(g))
+        return {
+            "title": text,
+            "name": name,
+            "level": _heading_level(match.group("number")),
+        }
+
+    # Free-form numbered headings are only trusted with a typographic cue,
+    # otherwise numbered list items and table rows would qualify
+    match = _NUMBERED_PATTERN.match(text)
+    if match and (has_font_cue or font_size is None):
+        return {
+            "title": text,
+            "name": None,
+            "level": _heading_level(match.group("number")),
+        }
+
+    return None
+
+
+def _heading_level(number: Optional[str]) -> int:
+    """Depth of a heading from its number ("2" -> 1, "2.1" -> 2)."""
+    if not number:
+        return 1
+    return number.rstrip(".").count(".") + 1
+
+
+def finalize_index(headings: List[Dict], text_length: int, **extra) -> Dict:
+    """
+    Turn heading start offsets into a section index with end offsets.
+
+    A section ends where the next heading of the same or a higher level starts.
+
+    Args:
+        headings: Headings in document order with start/body_start offsets
+        text_length: Length of the full text
+        **extra: Additional fields to store on the index
+
+    Returns:
+        Section index dictionary
+    """
+    for i, heading in enumerate(headings):
+        end = text_length
+        for following in headings[i + 1:]:
+            if following["level"] <= heading["level"]:
+                end = following["start"]
+                break
+        heading["end"] = end
+
+    return {
+        "version": SECTION_INDEX_VERSION,
+        "text_length": text_length,
+        "sections": headings,
+        **extra,
+    }
+
+
+def build_section_index_from_text(text: str) -> Dict:
+    """
+    Build a section index from plain text without typographic information.
+
+    Args:
+        text: Full paper text
+
+    Returns:
+        Section index dictionary
+    """
+    headings = []
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        heading = match_heading(line)
+        if heading:
+            heading["start"] = offset
+            heading["body_start"] = offset + len(line)
+            headings.append(heading)
+        offset += len(line)
+
+    return finalize_index(headings, len(text))
+
+
+def get_index_path(text_file_path: str) -> str:
+    """Path of the section index stored next to a paper's text file."""
+    return os.path.join(os.path.dirname(text_file_path), SECTION_INDEX_FILENAME)
+
+
+def save_section_index(index: Dict, text_file_path: str) -> str:
+    """
+    Persist a section index next to the text file it describes.
+
+    Args:
+        index: Section index dictionary
+        text_file_path: Path to the paper text the offsets refer to
+
+    Returns:
+        Path to the saved index
+    """
+    index_path = get_index_path(text_file_path)
+    # Written to a per-process/thread temp file, then swapped in: the same
+    # cached paper can be ingested twice at once
+    tmp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def load_section_index(text_file_path: str) -> Optional[Dict]:
+    """
+    Load the section index stored next to a paper's text file.
+
+    Args:
+        text_file_path: Path to the paper text
+
+    Returns:
+        Section index dictionary, or None if missing or unreadable
+    """
+    index_path = get_index_path(text_file_path)
+    if not os.path.exists(index_path):
+        return None
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != SECTION_INDEX_VERSION:
+            return None
+        return index
+    except Exception as e:
+        logger.error(f"Error loading section index {index_path}: {str(e)}")
+        return None
+
+
+def get_section_text(text: str, index: Dict, name: str, include_heading: bool = False) -> str:
+    """
+    Slice one section out of the paper text using the index.
+
+    Args:
+        text: Full paper text the index was built from
+        index: Section index dictionary
+        name: Canonical section name (e.g. "Results") or exact heading title
+        include_heading: Whether to include the heading line itself
+
+    Returns:
+        Section text, or an empty string if the section is not indexed
+    """
+    for section in index.get("sections", []):
+        if section["name"] == name or section["title"] == name:
+            start = section["start"] if include_heading else section["body_start"]
+            return text[start:section["end"]]
+    return ""
+
+
+def get_sections(text: str, index: Dict, names: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    Slice several canonical sections out of the paper text.
+
+    Args:
+        text: Full paper text the index was built from
+        index: Section index dictionary
+        names: Canonical names to return (default: all canonical sections)
+
+    Returns:
+        Dictionary mapping section names to their text (empty if missing)
+    """
+    names = names or list(CANONICAL_SECTIONS)
+    return {name: get_section_text(text, index, name) for name in names}
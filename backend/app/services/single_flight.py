@@ -0,0 +1,88 @@
+"""
+Single-Flight Service
+Coalesces identical generation requests: while one is running, duplicates
+with the same artifact type and parameters wait for it and share its result
+instead of paying for the LLM and TTS work again
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class FlightConflictError(RuntimeError):
+    """A generation with the same key but different parameters is already running."""
+
+
+class SingleFlight:
+    """In-flight generations keyed by artifact type and parameters (one event loop)."""
+
+    def __init__(self):
+        self._in_flight: Dict[Tuple[str, Hashable], "asyncio.Task[Any]"] = {}
+        # Options of each in-flight generation, for flights keyed without them
+        self._params: Dict[Tuple[str, Hashable], Optional[Hashable]] = {}
+
+    async def run(self, artifact: str, key: Hashable, factory: Callable[[], Awaitable[T]],
+                  params: Optional[Hashable] = None) -> T:
+        """
+        Run a generation, or join the identical one already running.
+
+        The generation runs in its own task, so it finishes (and writes its
+        files) even if the request that started it is cancelled; waiting
+        callers are shielded from each other's cancellation.
+
+        Args:
+            artifact: Artifact type ("script", "podcast", ...)
+            key: What the generation writes to (paper id, or paper id and options)
+            factory: Starts the generation when none is in flight
+            params: Options that are not part of key; a request with the same
+                key but other options is refused while the first one runs
+
+        Returns:
+            The generation's result; its exception is raised to every caller
+
+        Raises:
+            FlightConflictError: If the running generation has other params
+        """
+        flight_key = (artifact, key)
+        task = self._in_flight.get(flight_key)
+        if task is not None and self._params.get(flight_key) != params:
+            metrics.increment(f"single_flight.{artifact}.conflicts")
+            raise FlightConflictError(
+                f"A {artifact} generation for {key} with other options is already running"
+            )
+        if task is not None:
+            metrics.increment(f"single_flight.{artifact}.coalesced")
+            logger.info(f"Joining in-flight {artifact} generation for {key}")
+        else:
+            metrics.increment(f"single_flight.{artifact}.started")
+            task = asyncio.ensure_future(factory())
+            self._in_flight[flight_key] = task
+            self._params[flight_key] = params
+            task.add_done_callback(lambda done: self._finish(flight_key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, flight_key: Tuple[str, Hashable], task: "asyncio.Task[Any]") -> None:
+        if self._in_flight.get(flight_key) is task:
+            del self._in_flight[flight_key]
+            self._params.pop(flight_key, None)
+        # Nobody may be waiting any more; mark the exception as retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> Dict[str, int]:
+        """Number of running generations per artifact type."""
+        counts: Dict[str, int] = {}
+        for artifact, _ in self._in_flight:
+            counts[artifact] = counts.get(artifact, 0) + 1
+        return counts
+
+
+# Global single-flight registry for generation endpoints
+generation_flights = SingleFlight()
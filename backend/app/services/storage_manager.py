@@ -1,6 +1,7 @@
 import os
 import json
 import logging
+import threading
 from pathlib import Path
 from typing import Dict, Any, Optional
 from app.services.session_manager import session_manager
@@ -16,6 +17,8 @@ class StorageManager:
         Path(storage_dir).mkdir(parents=True, exist_ok=True)
         self.papers_file = os.path.join(storage_dir, "papers_storage.json")
         self.memory_cache = {}
+        # Serializes writes of papers_file (ingest threads also save)
+        self._save_lock = threading.Lock()
         self._load_papers()
     
     def _load_papers(self):
@@ -34,14 +37,21 @@ class StorageManager:
             self.memory_cache = {}
     
     def _save_papers(self):
-        """Save papers from memory to disk."""
+        """Save papers from memory to disk (written to a temp file, then swapped in)."""
+        tmp_path = f"{self.papers_file}.{os.getpid()}.{threading.get_ident()}.tmp"
         try:
-            with open(self.papers_file, 'w') as f:
-                json.dump(self.memory_cache, f)
+            with self._save_lock:
+                # Serialize first so a failed dump never touches the stored file
+                data = json.dumps(self.memory_cache)
+                with open(tmp_path, 'w') as f:
+                    f.write(data)
+                os.replace(tmp_path, self.papers_file)
             logger.info(f"Saved {len(self.memory_cache)} papers to storage")
             return True
         except Exception as e:
             logger.error(f"Error saving papers to storage: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
             return False
     
     def get_paper(self, paper_id: str) -> Optional[Dict[str, Any]]:
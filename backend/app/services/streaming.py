@@ -0,0 +1,29 @@
+"""
+Streaming Helpers
+Formatting for server-sent events (SSE) used by the streaming endpoints
+"""
+
+import json
+from typing import Any
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+# Headers that keep proxies from buffering the stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event: str, data: Any) -> str:
+    """
+    Format one server-sent event with a JSON payload.
+
+    Args:
+        event: Event name
+        data: JSON-serializable payload
+
+    Returns:
+        Event text ready to be written to the response
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
@@ -0,0 +1,178 @@
+"""
+Structured Output Service
+Generates JSON artifacts with Gemini, validates them against a pydantic
+schema and makes one targeted repair call when the response does not parse
+or validate
+"""
+
+import re
+import json
+import logging
+from typing import Any, Dict, Optional, Type, TypeVar
+
+import google.ai.generativelanguage as glm
+from pydantic import BaseModel, ValidationError
+
+from app.services.llm_service import DEFAULT_MODEL, agenerate_text
+from app.services.llm_cache import llm_cache, make_cache_key
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+# Newer API versions accept a JSON response MIME type; with the pinned SDK
+# the format comes from the prompt and the schema check below
+JSON_MODE_SUPPORTED = "response_mime_type" in glm.GenerationConfig.meta.fields
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"} if JSON_MODE_SUPPORTED else None
+
+# Responses longer than this are cut before being quoted in a repair prompt
+MAX_REPAIR_INPUT_CHARS = 30000
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+
+REPAIR_PROMPT = """The JSON below was supposed to match this JSON schema but does not.
+
+Schema:
+{schema}
+
+Problems:
+{errors}
+
+JSON to fix:
+{response}
+
+Return ONLY the corrected JSON object. Keep all content that is already valid, in its original language; only fix the listed problems."""
+
+
+class StructuredOutputError(ValueError):
+    """A model response could not be turned into a valid object."""
+
+    def __init__(self, message: str, kind: str = "validation"):
+        super().__init__(message)
+        # "parse" (not JSON) or "validation" (JSON not matching the schema)
+        self.kind = kind
+
+
+def extract_json(text: str) -> Any:
+    """
+    Parse the JSON object in a model response.
+
+    Accepts bare JSON, JSON in a markdown code fence, and JSON surrounded by
+    prose.
+
+    Args:
+        text: Response text
+
+    Returns:
+        Parsed JSON value
+
+    Raises:
+        ValueError: If no JSON object can be parsed
+    """
+    text = text.strip()
+    fence = _FENCE.search(text)
+    if fence:
+        text = fence.group(1).strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    # Prose around the object: parse from the first brace
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("No JSON object in response")
+    value, _ = json.JSONDecoder().raw_decode(text[start:])
+    return value
+
+
+def _validate(text: str, schema: Type[T]) -> T:
+    """Parse and validate one response; errors carry a readable description."""
+    try:
+        data = extract_json(text)
+    except ValueError as e:
+        raise StructuredOutputError(f"Response is not valid JSON: {e}", kind="parse") from e
+    try:
+        return schema.model_validate(data)
+    except ValidationError as e:
+        problems = "\n".join(
+            f"- {'.'.join(str(p) for p in error['loc']) or '(root)'}: {error['msg']}"
+            for error in e.errors()
+        )
+        raise StructuredOutputError(problems) from e
+
+
+async def agenerate_json(prompt: str, api_key: str, schema: Type[T], model_name: str = DEFAULT_MODEL,
+                         call_site: str = "default", timeout: Optional[float] = None) -> T:
+    """
+    Generate a JSON artifact and validate it against a schema.
+
+    A response that does not parse or validate is dropped from the response
+    cache and sent back once with the validation errors for repair.
+    Outcomes are counted as llm_json.<call_site>.{valid, parse_failures,
+    validation_failures, repaired, repair_failures}.
+
+    Args:
+        prompt: Prompt asking for JSON in the schema's shape
+        api_key: Gemini API key
+        schema: Pydantic model the response must match
+        model_name: Gemini model name
+        call_site: Name of the calling generator (for metrics)
+        timeout: Deadline per call in seconds
+
+    Returns:
+        Validated schema instance
+
+    Raises:
+        StructuredOutputError: If the repaired response is still invalid
+        Exception: Errors from the Gemini API are propagated
+    """
+    text = await agenerate_text(
+        prompt, api_key, model_name, call_site=call_site,
+        generation_config=JSON_GENERATION_CONFIG, timeout=timeout
+    )
+    try:
+        result = _validate(text, schema)
+        metrics.increment(f"llm_json.{call_site}.valid")
+        return result
+    except StructuredOutputError as e:
+        metrics.increment(f"llm_json.{call_site}.{e.kind}_failures")
+        logger.warning(f"Invalid JSON from {call_site}, repairing: {str(e)[:300]}")
+        errors = str(e)
+
+    # Do not serve the invalid response from the cache next time
+    llm_cache.invalidate(make_cache_key(model_name, prompt, JSON_GENERATION_CONFIG))
+
+    repair_prompt = REPAIR_PROMPT.format(
+        schema=json.dumps(schema.model_json_schema()),
+        errors=errors,
+        response=text[:MAX_REPAIR_INPUT_CHARS],
+    )
+    repaired = await agenerate_text(
+        repair_prompt, api_key, model_name, call_site=f"{call_site}.repair",
+        generation_config=JSON_GENERATION_CONFIG, timeout=timeout
+    )
+    try:
+        result = _validate(repaired, schema)
+    except StructuredOutputError:
+        metrics.increment(f"llm_json.{call_site}.repair_failures")
+        llm_cache.invalidate(make_cache_key(model_name, repair_prompt, JSON_GENERATION_CONFIG))
+        raise
+    metrics.increment(f"llm_json.{call_site}.repaired")
+    return result
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    """Per call site outcome counts, first-try failure rate and repair success rate."""
+    call_sites: Dict[str, Dict[str, float]] = {}
+    for name, value in metrics.snapshot()["counters"].items():
+        if not name.startswith("llm_json."):
+            continue
+        site, outcome = name[len("llm_json."):].rsplit(".", 1)
+        call_sites.setdefault(site, {})[outcome] = value
+    for site in call_sites.values():
+        failures = site.get("parse_failures", 0) + site.get("validation_failures", 0)
+        attempts = site.get("valid", 0) + failures
+        site["failure_rate"] = failures / attempts if attempts else 0.0
+        site["repair_success_rate"] = site.get("repaired", 0) / failures if failures else 0.0
+    return call_sites
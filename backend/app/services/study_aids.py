@@ -0,0 +1,222 @@
+"""
+Study Aids Stage
+Generates a paper's quiz and suggested questions once, in the background
+after ingest, and stores them with the paper. The chat panel is served from
+storage; regeneration happens only on request or when the paper text changes
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.chatbot_service import chatbot_service
+from app.services.paper_text import get_paper_source_path
+from app.services.storage_manager import storage_manager
+from app.services.metrics import metrics
+from app.services.llm_cache import llm_cache_bypass
+
+logger = logging.getLogger(__name__)
+
+# Generate study aids right after a paper is ingested
+PRECOMPUTE_STUDY_AIDS = os.getenv("PRECOMPUTE_STUDY_AIDS", "true").lower() in ("1", "true", "yes")
+
+# Stage states stored under paper_info["study_aids_status"]
+STUDY_AIDS_PENDING = "pending"
+STUDY_AIDS_READY = "ready"
+STUDY_AIDS_FAILED = "failed"
+
+# In-flight generations keyed by paper ID
+_jobs: Dict[str, "asyncio.Task[Dict]"] = {}
+
+
+# Source digests by path: (mtime_ns, size, digest); a file is hashed again
+# only when its version changes
+_source_hashes: Dict[str, Tuple[int, int, str]] = {}
+_source_hashes_lock = threading.Lock()
+
+
+def _source_version(paper_info: Dict) -> Optional[Tuple[str, int, int]]:
+    path = get_paper_source_path(paper_info)
+    if not path:
+        return None
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def _known_source_hash(version: Tuple[str, int, int]) -> Optional[str]:
+    """Digest of this source version if it was hashed before."""
+    with _source_hashes_lock:
+        entry = _source_hashes.get(version[0])
+    if entry is not None and entry[:2] == version[1:]:
+        return entry[2]
+    return None
+
+
+def paper_source_hash(paper_info: Dict) -> Optional[str]:
+    """Digest of the paper's text source; stored study aids are tied to it."""
+    version = _source_version(paper_info)
+    if version is None:
+        return None
+    known = _known_source_hash(version)
+    if known is not None:
+        return known
+    digest = hashlib.sha256()
+    with open(version[0], "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    source_hash = digest.hexdigest()
+    with _source_hashes_lock:
+        _source_hashes[version[0]] = (version[1], version[2], source_hash)
+    return source_hash
+
+
+async def _current_source_hash(paper_info: Dict) -> Optional[str]:
+    """paper_source_hash, hashing in a worker thread only when the file changed."""
+    version = _source_version(paper_info)
+    if version is None:
+        return None
+    known = _known_source_hash(version)
+    if known is not None:
+        return known
+    return await run_in_threadpool(paper_source_hash, paper_info)
+
+
+async def _run_generation(paper_id: str, fresh: bool) -> Dict:
+    """Generate and store the study aids of one paper."""
+    start = time.perf_counter()
+    paper_info = storage_manager.get_paper(paper_id)
+    if not paper_info:
+        raise ValueError(f"Paper {paper_id} not found")
+    if fresh:
+        # Runs in its own task, so this only affects this generation
+        llm_cache_bypass.set(True)
+    try:
+        source_hash = await _current_source_hash(paper_info)
+        study_aids = await chatbot_service.generate_study_aids(paper_id, paper_info)
+        study_aids["source_hash"] = source_hash
+        study_aids["generated_at"] = time.time()
+        paper_info["study_aids"] = study_aids
+        paper_info["study_aids_status"] = STUDY_AIDS_READY
+        logger.info(f"Generated {len(study_aids['quiz'])} quiz questions for paper {paper_id}")
+        return study_aids
+    except Exception as e:
+        logger.error(f"Error generating study aids for paper {paper_id}: {str(e)}")
+        paper_info["study_aids_status"] = STUDY_AIDS_FAILED
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe("study_aids.generation_seconds", elapsed)
+        paper_info.setdefault("timings", {})["study_aids"] = round(elapsed, 3)
+        # On the event loop, like every other change to the shared paper dicts
+        storage_manager.save_paper(paper_id, paper_info)
+
+
+def start_study_aids(paper_id: str, fresh: bool = False) -> "asyncio.Task[Dict]":
+    """
+    Start (or join) background study aid generation for a paper.
+
+    Must be called from the event loop.
+
+    Args:
+        paper_id: Unique identifier for the paper
+        fresh: Skip cached LLM responses (explicit regeneration)
+
+    Returns:
+        Task resolving to the stored study aids
+    """
+    if paper_id in _jobs:
+        return _jobs[paper_id]
+
+    paper_info = storage_manager.get_paper(paper_id)
+    if paper_info:
+        paper_info["study_aids_status"] = STUDY_AIDS_PENDING
+    task = asyncio.create_task(_run_generation(paper_id, fresh))
+    _jobs[paper_id] = task
+
+    def _done(done: "asyncio.Task[Dict]") -> None:
+        _jobs.pop(paper_id, None)
+        # Failures are stored on the paper and raised to waiting requests
+        if not done.cancelled():
+            done.exception()
+
+    task.add_done_callback(_done)
+    return task
+
+
+def schedule_study_aids(paper_id: str, paper_info: Optional[Dict] = None) -> None:
+    """
+    Queue study aid generation for a newly ingested paper (if enabled).
+
+    Must be called from the event loop.
+
+    Args:
+        paper_id: Unique identifier for the paper
+        paper_info: Unused; lets this be passed as an ingest callback
+    """
+    if not PRECOMPUTE_STUDY_AIDS:
+        return
+    metrics.increment("study_aids.scheduled")
+    start_study_aids(paper_id)
+
+
+async def get_study_aids(paper_id: str, paper_info: Dict, regenerate: bool = False) -> Dict:
+    """
+    Quiz and suggested questions of a paper, from storage when current.
+
+    Stored study aids are generated again only when regenerate is set or
+    the paper's text changed since they were generated. A paper with none
+    stored (older uploads, precompute disabled, a failed attempt) has them
+    generated here.
+
+    Args:
+        paper_id: Unique identifier for the paper
+        paper_info: Dictionary containing paper information
+        regenerate: Generate new study aids even if current ones are stored
+
+    Returns:
+        Dictionary with "quiz" and "suggested_questions"
+
+    Raises:
+        Exception: Errors from generation are propagated
+    """
+    stored = paper_info.get("study_aids")
+    if stored and not regenerate and paper_id not in _jobs:
+        source_hash = await _current_source_hash(paper_info)
+        if stored.get("source_hash") == source_hash:
+            metrics.increment("study_aids.served_from_storage")
+            return stored
+        logger.info(f"Paper {paper_id} changed since its study aids were generated")
+
+    if regenerate and paper_id not in _jobs:
+        metrics.increment("study_aids.regenerated")
+    start = time.perf_counter()
+    # Shield so a cancelled request does not cancel generation for others
+    study_aids = await asyncio.shield(start_study_aids(paper_id, fresh=regenerate))
+    metrics.observe("study_aids.wait_seconds", time.perf_counter() - start)
+    return study_aids
+
+
+# Shown when no suggestions could be generated
+DEFAULT_SUGGESTED_QUESTIONS = [
+    "What is the main contribution of this paper?",
+    "What methodology was used in this research?",
+    "What are the key findings?",
+    "What are the limitations of this study?",
+    "How does this work compare to previous research?"
+]
+
+
+async def get_suggested_questions(paper_id: str, paper_info: Dict, regenerate: bool = False) -> List[str]:
+    """Suggested questions of a paper, or generic ones if generation fails."""
+    try:
+        study_aids = await get_study_aids(paper_id, paper_info, regenerate)
+        return study_aids["suggested_questions"]
+    except Exception as e:
+        logger.error(f"Error getting suggested questions for paper {paper_id}: {str(e)}")
+        return DEFAULT_SUGGESTED_QUESTIONS
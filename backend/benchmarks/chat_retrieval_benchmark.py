@@ -0,0 +1,166 @@
+"""
+Chat Retrieval Benchmark
+Compares retrieval-augmented chat prompts with the old approach of sending
+the first 30,000 characters of the paper with every message: prompt size,
+how much of the paper each can reach, index build and retrieval time and,
+with a Gemini key, end-to-end answer latency
+
+Usage (from the backend directory):
+    python benchmarks/chat_retrieval_benchmark.py CORPUS_DIR [CORPUS_DIR ...]
+    python benchmarks/chat_retrieval_benchmark.py --arxiv 1706.03762 --gemini-key KEY
+
+A corpus directory may hold .txt files (extracted paper text), .tex files
+or one extracted source tree per paper.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.latex_text import convert_latex
+from app.services.latex_processor import find_tex_file, flatten_latex_document
+from app.services.arxiv_scraper import ArxivScraper
+from app.services.section_index import build_section_index_from_text
+from app.services.context_builder import estimate_tokens, plan_context, render_context
+from app.services.paper_retrieval import CHAT_RETRIEVAL_TOKENS, CHAT_RETRIEVAL_TOP_K, PaperIndex, format_passages
+
+# Characters of paper text the chatbot used to send with every message
+LEGACY_CONTEXT_CHARS = 30000
+
+DEFAULT_QUESTIONS = [
+    "What is the main contribution of this paper?",
+    "Which datasets are used in the experiments?",
+    "How is the model trained and what loss function is used?",
+    "What are the main results compared to the baselines?",
+    "What limitations do the authors mention?",
+    "How does the ablation study change the results?",
+]
+
+SYSTEM_PROMPT = "You are an AI assistant helping users understand a research paper.\n\n"
+
+
+def load_corpus(paths, arxiv_ids):
+    """Collect (name, text, section index) triples from directories, files and arXiv IDs."""
+    corpus = []
+    for path in paths:
+        entries = [path] if os.path.isfile(path) else [
+            os.path.join(path, entry) for entry in sorted(os.listdir(path))
+        ]
+        for full_path in entries:
+            name = os.path.basename(full_path)
+            if os.path.isdir(full_path):
+                corpus.append((name, *convert_latex(_read_flattened(full_path))))
+            elif full_path.endswith('.tex'):
+                corpus.append((name, *convert_latex(_read(full_path))))
+            elif full_path.endswith('.txt'):
+                text = _read(full_path)
+                corpus.append((name, text, build_section_index_from_text(text)))
+
+    scraper = ArxivScraper()
+    for arxiv_id in arxiv_ids:
+        source_dir = scraper.download_source(f"https://arxiv.org/abs/{arxiv_id}")
+        corpus.append((arxiv_id, *convert_latex(_read_flattened(source_dir))))
+    return corpus
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return f.read()
+
+
+def _read_flattened(source_dir):
+    flattened = flatten_latex_document(source_dir, find_tex_file(source_dir))
+    return _read(flattened["flattened_path"])
+
+
+def legacy_prompt(text, question):
+    return f"{SYSTEM_PROMPT}Paper Content:\n{text[:LEGACY_CONTEXT_CHARS]}\n\nUser: {question}\nAssistant:"
+
+
+def rag_prompt(overview, index, question):
+    passages = format_passages(index.retrieve(question, CHAT_RETRIEVAL_TOKENS, top_k=CHAT_RETRIEVAL_TOP_K))
+    return (f"{SYSTEM_PROMPT}Paper Content:\n{overview}\n\nPassages:\n{passages}"
+            f"\n\nUser: {question}\nAssistant:")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def answer_latency(prompt, api_key):
+    from app.services.llm_service import agenerate_text
+    start = time.perf_counter()
+    await agenerate_text(prompt, api_key, call_site="benchmark.chat", use_cache=False)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('paths', nargs='*', help='Corpus directories, .txt or .tex files')
+    parser.add_argument('--arxiv', nargs='*', default=[], help='arXiv IDs to download')
+    parser.add_argument('--questions', help='File with one question per line')
+    parser.add_argument('--repeats', type=int, default=20, help='Retrieval runs per question')
+    parser.add_argument('--gemini-key', help='Measure answer latency with live Gemini calls')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.paths, args.arxiv)
+    if not corpus:
+        parser.error('empty corpus: pass a directory, a file or --arxiv IDs')
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        questions = [line.strip() for line in _read(args.questions).splitlines() if line.strip()]
+
+    print(f"{'paper':<28}{'KB':>6}{'chunks':>8}{'index ms':>10}{'p50 ms':>8}{'p95 ms':>8}"
+          f"{'legacy tok':>12}{'rag tok':>9}{'legacy seen':>13}{'rag reach':>11}")
+    legacy_sizes = []
+    rag_sizes = []
+    live = []
+    for name, text, section_index in corpus:
+        start = time.perf_counter()
+        index = PaperIndex(text, section_index)
+        build = time.perf_counter() - start
+        overview = render_context(plan_context(text, section_index, "chat"))
+
+        timings = []
+        for question in questions:
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                index.retrieve(question, CHAT_RETRIEVAL_TOKENS, top_k=CHAT_RETRIEVAL_TOP_K)
+                timings.append(time.perf_counter() - start)
+
+        legacy = [estimate_tokens(legacy_prompt(text, q)) for q in questions]
+        rag = [estimate_tokens(rag_prompt(overview, index, q)) for q in questions]
+        legacy_sizes.extend(legacy)
+        rag_sizes.extend(rag)
+        # The old prompt never saw text past the cut; retrieval can reach any chunk
+        seen = min(1.0, LEGACY_CONTEXT_CHARS / max(1, len(text)))
+        print(f"{name[:27]:<28}{len(text) / 1024:>6.0f}{len(index.chunks):>8}{build * 1000:>10.1f}"
+              f"{percentile(timings, 0.5) * 1000:>8.2f}{percentile(timings, 0.95) * 1000:>8.2f}"
+              f"{statistics.mean(legacy):>12.0f}{statistics.mean(rag):>9.0f}"
+              f"{seen:>12.0%}{1.0:>11.0%}")
+
+        if args.gemini_key:
+            for question in questions[:3]:
+                live.append((
+                    asyncio.run(answer_latency(legacy_prompt(text, question), args.gemini_key)),
+                    asyncio.run(answer_latency(rag_prompt(overview, index, question), args.gemini_key)),
+                ))
+
+    print(f"\nMean prompt: legacy {statistics.mean(legacy_sizes):.0f} tokens, "
+          f"retrieval {statistics.mean(rag_sizes):.0f} tokens "
+          f"({1 - statistics.mean(rag_sizes) / statistics.mean(legacy_sizes):.0%} smaller)")
+    if live:
+        legacy_live = [pair[0] for pair in live]
+        rag_live = [pair[1] for pair in live]
+        print(f"Answer latency over {len(live)} questions: "
+              f"legacy p50 {percentile(legacy_live, 0.5):.2f}s, retrieval p50 {percentile(rag_live, 0.5):.2f}s")
+
+
+if __name__ == '__main__':
+    main()
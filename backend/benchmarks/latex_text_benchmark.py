@@ -0,0 +1,116 @@
+"""
+LaTeX Text Benchmark
+Compares the single-pass LaTeX tokenizer with the old regex stripping on a
+corpus of arXiv sources and checks that conversion time grows linearly
+
+Usage (from the backend directory):
+    python benchmarks/latex_text_benchmark.py CORPUS_DIR [CORPUS_DIR ...]
+    python benchmarks/latex_text_benchmark.py --arxiv 1706.03762 2010.11929
+
+A corpus directory may hold .tex files or one extracted source tree per
+paper; each tree is flattened the same way uploads are.
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.latex_text import convert_latex
+from app.services.latex_processor import find_tex_file, flatten_latex_document
+from app.services.arxiv_scraper import ArxivScraper
+
+
+def legacy_latex_to_plain_text(content):
+    """The regex stripping used before the tokenizer (for comparison)."""
+    content = re.sub(r'%.*?\n', '\n', content)
+    content = re.sub(r'\\[a-zA-Z]+\*?(\[[^\]]*\])?(\{[^}]*\})*', ' ', content)
+    content = re.sub(r'\{[^}]*\}', ' ', content)
+    content = re.sub(r'\s+', ' ', content)
+    return content.strip()
+
+
+def load_corpus(paths, arxiv_ids):
+    """Collect (name, source) pairs from directories, files and arXiv IDs."""
+    corpus = []
+    for path in paths:
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                corpus.append((os.path.basename(path), f.read()))
+            continue
+        for entry in sorted(os.listdir(path)):
+            full_path = os.path.join(path, entry)
+            if os.path.isdir(full_path):
+                corpus.append((entry, _read_flattened(full_path)))
+            elif entry.endswith('.tex'):
+                with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    corpus.append((entry, f.read()))
+
+    scraper = ArxivScraper()
+    for arxiv_id in arxiv_ids:
+        source_dir = scraper.download_source(f"https://arxiv.org/abs/{arxiv_id}")
+        corpus.append((arxiv_id, _read_flattened(source_dir)))
+    return corpus
+
+
+def _read_flattened(source_dir):
+    flattened = flatten_latex_document(source_dir, find_tex_file(source_dir))
+    with open(flattened["flattened_path"], 'r', encoding='utf-8', errors='ignore') as f:
+        return f.read()
+
+
+def best_time(func, source, repeats):
+    """Fastest of several runs, in seconds."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(source)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('paths', nargs='*', help='Corpus directories or .tex files')
+    parser.add_argument('--arxiv', nargs='*', default=[], help='arXiv IDs to download')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.paths, args.arxiv)
+    if not corpus:
+        parser.error('empty corpus: pass a directory, a .tex file or --arxiv IDs')
+
+    print(f"{'paper':<32}{'KB':>8}{'legacy ms':>12}{'tokenizer ms':>14}{'MB/s':>8}{'sections':>10}")
+    total_bytes = 0
+    total_legacy = 0.0
+    total_new = 0.0
+    for name, source in corpus:
+        legacy = best_time(legacy_latex_to_plain_text, source, args.repeats)
+        new = best_time(convert_latex, source, args.repeats)
+        _, index = convert_latex(source)
+        size = len(source.encode('utf-8'))
+        total_bytes += size
+        total_legacy += legacy
+        total_new += new
+        print(f"{name[:31]:<32}{size / 1024:>8.0f}{legacy * 1000:>12.1f}{new * 1000:>14.1f}"
+              f"{size / new / 1e6:>8.1f}{len(index['sections']):>10}")
+
+    print(f"\nTotal {total_bytes / 1024:.0f} KB: legacy {total_legacy * 1000:.1f} ms, "
+          f"tokenizer {total_new * 1000:.1f} ms ({total_bytes / total_new / 1e6:.1f} MB/s)")
+
+    # Linear scaling: time per byte should stay flat as the input grows
+    largest = max(corpus, key=lambda item: len(item[1]))[1]
+    body = re.sub(r'\\(begin|end)\s*\{document\}', '', largest)
+    print("\nScaling (largest document body repeated):")
+    for factor in (1, 2, 4, 8):
+        source = body * factor
+        seconds = best_time(convert_latex, source, max(1, args.repeats // 2))
+        print(f"  x{factor:<3}{len(source) / 1024:>8.0f} KB {seconds * 1000:>10.1f} ms "
+              f"{seconds / len(source) * 1e9:>8.1f} ns/char")
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,27 @@ import toast from 'react-hot-toast';
 
 const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'http://localhost:8000';
 
+// The backend keeps chat history per session: keep the session id it
+// issues and send it back with every chatbot request
+const CHAT_SESSION_KEY = 'chat_session_id';
+const chatClient = axios.create();
+
+chatClient.interceptors.request.use((config) => {
+  const sessionId = localStorage.getItem(CHAT_SESSION_KEY);
+  if (sessionId) {
+    config.headers['X-Session-Id'] = sessionId;
+  }
+  return config;
+});
+
+chatClient.interceptors.response.use((response) => {
+  const sessionId = response.headers['x-session-id'];
+  if (sessionId) {
+    localStorage.setItem(CHAT_SESSION_KEY, sessionId);
+  }
+  return response;
+});
+
 const PaperChatbot = ({ paperId, isOpen, onClose }) => {
   const [messages, setMessages] = useState([]);
   const [inputMessage, setInputMessage] = useState('');
@@ -43,7 +64,7 @@ const PaperChatbot = ({ paperId, isOpen, onClose }) => {
 
   const initializeChatbot = async () => {
     try {
-      const response = await axios.post(`${API_BASE_URL}/api/chatbot/${paperId}/initialize`);
+      const response = await chatClient.post(`${API_BASE_URL}/api/chatbot/${paperId}/initialize`);
       setSuggestedQuestions(response.data.suggested_questions || []);
       
       // Add welcome message
@@ -67,7 +88,7 @@ Feel free to ask me anything about the paper!`,
 
   const refreshSuggestions = async () => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/chatbot/${paperId}/suggested-questions`);
+      const response = await chatClient.get(`${API_BASE_URL}/api/chatbot/${paperId}/suggested-questions`);
       setSuggestedQuestions(response.data.questions || []);
     } catch (error) {
       console.error('Error refreshing suggestions:', error);
@@ -88,7 +109,7 @@ Feel free to ask me anything about the paper!`,
     setIsLoading(true);
 
     try {
-      const response = await axios.post(`${API_BASE_URL}/api/chatbot/${paperId}/chat`, {
+      const response = await chatClient.post(`${API_BASE_URL}/api/chatbot/${paperId}/chat`, {
         message: message
       });
 
@@ -125,7 +146,7 @@ Feel free to ask me anything about the paper!`,
     setIsLoading(true);
     toast.loading('Generating quiz questions...', { id: 'quiz-gen' });
     try {
-      const response = await axios.post(`${API_BASE_URL}/api/chatbot/${paperId}/generate-quiz`, {
+      const response = await chatClient.post(`${API_BASE_URL}/api/chatbot/${paperId}/generate-quiz`, {
         num_questions: 5
       });
 
@@ -173,7 +194,7 @@ Feel free to ask me anything about the paper!`,
 
   const clearConversation = async () => {
     try {
-      await axios.delete(`${API_BASE_URL}/api/chatbot/${paperId}/conversation`);
+      await chatClient.delete(`${API_BASE_URL}/api/chatbot/${paperId}/conversation`);
       setMessages([]);
       initializeChatbot();
       toast.success('Conversation cleared');